@@ -3,10 +3,13 @@ General Knowledge Agent for Microsoft Agent Framework
 Handles non-database queries like web searches, general questions, and conversations
 """
 
-from typing import List, Dict, Any
+import copy
+from typing import List, Dict, Any, AsyncIterator, Tuple
 from agent_framework import ChatMessage, Role, ChatAgent
 from agent_framework.azure import AzureOpenAIChatClient
 import os
+from metrics import event_outcome, record_prompt_usage, result_outcome, timed_stage
+from conversation_history import BoundedHistory
 
 
 class GeneralAgent:
@@ -17,7 +20,9 @@ class GeneralAgent:
         azure_openai_endpoint: str = None,
         azure_openai_api_key: str = None,
         azure_openai_deployment: str = None,
-        model_id: str = "gpt-4o"
+        model_id: str = "gpt-4o",
+        history_limit: int = 50,
+        history_summary_chars: int = 2000
     ):
         """
         Initialize the General Agent.
@@ -27,6 +32,8 @@ class GeneralAgent:
             azure_openai_api_key: Azure OpenAI API key
             azure_openai_deployment: Azure OpenAI deployment name
             model_id: Model ID to use (default: gpt-4o)
+            history_limit: Turns (question and answer) kept in memory (0 keeps all)
+            history_summary_chars: Size of the summary of older turns
         """
         self.name = "GeneralAgent"
         self.description = """General knowledge assistant for non-database queries.
@@ -70,7 +77,8 @@ class GeneralAgent:
             chat_client=self.chat_client
         )
         
-        self.conversation_history: List[ChatMessage] = []
+        # Two messages per turn; older messages are compacted into a summary
+        self.conversation_history = BoundedHistory(history_limit * 2, history_summary_chars)
     
     async def run(self, messages: List[ChatMessage]) -> List[ChatMessage]:
         """
@@ -84,6 +92,7 @@ class GeneralAgent:
         """
         # Run the agent
         response = await self.agent.run(messages)
+        record_prompt_usage('general', getattr(response, 'usage_details', None))
         
         # Store in conversation history
         self.conversation_history.extend(messages)
@@ -91,6 +100,7 @@ class GeneralAgent:
         
         return response.messages
     
+    @timed_stage('general', outcome=result_outcome)
     async def process_query(self, question: str) -> Dict[str, Any]:
         """
         Process a general knowledge query.
@@ -123,10 +133,66 @@ class GeneralAgent:
             'agent': self.name
         }
     
+    @timed_stage('general', outcome=event_outcome)
+    async def process_query_stream(self, question: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Process a general knowledge query, yielding the answer as it is generated.
+        
+        Args:
+            question: User's question
+            
+        Yields:
+            ('token', {'text': ...}) for each piece of the answer, then
+            ('done', result) with the same dictionary process_query returns
+        """
+        user_message = ChatMessage(
+            role=Role.USER,
+            text=question
+        )
+        
+        parts = []
+        async for update in self.agent.run_stream([user_message]):
+            if update.text:
+                parts.append(update.text)
+                yield 'token', {'text': update.text}
+        
+        response_text = "".join(parts).strip()
+        
+        # Store in conversation history
+        self.conversation_history.append(user_message)
+        self.conversation_history.append(ChatMessage(
+            role=Role.ASSISTANT,
+            text=response_text,
+            author_name=self.name
+        ))
+        
+        yield 'done', {
+            'success': True,
+            'question': question,
+            'response': response_text,
+            'agent': self.name
+        }
+    
+    def new_session(self) -> 'GeneralAgent':
+        """
+        Create an agent for a new conversation that shares this agent's
+        chat client and ChatAgent.
+        
+        Returns:
+            GeneralAgent with its own conversation history
+        """
+        session = copy.copy(self)
+        session.conversation_history = self.conversation_history.new_empty()
+        return session
+    
     def clear_history(self):
         """Clear the agent's conversation history."""
-        self.conversation_history = []
+        self.conversation_history.clear()
     
     def get_conversation_history(self) -> List[ChatMessage]:
         """Get the conversation history."""
-        return self.conversation_history
+        return list(self.conversation_history)
+    
+    def get_history_stats(self) -> Dict[str, Any]:
+        """Get the size and compaction counts of the conversation history."""
+        return self.conversation_history.stats()
@@ -0,0 +1,118 @@
+"""
+Local Intent Classifier
+Routes obvious questions in-process, so only ambiguous ones pay for an LLM
+routing round trip
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from schema_index import SchemaIndex
+
+
+# Phrases that suggest an aggregate or lookup over data
+ANALYTIC_CUES = re.compile(
+    r"\b(how many|how much|count|number of|total|sum|average|avg|mean|top \d+|"
+    r"highest|lowest|most|least|list|show me|which|per|by month|by year|between)\b"
+)
+
+# Phrases that clearly fall outside the database
+GENERAL_CUES = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening))\b|"
+    r"\b(weather|news|joke|poem|story|recipe|translate|capital of|president|"
+    r"search the web|write (an?|me)|tell me a|who (are|made) you|what can you do)\b"
+)
+
+
+class IntentClassifier:
+    """
+    Keyword and schema based classifier for the orchestrator's routing decision.
+    
+    Questions naming tables, columns or business synonyms from the loaded schema
+    score towards the SQL Agent; greetings and clearly out-of-domain wording
+    score towards the General Agent. Only a question whose score clears the
+    threshold with no evidence for the other side is decided locally.
+    """
+    
+    def __init__(self, threshold: float = 0.8):
+        """
+        Initialize the classifier.
+        
+        Args:
+            threshold: Minimum score for a local decision; lower scores defer to the LLM router
+        """
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._decisions = {'sql': 0, 'general': 0, 'deferred': 0}
+        self._time_total = 0.0
+    
+    def classify(self, question: str, schema_index: Optional[SchemaIndex]) -> Dict[str, Any]:
+        """
+        Classify a question without calling a model.
+        
+        Args:
+            question: The user's question
+            schema_index: Index of the loaded database schema (None if unavailable)
+        
+        Returns:
+            Dictionary shaped like the LLM router's answer: 'agent' ("sql",
+            "general", or None when the LLM should decide), 'confidence' and
+            'reasoning'
+        """
+        started = time.perf_counter()
+        text = question.lower()
+        
+        sql_score = 0.0
+        reasons = []
+        if schema_index is not None:
+            found = schema_index.mentions(question)
+            if found['tables']:
+                sql_score += 0.6
+                reasons.append(f"mentions tables {', '.join(sorted(found['tables']))}")
+            if found['columns']:
+                sql_score += 0.4
+                reasons.append("mentions column names")
+            if found['synonyms'] - found['tables']:
+                sql_score += 0.4
+                reasons.append("uses business terms mapped to tables")
+        if sql_score and ANALYTIC_CUES.search(text):
+            sql_score += 0.2
+            reasons.append("asks for an aggregate or listing")
+        
+        general_score = 0.0
+        if GENERAL_CUES.search(text):
+            general_score += 0.9
+            reasons.append("out-of-domain wording")
+        
+        sql_score, general_score = round(sql_score, 2), round(general_score, 2)
+        agent = None
+        confidence = max(sql_score, general_score)
+        if sql_score >= self.threshold and not general_score:
+            agent = 'sql'
+        elif general_score >= self.threshold and not sql_score:
+            agent = 'general'
+        
+        with self._lock:
+            self._decisions[agent or 'deferred'] += 1
+            self._time_total += time.perf_counter() - started
+        
+        return {
+            'agent': agent,
+            'confidence': min(confidence, 1.0),
+            'reasoning': "; ".join(reasons) if reasons else "no local evidence"
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return counts of local decisions and the average classification time."""
+        with self._lock:
+            classified = sum(self._decisions.values())
+            return {
+                'threshold': self.threshold,
+                'classified': classified,
+                'local_sql': self._decisions['sql'],
+                'local_general': self._decisions['general'],
+                'deferred_to_llm': self._decisions['deferred'],
+                'avg_classify_us': (self._time_total / classified * 1e6) if classified else 0.0
+            }
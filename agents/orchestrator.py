@@ -4,15 +4,50 @@ Routes queries to specialized agents based on intent
 """
 
 import asyncio
-from typing import Dict, Any, List, Optional
+import copy
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from enum import Enum
 from agent_framework import ChatMessage, Role, ChatAgent
 from agent_framework.azure import AzureOpenAIChatClient
 from .sql_agent_wrapper import SQLAgentWrapper
 from .general_agent import GeneralAgent
+from .intent_classifier import IntentClassifier
+from metrics import ROUTING_DECISIONS, record_prompt_usage, timed_stage
+from conversation_history import BoundedHistory
+from query_cache import normalize_question
 import json
 
 
+# Static router instructions; the system prompt must stay byte-identical
+# across requests for provider-side prompt caching, so per-request context
+# is sent in the user message
+ROUTER_PROMPT = """You are an intelligent query router for a multi-agent system. 
+Your job is to analyze the user's question and determine which specialized agent should handle it.
+
+Available agents:
+1. SQL Agent - Handles database queries about:
+   - Product information, orders, customers
+   - Sales data, inventory, business metrics
+   - Any question requiring database access
+   - Tables in the database: Products, Orders, Customers, Categories, Suppliers, etc.
+
+2. General Agent - Handles everything else:
+   - General knowledge questions
+   - Web searches and current information
+   - Conversations and explanations
+   - Document analysis
+   - Questions not related to the database
+
+Analyze the user's question and respond with ONLY a JSON object in this format:
+{
+    "agent": "sql" or "general",
+    "confidence": 0.0 to 1.0,
+    "reasoning": "brief explanation of your choice"
+}
+"""
+
+
 class AgentType(Enum):
     """Types of agents available in the system."""
     SQL = "sql"
@@ -32,7 +67,14 @@ class MultiAgentOrchestrator:
         general_agent: GeneralAgent,
         azure_openai_endpoint: str = None,
         azure_openai_api_key: str = None,
-        azure_openai_deployment: str = None
+        azure_openai_deployment: str = None,
+        local_routing: bool = True,
+        local_routing_threshold: float = 0.8,
+        speculative_sql: bool = False,
+        history_limit: int = 50,
+        history_summary_chars: int = 2000,
+        history_spill_dir: Optional[str] = None,
+        batch_concurrency: int = 4
     ):
         """
         Initialize the Multi-Agent Orchestrator.
@@ -43,6 +85,15 @@ class MultiAgentOrchestrator:
             azure_openai_endpoint: Azure OpenAI endpoint
             azure_openai_api_key: Azure OpenAI API key
             azure_openai_deployment: Azure OpenAI deployment name
+            local_routing: Decide obvious questions with the in-process classifier
+            local_routing_threshold: Minimum classifier score for a local decision
+            speculative_sql: Start SQL generation while the LLM router is still deciding
+            history_limit: Turns kept in memory per session (0 keeps all)
+            history_summary_chars: Size of the summary of older turns
+            history_spill_dir: Directory where older turns are written so
+                /api/history can still return them (None discards them)
+            batch_concurrency: Questions of a batch processed at the same time,
+                which bounds its concurrent LLM calls and database queries
         """
         self.sql_agent = sql_agent
         self.general_agent = general_agent
@@ -59,11 +110,65 @@ class MultiAgentOrchestrator:
             api_key=azure_openai_api_key
         )
         
-        self.conversation_history: List[Dict[str, Any]] = []
+        # In-process classifier that settles obvious questions before the LLM
+        # router is asked; shared by every session created from this orchestrator
+        self.intent_classifier = IntentClassifier(local_routing_threshold) if local_routing else None
+        self.routing_counts = {'local': 0, 'llm': 0, 'llm_errors': 0}
         
-    async def _route_query(self, user_question: str, conversation_context: List[ChatMessage]) -> AgentType:
+        # Speculative SQL generation, overlapped with LLM routing
+        self.speculative_sql = speculative_sql
+        self.speculation_counts = {'started': 0, 'used': 0, 'wasted': 0, 'wasted_completed': 0}
+        
+        # Recent turns in memory; older ones compacted and optionally spilled to disk
+        self.conversation_history = BoundedHistory(history_limit, history_summary_chars, history_spill_dir)
+        
+        # Router system prompt for the current schema: (schema summary, prompt)
+        self._router_prompt = None
+        
+        # Upper bound on the questions of one batch in flight at once
+        self.batch_concurrency = max(1, batch_concurrency)
+        
+    def _route_locally(self, user_question: str) -> Optional[AgentType]:
+        """
+        Route the query with the local classifier.
+        
+        Args:
+            user_question: The user's question
+            
+        Returns:
+            AgentType if the classifier is confident, None if the LLM router should decide
+        """
+        if self.intent_classifier is None:
+            return None
+        
+        decision = self.intent_classifier.classify(user_question, self.sql_agent.get_schema_index())
+        if decision['agent'] is None:
+            return None
+        
+        self.routing_counts['local'] += 1
+        ROUTING_DECISIONS.inc(router='local', agent=decision['agent'])
+        print(f"⚡ Local Router Decision: {decision['agent']} (confidence: {decision['confidence']:.2f})")
+        print(f"   Reasoning: {decision['reasoning']}")
+        return AgentType(decision['agent'])
+    
+    def _router_system_prompt(self) -> str:
         """
-        Determine which agent should handle the query.
+        Router system prompt: the static instructions followed by the table list.
+        
+        Rebuilt only when the schema changes, so the prompt is byte-identical
+        across requests and the provider can cache it.
+        """
+        schema_summary = self.sql_agent.get_schema_summary()
+        cached = self._router_prompt
+        if cached is None or cached[0] != schema_summary:
+            cached = (schema_summary, f"{ROUTER_PROMPT}\nDatabase schema information:\n{schema_summary}\n")
+            self._router_prompt = cached
+        return cached[1]
+    
+    @timed_stage('route_llm')
+    async def _route_with_llm(self, user_question: str, conversation_context: List[ChatMessage]) -> AgentType:
+        """
+        Ask the planner model which agent should handle the query.
         
         Args:
             user_question: The user's question
@@ -72,6 +177,8 @@ class MultiAgentOrchestrator:
         Returns:
             AgentType indicating which agent should handle the query
         """
+        self.routing_counts['llm'] += 1
+        
         # Build context from recent conversation
         recent_context = ""
         if conversation_context:
@@ -81,49 +188,25 @@ class MultiAgentOrchestrator:
                 for msg in recent_msgs
             ])
         
-        system_prompt = f"""You are an intelligent query router for a multi-agent system. 
-Your job is to analyze the user's question and determine which specialized agent should handle it.
-
-Available agents:
-1. SQL Agent - Handles database queries about:
-   - Product information, orders, customers
-   - Sales data, inventory, business metrics
-   - Any question requiring database access
-   - Tables in the database: Products, Orders, Customers, Categories, Suppliers, etc.
-
-2. General Agent - Handles everything else:
-   - General knowledge questions
-   - Web searches and current information
-   - Conversations and explanations
-   - Document analysis
-   - Questions not related to the database
-
-Analyze the user's question and respond with ONLY a JSON object in this format:
-{{
-    "agent": "sql" or "general",
-    "confidence": 0.0 to 1.0,
-    "reasoning": "brief explanation of your choice"
-}}
-
-Recent conversation context:
+        # The system prompt is static; the per-request context goes last
+        user_prompt = f"""Recent conversation context:
 {recent_context if recent_context else "No previous context"}
 
-Database schema information:
-{self.sql_agent.get_schema_info()[:500]}...
-"""
-        
-        user_prompt = f"User question: {user_question}\n\nWhich agent should handle this?"
+User question: {user_question}
+
+Which agent should handle this?"""
         
         try:
             # Use the planner to route
             response = await self.planner_client.get_response(
                 messages=[
-                    ChatMessage(role=Role.SYSTEM, text=system_prompt),
+                    ChatMessage(role=Role.SYSTEM, text=self._router_system_prompt()),
                     ChatMessage(role=Role.USER, text=user_prompt)
                 ],
                 temperature=0.1,
                 json_output=True
             )
+            record_prompt_usage('route', getattr(response, 'usage_details', None))
             
             # Parse response - get_response returns a ChatResponse object
             # Use the text attribute which contains the response content
@@ -139,16 +222,89 @@ Database schema information:
             print(f"   Reasoning: {result.get('reasoning', 'N/A')}")
             
             if agent_choice == "sql":
-                return AgentType.SQL
-            elif agent_choice == "general":
-                return AgentType.GENERAL
+                agent_type = AgentType.SQL
             else:
-                return AgentType.GENERAL  # Default to general
+                agent_type = AgentType.GENERAL  # Default to general
+            ROUTING_DECISIONS.inc(router='llm', agent=agent_type.value)
+            return agent_type
                 
         except Exception as e:
+            self.routing_counts['llm_errors'] += 1
+            ROUTING_DECISIONS.inc(router='llm_error', agent=AgentType.GENERAL.value)
             print(f"⚠️  Routing error: {e}, defaulting to General Agent")
             return AgentType.GENERAL
     
+    @timed_stage('route')
+    async def _route_and_speculate(
+        self,
+        user_question: str,
+        conversation_context: List[ChatMessage]
+    ) -> Tuple[AgentType, Optional[asyncio.Task]]:
+        """
+        Route the query, generating SQL at the same time when speculation is on.
+        
+        Speculation only starts when the question has to go to the LLM router.
+        If the router then picks the General Agent, the SQL generation is
+        cancelled (or discarded, if it already finished) and counted as wasted.
+        
+        Args:
+            user_question: The user's question
+            conversation_context: Previous conversation messages
+            
+        Returns:
+            (agent type, task resolving to the SQL generation or None)
+        """
+        agent_type = self._route_locally(user_question)
+        if agent_type is not None:
+            return agent_type, None
+        if not self.speculative_sql:
+            return await self._route_with_llm(user_question, conversation_context), None
+        
+        sql_generation = self.sql_agent.start_sql_generation(user_question)
+        self.speculation_counts['started'] += 1
+        try:
+            agent_type = await self._route_with_llm(user_question, conversation_context)
+        except BaseException:
+            self._discard_speculation(sql_generation)
+            raise
+        
+        if agent_type == AgentType.SQL:
+            self.speculation_counts['used'] += 1
+            return agent_type, sql_generation
+        
+        print(f"🗑️  Discarding speculative SQL generation")
+        self._discard_speculation(sql_generation)
+        return agent_type, None
+    
+    def _discard_speculation(self, sql_generation: asyncio.Task):
+        """Cancel a speculative SQL generation that will not be used."""
+        self.speculation_counts['wasted'] += 1
+        if sql_generation.done():
+            # The model call already finished and was paid for
+            self.speculation_counts['wasted_completed'] += 1
+        else:
+            sql_generation.cancel()
+    
+    async def _record_turn(self, user_question: str, agent_used: str, result: Dict[str, Any]):
+        """
+        Add an answered question to the conversation history.
+        
+        An in-process history is appended to directly (spill files are already
+        written in the background). A history kept in a session store does
+        network or disk I/O, so its append runs on a worker thread instead of
+        blocking the event loop.
+        """
+        turn = {
+            'question': user_question,
+            'agent': agent_used,
+            'response': result.get('response', ''),
+            'success': result.get('success', True)
+        }
+        if isinstance(self.conversation_history, BoundedHistory):
+            self.conversation_history.append(turn)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.conversation_history.append, turn)
+    
     async def query(self, user_question: str, conversation_context: Optional[List[ChatMessage]] = None) -> Dict[str, Any]:
         """
         Process a user query using the appropriate agent.
@@ -164,13 +320,13 @@ Database schema information:
             conversation_context = []
         
         # Step 1: Route to appropriate agent
-        agent_type = await self._route_query(user_question, conversation_context)
+        agent_type, sql_generation = await self._route_and_speculate(user_question, conversation_context)
         
         # Step 2: Process with selected agent
         try:
             if agent_type == AgentType.SQL:
                 print(f"📊 Routing to SQL Agent")
-                result = await self.sql_agent.process_query(user_question)
+                result = await self.sql_agent.process_query(user_question, sql_generation=sql_generation)
                 result['agent_used'] = 'SQL Agent'
                 result['agent_type'] = 'sql'
                 
@@ -181,16 +337,13 @@ Database schema information:
                 result['agent_type'] = 'general'
             
             # Add to conversation history
-            self.conversation_history.append({
-                'question': user_question,
-                'agent': result['agent_used'],
-                'response': result.get('response', ''),
-                'success': result.get('success', True)
-            })
+            await self._record_turn(user_question, result['agent_used'], result)
             
             return result
             
         except Exception as e:
+            if sql_generation is not None and not sql_generation.done():
+                sql_generation.cancel()
             error_msg = f"Error processing query: {str(e)}"
             print(f"❌ {error_msg}")
             return {
@@ -202,6 +355,72 @@ Database schema information:
                 'agent_type': 'error'
             }
     
+    async def query_stream(
+        self,
+        user_question: str,
+        conversation_context: Optional[List[ChatMessage]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Process a user query, yielding each stage of the pipeline as it completes.
+        
+        Args:
+            user_question: The user's question
+            conversation_context: Optional previous conversation messages
+            
+        Yields:
+            (event, data) tuples: 'route' with the routing decision, then the
+            selected agent's events ('sql', 'rows', 'token'), and finally
+            'done' with the same dictionary query() returns
+        """
+        if conversation_context is None:
+            conversation_context = []
+        
+        # Step 1: Route to appropriate agent
+        agent_type, sql_generation = await self._route_and_speculate(user_question, conversation_context)
+        try:
+            if agent_type == AgentType.SQL:
+                print(f"📊 Routing to SQL Agent (streaming)")
+                agent_used = 'SQL Agent'
+                events = self.sql_agent.process_query_stream(user_question, sql_generation=sql_generation)
+            else:  # AgentType.GENERAL
+                print(f"🌐 Routing to General Agent (streaming)")
+                agent_used = 'General Agent'
+                events = self.general_agent.process_query_stream(user_question)
+            
+            # The client may disconnect at any yield, including this one
+            yield 'route', {'agent_used': agent_used, 'agent_type': agent_type.value}
+            
+            # Step 2: Relay the selected agent's events
+            async for event, data in events:
+                if event != 'done':
+                    yield event, data
+                    continue
+                
+                result = dict(data)
+                result['agent_used'] = agent_used
+                result['agent_type'] = agent_type.value
+                
+                # Add to conversation history
+                await self._record_turn(user_question, agent_used, result)
+                
+                yield 'done', result
+                
+        except Exception as e:
+            error_msg = f"Error processing query: {str(e)}"
+            print(f"❌ {error_msg}")
+            yield 'done', {
+                'success': False,
+                'question': user_question,
+                'response': error_msg,
+                'error': str(e),
+                'agent_used': 'None (Error)',
+                'agent_type': 'error'
+            }
+        finally:
+            # Cancel the speculative SQL if it was never awaited
+            if sql_generation is not None and not sql_generation.done():
+                sql_generation.cancel()
+    
     async def query_with_agent_choice(
         self, 
         user_question: str, 
@@ -231,12 +450,7 @@ Database schema information:
                 result['agent_used'] = 'General Agent (Forced)'
                 result['agent_type'] = 'general'
             
-            self.conversation_history.append({
-                'question': user_question,
-                'agent': result['agent_used'],
-                'response': result.get('response', ''),
-                'success': result.get('success', True)
-            })
+            await self._record_turn(user_question, result['agent_used'], result)
             
             return result
             
@@ -252,16 +466,195 @@ Database schema information:
                 'agent_type': 'error'
             }
     
+    async def query_batch_as_completed(
+        self,
+        questions: List[str],
+        max_concurrency: Optional[int] = None,
+        agent_type: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process several questions concurrently, yielding each result as it completes.
+        
+        Questions that normalize to the same text are processed once and the
+        result is repeated for each copy. At most max_concurrency questions
+        (capped at batch_concurrency) are processed at a time. Closing the
+        generator cancels the questions still running.
+        
+        Args:
+            questions: The user's questions
+            max_concurrency: Questions processed at the same time (defaults to batch_concurrency)
+            agent_type: Optional 'sql' or 'general' to bypass routing for every question
+            
+        Yields:
+            Result dictionaries as returned by query(), with 'index' (position
+            in questions), 'queued_ms' (wait for a free slot), 'elapsed_ms'
+            (processing time) and, for repeated questions, 'duplicate_of'
+            (index of the copy that was processed)
+        """
+        limit = min(max_concurrency or self.batch_concurrency, self.batch_concurrency)
+        semaphore = asyncio.Semaphore(max(1, limit))
+        
+        # Index of the first copy of each question -> indexes of its repeats
+        repeats = {}
+        first_copy = {}
+        for index, question in enumerate(questions):
+            key = normalize_question(question)
+            if key in first_copy:
+                repeats[first_copy[key]].append(index)
+            else:
+                first_copy[key] = index
+                repeats[index] = []
+        
+        async def process(index: int) -> Dict[str, Any]:
+            submitted = time.perf_counter()
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    if agent_type:
+                        result = await self.query_with_agent_choice(questions[index], agent_type)
+                    else:
+                        result = await self.query(questions[index])
+                except Exception as e:
+                    print(f"❌ Error processing batch question {index}: {e}")
+                    result = {
+                        'success': False,
+                        'question': questions[index],
+                        'response': f"Error processing query: {str(e)}",
+                        'error': str(e),
+                        'agent_used': 'None (Error)',
+                        'agent_type': 'error'
+                    }
+            result['index'] = index
+            result['queued_ms'] = (started - submitted) * 1000
+            result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+            return result
+        
+        tasks = [asyncio.create_task(process(index)) for index in repeats]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield result
+                for index in repeats[result['index']]:
+                    yield {**result, 'index': index, 'question': questions[index], 'duplicate_of': result['index']}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def query_batch(
+        self,
+        questions: List[str],
+        max_concurrency: Optional[int] = None,
+        agent_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Process several questions concurrently and return the results in order.
+        
+        Args:
+            questions: The user's questions
+            max_concurrency: Questions processed at the same time (defaults to batch_concurrency)
+            agent_type: Optional 'sql' or 'general' to bypass routing for every question
+            
+        Returns:
+            One result per question, in the order given; see query_batch_as_completed()
+        """
+        results = [None] * len(questions)
+        async for result in self.query_batch_as_completed(questions, max_concurrency, agent_type):
+            results[result['index']] = result
+        return results
+    
+    def new_session(self, history=None) -> 'MultiAgentOrchestrator':
+        """
+        Create an orchestrator for a new conversation.
+        
+        The new orchestrator shares the planner client, the routing
+        classifier and statistics, and the specialist agents' clients,
+        connections and schema with this one; only the conversation state
+        is per session, so creating one is cheap.
+        
+        Args:
+            history: Conversation history for the session, e.g. a
+                session_store.StoredHistory shared between worker processes
+                (defaults to an empty in-process history with this one's limits)
+        
+        Returns:
+            MultiAgentOrchestrator with its own conversation history
+        """
+        session = copy.copy(self)
+        session.sql_agent = self.sql_agent.new_session()
+        session.general_agent = self.general_agent.new_session()
+        session.conversation_history = history if history is not None else self.conversation_history.new_empty()
+        return session
+    
     def get_conversation_history(self) -> List[Dict[str, Any]]:
-        """Get the conversation history."""
-        return self.conversation_history
+        """Get the conversation history, including spilled older turns."""
+        return self.conversation_history.all()
+    
+    def get_history_summary(self) -> str:
+        """Get the compacted summary of turns no longer held in memory."""
+        return self.conversation_history.summary
+    
+    def get_session_memory(self) -> Dict[str, Any]:
+        """
+        Get the memory held by this session's conversation state.
+        
+        Returns:
+            Dictionary with the history statistics of the orchestrator and
+            both agents, and their approximate total size in bytes
+        """
+        histories = {
+            'orchestrator': self.conversation_history.stats(),
+            'sql_agent': self.sql_agent.get_history_stats(),
+            'general_agent': self.general_agent.get_history_stats()
+        }
+        return {
+            **histories,
+            'total_bytes': sum(stats['bytes'] for stats in histories.values())
+        }
     
     def clear_history(self):
         """Clear conversation history for all agents."""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self.sql_agent.clear_history()
+        self.general_agent.clear_history()
+    
+    def close_session(self):
+        """
+        Release a session created by new_session().
+        
+        Drops the session's histories and spill files; a history kept in a
+        session store is left there for other workers. The clients,
+        connection pool and schema are shared with the other sessions and
+        stay open; they belong to the orchestrator the session was created from.
+        """
+        self.conversation_history.close()
         self.sql_agent.clear_history()
         self.general_agent.clear_history()
     
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """
+        Get routing statistics across all sessions.
+        
+        Returns:
+            Dictionary with the number of locally and LLM-routed questions,
+            the local share, the classifier's own statistics, and how many
+            speculative SQL generations were used or wasted
+        """
+        routed = self.routing_counts['local'] + self.routing_counts['llm']
+        return {
+            'local_routing': self.intent_classifier is not None,
+            'routed': routed,
+            'local_routed': self.routing_counts['local'],
+            'llm_routed': self.routing_counts['llm'],
+            'llm_errors': self.routing_counts['llm_errors'],
+            'local_share': (self.routing_counts['local'] / routed) if routed else 0.0,
+            'classifier': self.intent_classifier.stats() if self.intent_classifier else None,
+            'speculation': {
+                'enabled': self.speculative_sql,
+                **self.speculation_counts
+            }
+        }
+    
     def get_available_agents(self) -> Dict[str, str]:
         """Get information about available agents."""
         return {
@@ -283,10 +676,15 @@ def create_orchestrator_from_env(sql_agent: SQLAgentWrapper) -> MultiAgentOrches
     import os
     
     # Create general agent
+    history_limit = int(os.getenv('HISTORY_MAX_TURNS', '50'))
+    history_summary_chars = int(os.getenv('HISTORY_SUMMARY_CHARS', '2000'))
+    
     general_agent = GeneralAgent(
         azure_openai_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT'),
         azure_openai_api_key=os.getenv('AZURE_OPENAI_API_KEY'),
-        azure_openai_deployment=os.getenv('AZURE_OPENAI_DEPLOYMENT')
+        azure_openai_deployment=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
+        history_limit=history_limit,
+        history_summary_chars=history_summary_chars
     )
     
     # Create orchestrator
@@ -295,7 +693,14 @@ def create_orchestrator_from_env(sql_agent: SQLAgentWrapper) -> MultiAgentOrches
         general_agent=general_agent,
         azure_openai_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT'),
         azure_openai_api_key=os.getenv('AZURE_OPENAI_API_KEY'),
-        azure_openai_deployment=os.getenv('AZURE_OPENAI_DEPLOYMENT')
+        azure_openai_deployment=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
+        local_routing=os.getenv('ROUTER_LOCAL_CLASSIFIER', 'true').lower() == 'true',
+        local_routing_threshold=float(os.getenv('ROUTER_LOCAL_THRESHOLD', '0.8')),
+        speculative_sql=os.getenv('ORCHESTRATOR_SPECULATIVE_SQL', 'false').lower() == 'true',
+        history_limit=history_limit,
+        history_summary_chars=history_summary_chars,
+        history_spill_dir=os.getenv('HISTORY_SPILL_DIR') or None,
+        batch_concurrency=int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
     )
     
     return orchestrator
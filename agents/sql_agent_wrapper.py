@@ -4,9 +4,10 @@ Wraps the existing SQLAgent as a specialized agent for database queries
 """
 
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, Awaitable, List, Optional, Tuple
 from agent_framework import ChatMessage, Role
 from sql_agent import SQLAgent
+from schema_index import SchemaIndex
 
 
 class SQLAgentWrapper:
@@ -29,24 +30,69 @@ class SQLAgentWrapper:
         - Any question that requires querying a database
         """
     
-    async def process_query(self, question: str) -> Dict[str, Any]:
+    def start_sql_generation(self, question: str) -> asyncio.Task:
+        """
+        Start generating SQL for a question in the background.
+        
+        The generation is speculative: pattern statistics and the SQL cache are
+        only updated when it is passed to process_query() or
+        process_query_stream(), not when it is cancelled or discarded.
+        
+        Args:
+            question: Natural language question about the database
+            
+        Returns:
+            Task resolving to the SQL generation; pass it to process_query()
+            or process_query_stream(), or cancel it if it is not needed
+        """
+        return asyncio.create_task(self.sql_agent._agenerate_sql_query(question, speculative=True))
+    
+    async def _use_sql_generation(self, question: str, sql_generation: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Await a generation from start_sql_generation() and record it as used."""
+        generation = await sql_generation
+        self.sql_agent.record_sql_generation(question, generation)
+        return generation
+    
+    async def process_query(
+        self,
+        question: str,
+        sql_generation: Optional[Awaitable[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
         """
         Process a database query asynchronously.
         
         Args:
             question: Natural language question about the database
+            sql_generation: Already started SQL generation (see start_sql_generation)
             
         Returns:
             Dictionary containing query results and response
         """
-        # Run synchronous SQLAgent.query in thread pool
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None, 
-            self.sql_agent.query, 
-            question
-        )
-        return result
+        # Native async pipeline: async OpenAI calls, DB work on the agent's own executor
+        if sql_generation is not None:
+            sql_generation = self._use_sql_generation(question, sql_generation)
+        return await self.sql_agent.aquery(question, sql_generation=sql_generation)
+    
+    async def process_query_stream(
+        self,
+        question: str,
+        sql_generation: Optional[Awaitable[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Process a database query, yielding each pipeline stage as it completes.
+        
+        Args:
+            question: Natural language question about the database
+            sql_generation: Already started SQL generation (see start_sql_generation)
+            
+        Yields:
+            (event, data) tuples from SQLAgent.aquery_stream ('sql', 'rows',
+            'token' and finally 'done' with the full result)
+        """
+        if sql_generation is not None:
+            sql_generation = self._use_sql_generation(question, sql_generation)
+        async for event in self.sql_agent.aquery_stream(question, sql_generation=sql_generation):
+            yield event
     
     async def run(self, messages: List[ChatMessage]) -> List[ChatMessage]:
         """
@@ -77,8 +123,10 @@ class SQLAgentWrapper:
             response_text = f"{result['response']}\n\n"
             response_text += f"**SQL Query Executed:**\n```sql\n{result['sql']}\n```\n\n"
             
-            if result['results']:
+            if result['row_count']:
                 response_text += f"**Results:** {result['row_count']} row(s) returned"
+                if result.get('truncated'):
+                    response_text += " (truncated)"
         else:
             response_text = f"Error processing database query: {result.get('error', 'Unknown error')}"
         
@@ -88,10 +136,32 @@ class SQLAgentWrapper:
             author_name=self.name
         )]
     
+    def new_session(self) -> 'SQLAgentWrapper':
+        """
+        Create a wrapper for a new conversation that shares the underlying
+        SQL engine (clients, connections and schema) with this one.
+        
+        Returns:
+            SQLAgentWrapper with its own conversation history
+        """
+        return SQLAgentWrapper(self.sql_agent.new_session())
+    
     def get_schema_info(self) -> str:
         """Get database schema information."""
         return self.sql_agent.schema_info
     
+    def get_schema_summary(self) -> str:
+        """Get a compact list of the database tables."""
+        return self.sql_agent.get_schema_summary()
+    
+    def get_schema_index(self) -> SchemaIndex:
+        """Get the index of the loaded database schema."""
+        return self.sql_agent.schema_index
+    
     def clear_history(self):
         """Clear the agent's conversation history."""
         self.sql_agent.clear_history()
+    
+    def get_history_stats(self) -> Dict[str, Any]:
+        """Get the size and compaction counts of the agent's conversation history."""
+        return self.sql_agent.get_history_stats()
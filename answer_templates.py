@@ -0,0 +1,98 @@
+"""
+Deterministic answers for simple query results.
+Scalars, single rows, empty results and short lists can be phrased without a
+second round trip to Azure OpenAI; anything more complex returns None so the
+caller falls back to the LLM summary.
+"""
+
+import datetime
+import decimal
+import math
+from typing import Any, Dict, List, Optional
+
+from schema_index import split_identifier
+
+
+def humanize(column: str) -> str:
+    """Turn a column name like 'UnitPrice' or 'total_sales' into 'unit price'."""
+    return " ".join(split_identifier(column))
+
+
+def format_value(value: Any) -> str:
+    """Format a database value for a sentence."""
+    if value is None:
+        return "no value"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, (float, decimal.Decimal)):
+        if not math.isfinite(value):
+            return str(value)
+        # Decimals with a scale (money, numeric(p,s)) keep two places, like currency
+        has_scale = isinstance(value, decimal.Decimal) and value.as_tuple().exponent < 0
+        if value == int(value) and not has_scale:
+            return f"{int(value):,}"
+        return f"{value:,.2f}"
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=' ', timespec='minutes')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def _describe_row(columns: List[str], row: Any) -> str:
+    """Render a row as 'Label: value' pairs."""
+    return ", ".join(
+        f"{(humanize(column) or 'value').capitalize()}: {format_value(value)}"
+        for column, value in zip(columns, row)
+    )
+
+
+def template_answer(
+    query_results: Dict[str, Any],
+    max_list_rows: int = 10,
+    max_columns: int = 6
+) -> Optional[str]:
+    """
+    Phrase a simple query result without calling the LLM.
+    
+    Handles four shapes: no rows, a single value (counts, sums, averages),
+    a single row, and a short list of narrow rows (e.g. a top-N query).
+    
+    Args:
+        query_results: Successful result from SQLAgent._execute_query
+        max_list_rows: Longest list answered from the template
+        max_columns: Widest row answered from the template
+    
+    Returns:
+        The answer text, or None when the result needs an LLM summary
+    """
+    columns = query_results['columns'] or []
+    rows = query_results['rows'] or []
+    if query_results['truncated'] or len(columns) > max_columns:
+        return None
+    
+    if not rows:
+        return "I didn't find any records matching your question."
+    
+    if len(rows) == 1 and len(columns) == 1:
+        label = humanize(columns[0])
+        value = format_value(rows[0][0])
+        return f"The {label} is {value}." if label else f"The answer is {value}."
+    
+    if len(rows) == 1:
+        return f"I found one matching record: {_describe_row(columns, rows[0])}."
+    
+    if len(rows) <= max_list_rows and len(columns) <= 3:
+        lines = [f"Here are the {len(rows)} results:"]
+        for i, row in enumerate(rows, 1):
+            # Lead with the first column (usually the name) and label the rest
+            head = format_value(row[0])
+            rest = _describe_row(columns[1:], row[1:])
+            lines.append(f"{i}. {head} ({rest})" if rest else f"{i}. {head}")
+        return "\n".join(lines)
+    
+    return None
@@ -4,14 +4,21 @@ Provides a chat interface using Microsoft Agent Framework for intelligent routin
 Routes queries to SQL Agent for database queries or General Agent for other questions.
 """
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, g, render_template, request, jsonify, session
 from dotenv import load_dotenv
 import os
+import json
 import secrets
 import asyncio
+import sys
+import threading
 from sql_agent import create_agent_from_env
 from agents.sql_agent_wrapper import SQLAgentWrapper
 from agents.orchestrator import create_orchestrator_from_env
+from result_set import iter_dicts, to_columnar
+from metrics import REGISTRY, prompt_cache_stats
+from session_registry import SessionRegistry
+from session_store import create_session_store
 from datetime import datetime
 
 # Load environment variables
@@ -20,8 +27,84 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', secrets.token_hex(32))
 
-# Store orchestrator instances per session
-orchestrators = {}
+# Largest number of questions accepted by /api/query/batch
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '100'))
+
+# Conversation state shared by all worker processes (None keeps it in each worker)
+session_store = create_session_store(
+    os.getenv('SESSION_STORE_URL'),
+    ttl=float(os.getenv('SESSION_STORE_TTL', '86400')) or None
+)
+if session_store is not None and not os.getenv('FLASK_SECRET_KEY'):
+    print("⚠️  SESSION_STORE_URL is set without FLASK_SECRET_KEY; "
+          "each worker will generate its own key and reject the others' session cookies")
+
+
+def close_session(session_id, orchestrator, reason):
+    """Release an evicted session's conversation state."""
+    orchestrator.close_session()
+
+
+# Per-session orchestrators, dropped when idle or when the session / memory cap is hit
+orchestrators = SessionRegistry(
+    max_sessions=int(os.getenv('SESSION_MAX', '1000')) or None,
+    idle_ttl=float(os.getenv('SESSION_IDLE_TTL', '1800')) or None,
+    max_bytes=int(float(os.getenv('SESSION_MAX_MB', '0')) * 1024 * 1024) or None,
+    sizeof=lambda orchestrator: orchestrator.get_session_memory()['total_bytes'],
+    on_evict=close_session
+)
+
+# Process-wide orchestrator holding the clients, connection pool and schema.
+# Per-session orchestrators are cheap copies of it with their own history.
+shared_orchestrator = None
+shared_orchestrator_lock = threading.Lock()
+
+
+# One long-lived event loop per worker process, running in a background thread.
+# Requests submit coroutines to it, so the async OpenAI clients keep their
+# keep-alive connections to Azure OpenAI warm across requests.
+event_loop = None
+event_loop_pid = None
+event_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Get or start this worker process's background event loop."""
+    global event_loop, event_loop_pid
+    
+    # A forked worker (e.g. gunicorn with preload) must not reuse the parent's loop
+    if event_loop is None or event_loop_pid != os.getpid():
+        with event_loop_lock:
+            if event_loop is None or event_loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='async-event-loop', daemon=True)
+                thread.start()
+                event_loop = loop
+                event_loop_pid = os.getpid()
+    
+    return event_loop
+
+
+def run_async(coro):
+    """Run a coroutine on the worker's event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def get_shared_orchestrator():
+    """Get or create the process-wide orchestrator shared by all sessions."""
+    global shared_orchestrator
+    
+    if shared_orchestrator is None:
+        with shared_orchestrator_lock:
+            if shared_orchestrator is None:
+                # Create SQL agent (loads the schema and AAD token once per process)
+                sql_agent = create_agent_from_env()
+                sql_agent_wrapper = SQLAgentWrapper(sql_agent)
+                
+                # Create orchestrator with both SQL and General agents
+                shared_orchestrator = create_orchestrator_from_env(sql_agent_wrapper)
+    
+    return shared_orchestrator
 
 
 def get_orchestrator_for_session():
@@ -32,19 +115,32 @@ def get_orchestrator_for_session():
         session_id = secrets.token_hex(16)
         session['session_id'] = session_id
     
-    if session_id not in orchestrators:
-        try:
-            # Create SQL agent
-            sql_agent = create_agent_from_env()
-            sql_agent_wrapper = SQLAgentWrapper(sql_agent)
-            
-            # Create orchestrator with both SQL and General agents
-            orchestrators[session_id] = create_orchestrator_from_env(sql_agent_wrapper)
-        except Exception as e:
-            print(f"Error creating orchestrator: {e}")
-            return None
+    def create_session():
+        shared = get_shared_orchestrator()
+        if session_store is None:
+            return shared.new_session()
+        limits = shared.conversation_history
+        return shared.new_session(session_store.history(session_id, limits.max_items, limits.summary_chars))
     
-    return orchestrators[session_id]
+    try:
+        return orchestrators.get_or_create(session_id, create_session)
+    except Exception as e:
+        print(f"Error creating orchestrator: {e}")
+        return None
+
+
+def mark_session_changed():
+    """Have the session's conversation state re-measured once this request is handled."""
+    g.session_changed = True
+
+
+@app.after_request
+def measure_session(response):
+    """Re-measure the session if the request changed its conversation state."""
+    session_id = session.get('session_id')
+    if session_id and g.get('session_changed'):
+        orchestrators.touch(session_id)
+    return response
 
 
 @app.route('/')
@@ -53,6 +149,50 @@ def index():
     return render_template('index.html')
 
 
+def format_query_response(result, user_question, result_format='rows', include_results=True):
+    """Build the JSON response body for a processed query."""
+    response = {
+        'success': result.get('success', False),
+        'question': result.get('question', user_question),
+        'response': result.get('response', ''),
+        'agent_used': result.get('agent_used', 'Unknown'),
+        'agent_type': result.get('agent_type', 'unknown'),
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Add SQL-specific fields if available
+    if 'sql' in result:
+        response['sql'] = result['sql']
+        response['explanation'] = result.get('explanation', '')
+        rows = result.get('rows')
+        if include_results and result_format == 'columnar':
+            response['result_set'] = (
+                to_columnar(result['columns'], result['types'], rows) if rows is not None else None
+            )
+        elif include_results:
+            response['results'] = list(iter_dicts(result['columns'], rows)) if rows is not None else None
+        response['row_count'] = result.get('row_count', 0)
+        response['truncated'] = result.get('truncated', False)
+        response['sql_cached'] = result.get('sql_cached', False)
+        response['result_cached'] = result.get('result_cached', False)
+        response['engine'] = result.get('engine')
+        response['prompt_tokens_saved'] = result.get('prompt_tokens_saved', 0)
+        response['answer_source'] = result.get('answer_source')
+        response['sql_pattern'] = result.get('sql_pattern')
+        response['sql_rewrites'] = result.get('sql_rewrites', [])
+    
+    if not result.get('success', False):
+        response['error'] = result.get('error', 'Unknown error occurred')
+    
+    return response
+
+
+def sse_event(event, data):
+    """Encode one server-sent event with a compact JSON payload."""
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
 @app.route('/api/query', methods=['POST'])
 def query():
     """Handle natural language queries from the frontend."""
@@ -60,6 +200,7 @@ def query():
         data = request.get_json()
         user_question = data.get('question', '').strip()
         force_agent = data.get('agent', None)  # Optional: force specific agent
+        result_format = data.get('format', 'rows')  # Optional: 'columnar' for compact results
         
         if not user_question:
             return jsonify({
@@ -75,41 +216,21 @@ def query():
                 'error': 'Failed to initialize multi-agent system. Check your configuration.'
             }), 500
         
-        # Process the query (async operation)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Process the query on the worker's long-lived event loop
+        if force_agent:
+            result = run_async(orchestrator.query_with_agent_choice(user_question, force_agent))
+        else:
+            result = run_async(orchestrator.query(user_question))
+        mark_session_changed()
         
-        try:
-            if force_agent:
-                result = loop.run_until_complete(
-                    orchestrator.query_with_agent_choice(user_question, force_agent)
-                )
-            else:
-                result = loop.run_until_complete(
-                    orchestrator.query(user_question)
-                )
-        finally:
-            loop.close()
+        response = format_query_response(result, user_question, result_format)
         
-        # Format response
-        response = {
-            'success': result.get('success', False),
-            'question': result.get('question', user_question),
-            'response': result.get('response', ''),
-            'agent_used': result.get('agent_used', 'Unknown'),
-            'agent_type': result.get('agent_type', 'unknown'),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # Add SQL-specific fields if available
-        if 'sql' in result:
-            response['sql'] = result['sql']
-            response['explanation'] = result.get('explanation', '')
-            response['results'] = result.get('results', None)
-            response['row_count'] = result.get('row_count', 0)
-        
-        if not result.get('success', False):
-            response['error'] = result.get('error', 'Unknown error occurred')
+        if result_format == 'columnar':
+            # Values are already JSON-safe, so skip the default provider and whitespace
+            return Response(
+                json.dumps(response, separators=(',', ':'), ensure_ascii=False),
+                mimetype='application/json'
+            )
         
         return jsonify(response)
     
@@ -120,6 +241,194 @@ def query():
         }), 500
 
 
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """
+    Handle a natural language query, streaming each stage as server-sent events.
+    
+    Events, in order: 'route' (agent decision), 'sql' (generated query and
+    explanation), 'rows' (columnar results), 'token' (pieces of the answer)
+    and 'done' (final response metadata, without the rows already sent).
+    """
+    data = request.get_json() or {}
+    user_question = data.get('question', '').strip()
+    
+    if not user_question:
+        return jsonify({
+            'success': False,
+            'error': 'Please provide a question.'
+        }), 400
+    
+    # Get orchestrator for this session
+    orchestrator = get_orchestrator_for_session()
+    if not orchestrator:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to initialize multi-agent system. Check your configuration.'
+        }), 500
+    session_id = session['session_id']
+    
+    def generate():
+        events = orchestrator.query_stream(user_question)
+        
+        try:
+            while True:
+                try:
+                    event, payload = run_async(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                
+                if event == 'rows':
+                    payload = {
+                        'result_set': to_columnar(payload['columns'], payload['types'], payload['rows']),
+                        'row_count': payload['row_count'],
+                        'truncated': payload['truncated'],
+                        'result_cached': payload['cached']
+                    }
+                elif event == 'done':
+                    payload = format_query_response(payload, user_question, include_results=False)
+                
+                yield sse_event(event, payload)
+        
+        except Exception as e:
+            yield sse_event('error', {
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            })
+        
+        finally:
+            run_async(events.aclose())
+            # The history changes while streaming, after the request was handled
+            orchestrators.touch(session_id)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def format_batch_item(result, result_format):
+    """Build the JSON body for one answered question of a batch."""
+    item = {'index': result['index']}
+    item.update(format_query_response(result, result['question'], result_format))
+    item['queued_ms'] = round(result['queued_ms'], 2)
+    item['elapsed_ms'] = round(result['elapsed_ms'], 2)
+    if 'duplicate_of' in result:
+        item['duplicate_of'] = result['duplicate_of']
+    return item
+
+
+@app.route('/api/query/batch', methods=['POST'])
+def query_batch():
+    """
+    Answer a list of questions concurrently.
+    
+    Repeated questions are answered once. Without 'stream' the results are
+    returned together, in the order given; with 'stream' each result is sent
+    as a line of newline-delimited JSON as soon as it is ready, followed by a
+    final line with 'done'.
+    """
+    data = request.get_json() or {}
+    questions = data.get('questions')
+    force_agent = data.get('agent', None)  # Optional: force specific agent
+    result_format = data.get('format', 'rows')  # Optional: 'columnar' for compact results
+    max_concurrency = data.get('max_concurrency')
+    
+    if not isinstance(questions, list) or not questions or not all(
+        isinstance(question, str) and question.strip() for question in questions
+    ):
+        return jsonify({
+            'success': False,
+            'error': 'Please provide a non-empty list of questions.'
+        }), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({
+            'success': False,
+            'error': f'A batch may contain at most {BATCH_MAX_QUESTIONS} questions.'
+        }), 400
+    if max_concurrency is not None and (not isinstance(max_concurrency, int) or max_concurrency < 1):
+        return jsonify({
+            'success': False,
+            'error': 'max_concurrency must be a positive integer.'
+        }), 400
+    
+    questions = [question.strip() for question in questions]
+    
+    # Get orchestrator for this session
+    orchestrator = get_orchestrator_for_session()
+    if not orchestrator:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to initialize multi-agent system. Check your configuration.'
+        }), 500
+    
+    concurrency = min(max_concurrency or orchestrator.batch_concurrency, orchestrator.batch_concurrency)
+    started = datetime.now()
+    session_id = session['session_id']
+    
+    if not data.get('stream'):
+        try:
+            results = run_async(orchestrator.query_batch(questions, max_concurrency, force_agent))
+            mark_session_changed()
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+        
+        return Response(json.dumps({
+            'success': all(result.get('success', False) for result in results),
+            'count': len(results),
+            'unique': sum(1 for result in results if 'duplicate_of' not in result),
+            'max_concurrency': concurrency,
+            'elapsed_ms': round((datetime.now() - started).total_seconds() * 1000, 2),
+            'results': [format_batch_item(result, result_format) for result in results]
+        }, separators=(',', ':'), ensure_ascii=False, default=str), mimetype='application/json')
+    
+    def generate():
+        events = orchestrator.query_batch_as_completed(questions, max_concurrency, force_agent)
+        count = 0
+        failed = 0
+        
+        try:
+            while True:
+                try:
+                    result = run_async(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                
+                count += 1
+                failed += 0 if result.get('success', False) else 1
+                yield json.dumps(format_batch_item(result, result_format), separators=(',', ':'), ensure_ascii=False, default=str) + "\n"
+            
+            yield json.dumps({
+                'done': True,
+                'success': failed == 0,
+                'count': count,
+                'failed': failed,
+                'max_concurrency': concurrency,
+                'elapsed_ms': round((datetime.now() - started).total_seconds() * 1000, 2)
+            }) + "\n"
+        
+        except Exception as e:
+            yield json.dumps({
+                'done': True,
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }) + "\n"
+        
+        finally:
+            run_async(events.aclose())
+            orchestrators.touch(session_id)
+    
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     """Get conversation history for the current session."""
@@ -134,7 +443,9 @@ def get_history():
         history = orchestrator.get_conversation_history()
         return jsonify({
             'success': True,
-            'history': history
+            'history': history,
+            'summary': orchestrator.get_history_summary(),
+            'memory': orchestrator.get_session_memory()
         })
     
     except Exception as e:
@@ -151,6 +462,7 @@ def clear_history():
         orchestrator = get_orchestrator_for_session()
         if orchestrator:
             orchestrator.clear_history()
+            mark_session_changed()
         
         return jsonify({
             'success': True,
@@ -188,6 +500,114 @@ def get_agents():
         }), 500
 
 
+def current_rss_mb():
+    """Resident set size of this worker in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get process-wide statistics for the shared SQL engine."""
+    if shared_orchestrator is None:
+        return jsonify({
+            'success': False,
+            'error': 'Multi-agent system not initialized yet'
+        }), 404
+    
+    sql_agent = shared_orchestrator.sql_agent.sql_agent
+    return jsonify({
+        'success': True,
+        'process': {'pid': os.getpid(), 'rss_mb': current_rss_mb()},
+        'sessions': len(orchestrators),
+        'session_registry': orchestrators.stats(),
+        'session_store': session_store.stats() if session_store is not None else None,
+        'connection_pool': sql_agent.get_pool_stats(),
+        'aad_token': sql_agent.get_token_stats(),
+        'sql_cache': sql_agent.get_sql_cache_stats(),
+        'result_cache': sql_agent.get_result_cache_stats(),
+        'sql_patterns': sql_agent.get_pattern_stats(),
+        'local_engine': sql_agent.get_local_engine_stats(),
+        'routing': shared_orchestrator.get_routing_stats(),
+        'prompt_cache': prompt_cache_stats()
+    })
+
+
+def collect_engine_metrics():
+    """Expose the shared engine's cache, pool and session statistics as metrics."""
+    if shared_orchestrator is None:
+        return []
+    
+    sql_agent = shared_orchestrator.sql_agent.sql_agent
+    caches = {'sql': sql_agent.get_sql_cache_stats(), 'result': sql_agent.get_result_cache_stats()}
+    pool = sql_agent.get_pool_stats()
+    sessions = orchestrators.stats()
+    families = [
+        ('sqlagent_cache_hits_total', 'counter', "Cache lookups that were answered from the cache",
+            [({'cache': name}, stats['hits']) for name, stats in caches.items()]),
+        ('sqlagent_cache_misses_total', 'counter', "Cache lookups that missed",
+            [({'cache': name}, stats['misses']) for name, stats in caches.items()]),
+        ('sqlagent_cache_entries', 'gauge', "Entries held in each cache",
+            [({'cache': name}, stats['entries']) for name, stats in caches.items()]),
+        ('sqlagent_cache_bytes', 'gauge', "Approximate memory held by each cache",
+            [({'cache': name}, stats['bytes']) for name, stats in caches.items()]),
+        ('sqlagent_pool_connections', 'gauge', "Pooled database connections by state",
+            [({'state': 'idle'}, pool['idle']), ({'state': 'in_use'}, pool['in_use'])]),
+        ('sqlagent_pool_waits_total', 'counter', "Checkouts that had to wait for a connection",
+            [({}, pool['waits'])]),
+        ('sqlagent_pool_timeouts_total', 'counter', "Checkouts that timed out waiting for a connection",
+            [({}, pool['timeouts'])]),
+        ('sqlagent_sessions', 'gauge', "Conversation sessions held by this worker",
+            [({}, sessions['sessions'])]),
+        ('sqlagent_session_bytes', 'gauge', "Measured conversation state of all sessions",
+            [({}, sessions['bytes'])]),
+        ('sqlagent_session_evictions_total', 'counter', "Sessions evicted by reason",
+            [({'reason': reason}, count) for reason, count in sessions['evictions'].items()])
+    ]
+    
+    patterns = sql_agent.get_pattern_stats()
+    if patterns is not None:
+        families.append(('sqlagent_sql_patterns_total', 'counter', "Questions compiled to SQL by a pattern or sent to the LLM",
+            [({'result': 'compiled'}, patterns['compiled']), ({'result': 'fallback'}, patterns['fallbacks'])]))
+    
+    local_engine = sql_agent.get_local_engine_stats()
+    if local_engine is not None:
+        families.append(('sqlagent_local_engine_queries_total', 'counter', "Queries served by the local replica or handed to Azure SQL",
+            [({'result': 'served'}, local_engine['served']), ({'result': 'fallback'}, local_engine['fallbacks'])]))
+    
+    token = sql_agent.get_token_stats()
+    if token is not None:
+        families.append(('sqlagent_aad_token_refreshes_total', 'counter', "Azure AD token fetches by outcome",
+            [({'outcome': 'success'}, token['refreshes']), ({'outcome': 'error'}, token['failures'])]))
+        families.append(('sqlagent_aad_token_expires_in_seconds', 'gauge', "Seconds until the cached Azure AD token expires",
+            [({}, token['expires_in_seconds'] or 0)]))
+    
+    speculation = shared_orchestrator.get_routing_stats()['speculation']
+    families.append(('sqlagent_speculative_sql_total', 'counter', "Speculative SQL generations by outcome",
+        [({'outcome': outcome}, speculation[outcome]) for outcome in ('started', 'used', 'wasted', 'wasted_completed')]))
+    return families
+
+
+REGISTRY.add_collector(collect_engine_metrics)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latencies, outcomes, result sizes and engine statistics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
@@ -218,13 +638,15 @@ def internal_error(error):
 if __name__ == '__main__':
     # Validate required environment variables
     # SQL_USERNAME and SQL_PASSWORD are optional (for Azure AD auth)
+    # SQL_SERVER and SQL_DATABASE are not needed offline (SQL_OFFLINE=true)
+    offline = os.getenv('SQL_OFFLINE', 'false').lower() == 'true'
     required_vars = [
-        'SQL_SERVER',
-        'SQL_DATABASE',
         'AZURE_OPENAI_ENDPOINT',
         'AZURE_OPENAI_API_KEY',
         'AZURE_OPENAI_DEPLOYMENT'
     ]
+    if not offline:
+        required_vars = ['SQL_SERVER', 'SQL_DATABASE'] + required_vars
     
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
@@ -240,7 +662,7 @@ if __name__ == '__main__':
     sql_password = os.getenv('SQL_PASSWORD')
     auth_type = os.getenv('SQL_AUTH_TYPE', 'azure_ad')
     
-    if auth_type == 'sql' and (not sql_username or not sql_password):
+    if auth_type == 'sql' and not offline and (not sql_username or not sql_password):
         print("ERROR: SQL authentication requires SQL_USERNAME and SQL_PASSWORD")
         exit(1)
     
@@ -248,9 +670,12 @@ if __name__ == '__main__':
     print("Multi-Agent SQL Demo - Web Application")
     print("Powered by Microsoft Agent Framework")
     print("=" * 60)
-    print(f"SQL Server: {os.getenv('SQL_SERVER')}")
-    print(f"SQL Database: {os.getenv('SQL_DATABASE')}")
-    print(f"Authentication: {'Azure AD' if auth_type == 'azure_ad' else 'SQL Authentication'}")
+    if offline:
+        print("SQL Database: offline (local replica of database/northwind.sql)")
+    else:
+        print(f"SQL Server: {os.getenv('SQL_SERVER')}")
+        print(f"SQL Database: {os.getenv('SQL_DATABASE')}")
+        print(f"Authentication: {'Azure AD' if auth_type == 'azure_ad' else 'SQL Authentication'}")
     print(f"Multi-Agent System: SQL Agent + General Agent")
     print("=" * 60)
     print("Starting server on http://localhost:5001")
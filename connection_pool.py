@@ -0,0 +1,285 @@
+"""
+Bounded, thread-safe connection pool for the SQL Agent.
+Reuses ODBC connections across queries so each question does not pay a full
+TLS and login handshake against Azure SQL Database.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class _PooledConnection:
+    """A raw connection plus the bookkeeping the pool needs to retire it."""
+    
+    __slots__ = ('conn', 'created_at', 'last_used', 'generation')
+    
+    def __init__(self, conn: Any, generation: int):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.generation = generation
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+    
+    Connections are health-checked on checkout, closed once they have been idle
+    for longer than ``max_idle`` seconds or alive for longer than ``max_lifetime``
+    seconds, and retired when ``invalidate()`` is called (for example after the
+    Azure AD access token has been replaced).
+    """
+    
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = 5,
+        max_idle: float = 300.0,
+        max_lifetime: float = 1800.0,
+        timeout: float = 30.0,
+        ping_after: float = 5.0
+    ):
+        """
+        Initialize the connection pool.
+        
+        Args:
+            connect: Factory that opens a new raw connection
+            max_size: Maximum number of open connections (in use + idle)
+            max_idle: Seconds an idle connection may sit in the pool before it is closed
+            max_lifetime: Seconds after which a connection is retired regardless of use
+            timeout: Seconds to wait for a free connection before giving up
+            ping_after: Connections idle for longer than this are health-checked on checkout
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_after = ping_after
+        
+        self._idle: List[_PooledConnection] = []
+        self._open = 0
+        self._generation = 0
+        self._closed = False
+        self._pruned_at = time.monotonic()
+        self._cond = threading.Condition(threading.Lock())
+        
+        # Sizing statistics
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._created = 0
+        self._retired = 0
+        self._failed_health_checks = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+    
+    def _is_expired(self, pooled: _PooledConnection, now: float, check_idle: bool = True) -> bool:
+        """Check whether a connection has outlived its generation, lifetime or idle budget."""
+        if pooled.generation != self._generation:
+            return True
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return True
+        if check_idle and self.max_idle and now - pooled.last_used > self.max_idle:
+            return True
+        return False
+    
+    @staticmethod
+    def _is_healthy(conn: Any) -> bool:
+        """Run a trivial round trip to verify the connection is still usable."""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close_quietly(conn: Any):
+        """Close a raw connection, ignoring errors from already broken links."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _discard(self, pooled: _PooledConnection):
+        """Close a connection and release its slot. Caller must not hold the lock."""
+        self._close_quietly(pooled.conn)
+        with self._cond:
+            self._open -= 1
+            self._retired += 1
+            self._cond.notify()
+    
+    def acquire(self) -> _PooledConnection:
+        """
+        Check a connection out of the pool, opening a new one if there is room.
+        
+        Returns:
+            Pooled connection wrapper; pass it back to ``release()`` when done
+        
+        Raises:
+            PoolTimeoutError: If no connection became available within ``timeout``
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        
+        # LIFO checkout never reaches connections at the bottom of a busy pool,
+        # so sweep them out every max_idle seconds
+        if self.max_idle and started - self._pruned_at > self.max_idle:
+            self.prune()
+        
+        while True:
+            pooled = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout:.1f}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                
+                if self._idle:
+                    # LIFO keeps the hottest connections in use and lets the rest age out
+                    pooled = self._idle.pop()
+                else:
+                    self._open += 1
+                generation = self._generation
+            
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(self._connect(), generation)
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+                break
+            
+            now = time.monotonic()
+            if self._is_expired(pooled, now):
+                self._discard(pooled)
+                continue
+            if now - pooled.last_used > self.ping_after and not self._is_healthy(pooled.conn):
+                with self._cond:
+                    self._failed_health_checks += 1
+                self._discard(pooled)
+                continue
+            break
+        
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return pooled
+    
+    def release(self, pooled: _PooledConnection, broken: bool = False):
+        """
+        Return a connection to the pool.
+        
+        Args:
+            pooled: Connection wrapper obtained from ``acquire()``
+            broken: Close the connection instead of reusing it (e.g. after an error)
+        """
+        now = time.monotonic()
+        with self._cond:
+            # The connection was in use until now, so only its generation and lifetime count
+            reusable = not broken and not self._closed and not self._is_expired(pooled, now, check_idle=False)
+            if reusable:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+        self._discard(pooled)
+    
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding a raw connection from the pool.
+        
+        The connection is returned to the pool on exit, or discarded if the
+        block raised, since the link may be left in an unknown state.
+        """
+        pooled = self.acquire()
+        try:
+            yield pooled.conn
+        except Exception:
+            self.release(pooled, broken=True)
+            raise
+        else:
+            self.release(pooled)
+    
+    def invalidate(self):
+        """
+        Retire every connection opened so far.
+        
+        Idle connections are closed immediately; connections currently checked
+        out are closed when they are released.
+        """
+        with self._cond:
+            self._generation += 1
+            stale, self._idle = self._idle, []
+        for pooled in stale:
+            self._discard(pooled)
+    
+    def prune(self):
+        """Close idle connections that have exceeded their idle time or lifetime."""
+        now = time.monotonic()
+        with self._cond:
+            self._pruned_at = now
+            stale = [p for p in self._idle if self._is_expired(p, now)]
+            self._idle = [p for p in self._idle if p not in stale]
+        for pooled in stale:
+            self._discard(pooled)
+    
+    def close(self):
+        """Close all idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            stale, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in stale:
+            self._discard(pooled)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size, wait and checkout latency statistics."""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'checkouts': checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'retired': self._retired,
+                'failed_health_checks': self._failed_health_checks,
+                'avg_checkout_ms': (self._checkout_time_total / checkouts * 1000) if checkouts else 0.0,
+                'max_checkout_ms': self._checkout_time_max * 1000
+            }
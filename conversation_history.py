@@ -0,0 +1,249 @@
+"""
+Bounded conversation history for long-running sessions.
+Keeps the most recent turns in a ring buffer; older turns are compacted into
+a short text summary and, optionally, spilled to a JSON-lines file on disk so
+the full history can still be served. Spill files are written on a background
+thread, so adding a turn never waits for the disk.
+"""
+
+import json
+import os
+import sys
+import threading
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from query_cache import estimate_size
+
+# Characters of a question or answer kept per compacted summary line
+SUMMARY_LINE_CHARS = 120
+
+
+def item_size(item: Any) -> int:
+    """Approximate the memory footprint of a history item (dict turn or chat message)."""
+    text = getattr(item, 'text', None)
+    if text is not None:
+        return sys.getsizeof(item) + estimate_size(text)
+    return estimate_size(item)
+
+
+def describe_item(item: Any) -> str:
+    """One summary line for a history item."""
+    if isinstance(item, dict):
+        question = str(item.get('question', ''))[:SUMMARY_LINE_CHARS]
+        answer = str(item.get('response') or item.get('sql') or '')[:SUMMARY_LINE_CHARS]
+        agent = f" [{item['agent']}]" if item.get('agent') else ""
+        return f"Q: {question}{agent} -> {answer}"
+    role = getattr(getattr(item, 'role', None), 'value', None) or 'message'
+    return f"{role}: {str(getattr(item, 'text', item))[:SUMMARY_LINE_CHARS]}"
+
+
+def serialize_item(item: Any) -> Any:
+    """JSON-safe form of a history item for spilling."""
+    if isinstance(item, dict):
+        return item
+    role = getattr(getattr(item, 'role', None), 'value', None)
+    return {'role': role, 'text': getattr(item, 'text', str(item)), 'author_name': getattr(item, 'author_name', None)}
+
+
+def compact_summary(summary: str, evicted: Iterable[Any], summary_chars: int) -> str:
+    """
+    Fold evicted items into a summary of at most summary_chars characters.
+    
+    Each item becomes one line; the oldest lines are dropped once the summary
+    is full (the newest line is always kept).
+    """
+    if not summary_chars:
+        return ""
+    lines = (summary.split("\n") if summary else []) + [describe_item(item) for item in evicted]
+    length = sum(len(line) + 1 for line in lines)
+    start = 0
+    while length > summary_chars and start < len(lines) - 1:
+        length -= len(lines[start]) + 1
+        start += 1
+    return "\n".join(lines[start:])
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_spill_writer = None
+_spill_writer_pid = None
+_spill_writer_lock = threading.Lock()
+
+
+def get_spill_writer() -> ThreadPoolExecutor:
+    """
+    Get the process's spill writer: one thread, so spill file operations run in order.
+    
+    A forked worker gets its own, since the parent's thread does not survive the fork.
+    """
+    global _spill_writer, _spill_writer_pid
+    with _spill_writer_lock:
+        if _spill_writer is None or _spill_writer_pid != os.getpid():
+            _spill_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-spill')
+            _spill_writer_pid = os.getpid()
+        return _spill_writer
+
+
+def _write_spill(path: str, lines: str, count: int):
+    """Append serialized items to a spill file (runs on the spill writer)."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    except OSError as e:
+        print(f"⚠️  Could not spill {count} conversation turn(s): {e}")
+
+
+def _read_spill(path: str) -> List[Any]:
+    """Read a spill file (runs on the spill writer, after the pending writes)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not read spilled conversation history: {e}")
+        return []
+
+
+def _remove_spill(path: str):
+    """Remove a spill file once the writes already queued for it are done."""
+    try:
+        get_spill_writer().submit(_remove_file, path)
+    except RuntimeError:
+        # The writer is shut down at interpreter exit
+        _remove_file(path)
+
+
+class BoundedHistory:
+    """
+    Thread-safe ring buffer of conversation turns.
+    
+    Supports the list operations the agents use (append, extend, len,
+    iteration, indexing and slicing). When more than ``max_items`` items are
+    held, the oldest ones are evicted: each is folded into a running summary
+    of at most ``summary_chars`` characters, and appended to a per-history
+    spill file when ``spill_dir`` is set. Spill writes are queued to the
+    spill writer thread. The spill file is removed when the history is
+    cleared, closed or garbage collected.
+    """
+    
+    def __init__(self, max_items: int = 50, summary_chars: int = 2000, spill_dir: Optional[str] = None):
+        """
+        Initialize the history.
+        
+        Args:
+            max_items: Items kept in memory (0 keeps everything)
+            summary_chars: Size of the summary of evicted items (0 disables it)
+            spill_dir: Directory for the spill file of evicted items (None discards them)
+        """
+        self.max_items = max_items
+        self.summary_chars = summary_chars
+        self.spill_dir = spill_dir
+        self._items = deque()
+        self._summary = ""
+        self._bytes = 0
+        self._compacted = 0
+        self._spilled = 0
+        self._spill_path = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+    
+    def new_empty(self) -> 'BoundedHistory':
+        """Create an empty history with the same limits (and its own spill file)."""
+        return BoundedHistory(self.max_items, self.summary_chars, self.spill_dir)
+    
+    def append(self, item: Any):
+        """Add an item, evicting the oldest items beyond the limit."""
+        with self._lock:
+            self._items.append(item)
+            self._bytes += item_size(item)
+            evicted = []
+            while self.max_items and len(self._items) > self.max_items:
+                oldest = self._items.popleft()
+                self._bytes -= item_size(oldest)
+                evicted.append(oldest)
+            if evicted:
+                self._compact(evicted)
+    
+    def extend(self, items: Iterable[Any]):
+        """Add several items in order."""
+        for item in items:
+            self.append(item)
+    
+    def _compact(self, evicted: List[Any]):
+        """Fold evicted items into the summary and queue them for the spill file (lock held)."""
+        self._compacted += len(evicted)
+        self._summary = compact_summary(self._summary, evicted, self.summary_chars)
+        
+        if self.spill_dir:
+            if self._spill_path is None:
+                self._spill_path = os.path.join(self.spill_dir, f"history-{os.getpid()}-{uuid.uuid4().hex}.jsonl")
+                self._finalizer = weakref.finalize(self, _remove_spill, self._spill_path)
+            lines = "".join(json.dumps(serialize_item(item), default=str) + "\n" for item in evicted)
+            get_spill_writer().submit(_write_spill, self._spill_path, lines, len(evicted))
+            self._spilled += len(evicted)
+    
+    @property
+    def summary(self) -> str:
+        """Compact text summary of the evicted items (most recent last)."""
+        return self._summary
+    
+    def all(self) -> List[Any]:
+        """
+        Spilled items (as JSON dictionaries) followed by the items in memory.
+        
+        Waits for the spill file to be read on the spill writer, so call it
+        from a request thread, not from the event loop.
+        """
+        with self._lock:
+            items = list(self._items)
+            # Queued while the lock is held, so later evictions are not read twice
+            spilled = get_spill_writer().submit(_read_spill, self._spill_path) if self._spilled else None
+        return (spilled.result() if spilled is not None else []) + items
+    
+    def clear(self):
+        """Drop every item, the summary and the spill file."""
+        with self._lock:
+            self._items.clear()
+            self._summary = ""
+            self._bytes = 0
+            self._compacted = 0
+            self._spilled = 0
+            if self._finalizer is not None:
+                self._finalizer()
+            self._spill_path = None
+            self._finalizer = None
+    
+    def close(self):
+        """Release the history's memory and spill file."""
+        self.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the item count, approximate memory use and compaction counts."""
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'max_items': self.max_items,
+                'bytes': self._bytes + len(self._summary),
+                'compacted': self._compacted,
+                'spilled': self._spilled
+            }
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __iter__(self) -> Iterator[Any]:
+        with self._lock:
+            return iter(list(self._items))
+    
+    def __getitem__(self, index):
+        with self._lock:
+            return list(self._items)[index]
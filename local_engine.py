@@ -0,0 +1,579 @@
+"""
+Embedded read replica for small, rarely changing tables.
+Loads database/northwind.sql (or a snapshot of selected live tables) into an
+in-memory SQLite database and answers eligible queries in-process, translating
+the generated T-SQL to the SQLite dialect. Anything the replica cannot answer
+is left to Azure SQL.
+"""
+
+import datetime
+import decimal
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from query_cache import referenced_tables
+from result_set import RowStream, type_name
+from sql_guard import limit_value, tokenize
+
+
+class LocalQueryError(Exception):
+    """Raised when a query cannot be answered by the local replica."""
+
+
+# SQL Server types whose values are converted back to the Python types
+# pyodbc returns, so answers read the same whichever engine ran the query
+def _to_decimal(value: bytes) -> decimal.Decimal:
+    """Convert decimal and numeric columns."""
+    return decimal.Decimal(value.decode())
+
+
+def _to_money(value: bytes) -> decimal.Decimal:
+    """Convert money columns, keeping SQL Server's four decimal places."""
+    return _to_decimal(value).quantize(decimal.Decimal('0.0001'))
+
+
+def _to_datetime(value: bytes) -> datetime.datetime:
+    """Convert datetime columns stored as ISO 8601 text."""
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+def _to_date(value: bytes) -> datetime.date:
+    """Convert date columns stored as ISO 8601 text."""
+    return datetime.date.fromisoformat(value.decode()[:10])
+
+
+def _to_bool(value: bytes) -> bool:
+    """Convert bit columns stored as 0 or 1."""
+    return value not in (b'0', b'0.0')
+
+
+for _name, _converter in [
+    ('MONEY', _to_money), ('SMALLMONEY', _to_money),
+    ('DECIMAL', _to_decimal), ('NUMERIC', _to_decimal),
+    ('DATETIME', _to_datetime), ('DATETIME2', _to_datetime), ('SMALLDATETIME', _to_datetime),
+    ('DATE', _to_date), ('BIT', _to_bool)
+]:
+    sqlite3.register_converter(_name, _converter)
+
+TEXT_TYPES = {'char', 'nchar', 'varchar', 'nvarchar', 'text', 'ntext'}
+
+# SQL Server result type of arithmetic and aggregates over each numeric column
+# type; when an expression mixes them, the first in NUMERIC_PRECEDENCE wins
+NUMERIC_KINDS = {
+    'float': 'float', 'real': 'float',
+    'money': 'money', 'smallmoney': 'money',
+    'decimal': 'decimal', 'numeric': 'decimal'
+}
+NUMERIC_PRECEDENCE = ['float', 'money', 'decimal']
+
+# Keywords ending a select list
+SELECT_LIST_END = {'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'OFFSET', 'UNION', 'EXCEPT', 'INTERSECT'}
+
+# T-SQL functions with a direct SQLite equivalent
+FUNCTION_NAMES = {'ISNULL': 'IFNULL', 'LEN': 'LENGTH', 'SUBSTRING': 'SUBSTR'}
+
+DATE_PARTS = {
+    'YEAR': '%Y', 'YY': '%Y', 'YYYY': '%Y',
+    'MONTH': '%m', 'MM': '%m', 'M': '%m',
+    'DAY': '%d', 'DD': '%d', 'D': '%d'
+}
+
+# Constructs with no SQLite translation; such queries go to Azure SQL
+UNSUPPORTED_KEYWORDS = {'PIVOT', 'UNPIVOT', 'APPLY', 'PERCENT', 'TIES', 'NOLOCK', 'COLLATE'}
+
+SET_OPERATORS = {'UNION', 'EXCEPT', 'INTERSECT'}
+
+
+def _closing_paren(tokens: Sequence[Any], i: int) -> int:
+    """Index of the ')' matching the '(' at tokens[i]."""
+    for j in range(i + 1, len(tokens)):
+        if tokens[j].text == ')' and tokens[j].depth == tokens[i].depth:
+            return j
+    raise LocalQueryError("Unbalanced parentheses")
+
+
+def translate_tsql(sql: str, text_columns: Iterable[str] = ()) -> str:
+    """
+    Translate a read-only T-SQL query to the SQLite dialect.
+    
+    Handles bracket-quoted identifiers, N'...' literals, TOP and OFFSET/FETCH
+    row limits, ISNULL/LEN/SUBSTRING, GETDATE(), YEAR/MONTH/DAY and
+    DATEPART, and '+' string concatenation.
+    
+    Args:
+        sql: Query that has already passed the SQL guard
+        text_columns: Lower-case names of text columns, so that ``a + b``
+            between them becomes a concatenation
+    
+    Returns:
+        The SQLite query
+    
+    Raises:
+        LocalQueryError: If the query uses T-SQL with no SQLite translation
+    """
+    text_columns = set(text_columns)
+    tokens = tokenize(sql)
+    edits: List[Tuple[int, int, str]] = []
+    
+    def is_text(token) -> bool:
+        if token.kind == 'string':
+            return True
+        name = token.text.strip('[]"').lower()
+        return token.kind in ('word', 'ident') and name in text_columns
+    
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        calls = following is not None and following.text == '('
+        
+        if token.kind == 'ident' and token.text.startswith('['):
+            name = token.text[1:-1].replace(']]', ']')
+            edits.append((token.start, token.end, '"' + name.replace('"', '""') + '"'))
+        elif token.kind == 'string' and token.text[0] in 'Nn':
+            edits.append((token.start, token.start + 1, ''))
+        elif token.kind != 'word':
+            if token.text == '+' and 0 < i < len(tokens) - 1 and (is_text(tokens[i - 1]) or is_text(following)):
+                edits.append((token.start, token.end, '||'))
+        elif token.upper in UNSUPPORTED_KEYWORDS:
+            raise LocalQueryError(f"{token.upper} is not supported by the local engine")
+        elif calls and token.upper in FUNCTION_NAMES:
+            edits.append((token.start, token.end, FUNCTION_NAMES[token.upper]))
+        elif calls and token.upper in ('GETDATE', 'GETUTCDATE', 'SYSDATETIME'):
+            close = _closing_paren(tokens, i + 1)
+            edits.append((token.start, tokens[close].end, "datetime('now')"))
+        elif calls and token.upper in ('YEAR', 'MONTH', 'DAY'):
+            close = _closing_paren(tokens, i + 1)
+            edits.append((token.start, following.end, f"CAST(strftime('{DATE_PARTS[token.upper]}', "))
+            edits.append((tokens[close].start, tokens[close].end, ") AS INTEGER)"))
+        elif calls and token.upper == 'DATEPART':
+            close = _closing_paren(tokens, i + 1)
+            part = tokens[i + 2].upper if i + 3 < close else None
+            if part not in DATE_PARTS or tokens[i + 3].text != ',':
+                raise LocalQueryError("DATEPART is only supported for year, month and day")
+            edits.append((token.start, tokens[i + 3].end, f"CAST(strftime('{DATE_PARTS[part]}', "))
+            edits.append((tokens[close].start, tokens[close].end, ") AS INTEGER)"))
+        elif token.upper == 'TOP':
+            edits.extend(_translate_top(tokens, i, len(sql)))
+        elif token.upper == 'OFFSET':
+            edits.extend(_translate_offset(tokens, i))
+    
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        sql = sql[:start] + replacement + sql[end:]
+    return sql
+
+
+def _translate_top(tokens: Sequence[Any], i: int, sql_length: int) -> List[Tuple[int, int, str]]:
+    """Turn ``TOP (n)`` into a LIMIT at the end of the same SELECT."""
+    top = tokens[i]
+    value, _, end = limit_value(tokens, i + 1)
+    if value < 0:
+        raise LocalQueryError("Only literal TOP values are supported by the local engine")
+    
+    # The SELECT ends at the parenthesis closing its subquery, or the end of the text
+    limit_at = sql_length
+    for token in tokens[i + 1:]:
+        if token.depth < top.depth:
+            limit_at = token.start
+            break
+        if token.depth == top.depth and token.upper in SET_OPERATORS:
+            raise LocalQueryError("TOP inside a UNION is not supported by the local engine")
+    return [(top.start, end, ''), (limit_at, limit_at, f" LIMIT {value}")]
+
+
+def _translate_offset(tokens: Sequence[Any], i: int) -> List[Tuple[int, int, str]]:
+    """Turn ``OFFSET m ROWS [FETCH NEXT n ROWS ONLY]`` into ``LIMIT n OFFSET m``."""
+    words = [t.upper for t in tokens[i:i + 8]] + [''] * 8
+    offset, _, _ = limit_value(tokens, i + 1)
+    if offset < 0 or words[2] not in ('ROW', 'ROWS'):
+        raise LocalQueryError("Only literal OFFSET values are supported by the local engine")
+    if words[3] != 'FETCH':
+        return [(tokens[i].start, tokens[i + 2].end, f"LIMIT -1 OFFSET {offset}")]
+    
+    count, _, _ = limit_value(tokens, i + 5)
+    if count < 0 or words[4] not in ('NEXT', 'FIRST') or words[6] not in ('ROW', 'ROWS') or words[7] != 'ONLY':
+        raise LocalQueryError("Only literal FETCH values are supported by the local engine")
+    return [(tokens[i].start, tokens[i + 7].end, f"LIMIT {count} OFFSET {offset}")]
+
+
+def translate_script(script: str) -> str:
+    """
+    Translate a T-SQL schema and data script (CREATE TABLE / INSERT) for SQLite.
+    IDENTITY, SET IDENTITY_INSERT and GO are dropped, (MAX) lengths removed and
+    text columns made case-insensitive like the default SQL Server collation.
+    """
+    script = re.sub(r'^\s*(GO|SET\s+IDENTITY_INSERT\b[^;\n]*;?)\s*$', '', script, flags=re.I | re.M)
+    tokens = tokenize(script)
+    edits = []
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token.kind == 'ident' and token.text.startswith('['):
+            name = token.text[1:-1].replace(']]', ']')
+            edits.append((token.start, token.end, '"' + name.replace('"', '""') + '"'))
+        elif token.kind == 'string' and token.text[0] in 'Nn':
+            edits.append((token.start, token.start + 1, ''))
+        elif token.upper == 'IDENTITY' and following is not None and following.text == '(':
+            edits.append((token.start, tokens[_closing_paren(tokens, i + 1)].end, ''))
+        elif token.upper == 'MAX' and following is not None and following.text == ')' and tokens[i - 1].text == '(':
+            edits.append((tokens[i - 1].start, following.end, ''))
+        elif token.kind == 'word' and token.text.lower() in TEXT_TYPES and i > 0 and tokens[i - 1].kind in ('word', 'ident'):
+            # Column definition: add the collation after the optional length
+            end = token.end
+            if following is not None and following.text == '(':
+                end = tokens[_closing_paren(tokens, i + 1)].end
+            edits.append((end, end, ' COLLATE NOCASE'))
+    
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        script = script[:start] + replacement + script[end:]
+    return script
+
+
+def select_items(sql: str) -> List[List[Any]]:
+    """
+    Split the select list of a query's first top-level SELECT into items.
+    
+    Returns:
+        The tokens of each item (aliases included), or [] if the list cannot be found
+    """
+    tokens = tokenize(sql)
+    i = next((j for j, t in enumerate(tokens) if t.depth == 0 and t.upper == 'SELECT'), len(tokens)) + 1
+    if i < len(tokens) and tokens[i].upper in ('ALL', 'DISTINCT'):
+        i += 1
+    if i < len(tokens) and tokens[i].upper == 'TOP':
+        _, _, end = limit_value(tokens, i + 1)
+        if end < 0:
+            return []
+        i = next((j for j in range(i + 1, len(tokens)) if tokens[j].start >= end), len(tokens))
+    
+    items = [[]]
+    for token in tokens[i:]:
+        if token.depth == 0 and token.upper in SELECT_LIST_END:
+            break
+        if token.depth == 0 and token.text == ',':
+            items.append([])
+        else:
+            items[-1].append(token)
+    return [item for item in items if item]
+
+
+def _sql_server_number(value: Any, kind: Optional[str]) -> Any:
+    """
+    Convert a number SQLite computed from money or decimal columns to the Decimal SQL Server returns.
+    
+    SQLite stores whole values of NUMERIC columns as integers, so results are
+    ints as well as floats.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or kind not in ('money', 'decimal'):
+        return value
+    number = decimal.Decimal(repr(value)) if isinstance(value, float) else decimal.Decimal(value)
+    return number.quantize(decimal.Decimal('0.0001')) if kind == 'money' else number
+
+
+def _sqlite_value(value: Any) -> Any:
+    """Convert a value fetched from SQL Server into something SQLite can store."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def _quote(name: str) -> str:
+    """Double-quote an SQLite identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class LocalEngine:
+    """
+    In-process SQLite replica of selected tables.
+    
+    The replica is built from a T-SQL seed script or from a snapshot of the
+    live tables, and reloaded in the background once it is older than
+    ``refresh_interval`` (queries keep using the previous copy meanwhile).
+    Queries reading only replicated tables are translated to SQLite and run
+    locally; the caller falls back to Azure SQL when ``execute`` raises
+    LocalQueryError.
+    """
+    
+    def __init__(
+        self,
+        tables: Optional[Iterable[str]] = None,
+        seed_file: Optional[str] = None,
+        snapshot: Optional[Callable[[List[str]], Dict[str, Tuple[List[Dict[str, Any]], List[Sequence[Any]]]]]] = None,
+        refresh_interval: float = 300.0
+    ):
+        """
+        Initialize the engine (call load() to build the replica).
+        
+        Args:
+            tables: Tables that may be answered locally (None for every table loaded)
+            seed_file: T-SQL script with CREATE TABLE and INSERT statements to load
+            snapshot: Function returning {table: (column dicts, rows)} for the given
+                table names from the live database; used when seed_file is not set
+            refresh_interval: Seconds before the replica is reloaded (0 never reloads)
+        
+        Raises:
+            ValueError: If neither seed_file nor snapshot is given
+        """
+        if seed_file is None and snapshot is None:
+            raise ValueError("LocalEngine needs a seed_file or a snapshot function")
+        self.requested_tables = list(tables) if tables is not None else None
+        self.seed_file = seed_file
+        self.snapshot = snapshot
+        self.refresh_interval = refresh_interval
+        
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._loaded_at = 0.0
+        self._seed_mtime = None
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.foreign_keys: List[Dict[str, str]] = []
+        self._served: Set[str] = set()
+        self._text_columns: Set[str] = set()
+        self._numeric_columns: Dict[str, str] = {}
+        self._counts = {'served': 0, 'fallbacks': 0, 'refreshes': 0, 'refresh_errors': 0}
+    
+    @property
+    def ready(self) -> bool:
+        """Whether a replica has been loaded."""
+        return self._conn is not None
+    
+    def load(self):
+        """
+        Build the replica now, replacing the current one.
+        
+        Raises:
+            OSError: If the seed file cannot be read
+            sqlite3.Error: If the seed script cannot be loaded
+            Exception: Whatever the snapshot function raises
+        """
+        conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        try:
+            if self.seed_file is not None:
+                mtime = os.path.getmtime(self.seed_file)
+                with open(self.seed_file, encoding='utf-8') as f:
+                    conn.executescript(translate_script(f.read()))
+            else:
+                mtime = None
+                self._load_snapshot(conn)
+            tables, foreign_keys = self._describe(conn)
+            conn.execute("PRAGMA query_only = ON")
+        except Exception:
+            conn.close()
+            raise
+        
+        wanted = {name.lower() for name in (self.requested_tables or tables)}
+        served = {name.lower() for name in tables if name.lower() in wanted}
+        if wanted - served:
+            print(f"⚠️  Local engine has no table(s) named {', '.join(sorted(wanted - served))}")
+        text_columns = {
+            column['name'].lower()
+            for name, columns in tables.items() if name.lower() in served
+            for column in columns if column['type'] in TEXT_TYPES
+        }
+        numeric_columns = {}
+        for name, columns in tables.items():
+            if name.lower() not in served:
+                continue
+            for column in columns:
+                kind = NUMERIC_KINDS.get(column['type'])
+                current = numeric_columns.get(column['name'].lower())
+                if kind and (current is None or NUMERIC_PRECEDENCE.index(kind) < NUMERIC_PRECEDENCE.index(current)):
+                    numeric_columns[column['name'].lower()] = kind
+        
+        with self._lock:
+            old, self._conn = self._conn, conn
+            self.tables, self.foreign_keys = tables, foreign_keys
+            self._served, self._text_columns = served, text_columns
+            self._numeric_columns = numeric_columns
+            self._loaded_at = time.monotonic()
+            self._seed_mtime = mtime
+            self._counts['refreshes'] += 1
+        if old is not None:
+            old.close()
+    
+    def _load_snapshot(self, conn: sqlite3.Connection):
+        """Copy the requested tables from the live database into conn."""
+        for name, (columns, rows) in self.snapshot(self.requested_tables).items():
+            definitions = []
+            for column in columns:
+                collate = " COLLATE NOCASE" if column['type'].lower() in TEXT_TYPES else ""
+                definitions.append(f"{_quote(column['name'])} {column['type'].upper()}{collate}")
+            conn.execute(f"CREATE TABLE {_quote(name)} ({', '.join(definitions)})")
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(
+                f"INSERT INTO {_quote(name)} VALUES ({placeholders})",
+                ([_sqlite_value(v) for v in row] for row in rows)
+            )
+        conn.commit()
+    
+    @staticmethod
+    def _describe(conn: sqlite3.Connection) -> Tuple[Dict[str, List[Dict[str, Any]]], List[Dict[str, str]]]:
+        """Read tables, columns and foreign keys in the shape SchemaIndex expects."""
+        tables = {}
+        foreign_keys = []
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        )]
+        for name in names:
+            tables[name] = [
+                {
+                    'name': column_name,
+                    'type': declared.split('(')[0].strip().lower(),
+                    'nullable': 'NO' if not_null else 'YES',
+                    'primary_key': 'YES' if pk else 'NO'
+                }
+                for _, column_name, declared, not_null, _, pk in conn.execute(f"PRAGMA table_info({_quote(name)})")
+            ]
+            for row in conn.execute(f"PRAGMA foreign_key_list({_quote(name)})"):
+                foreign_keys.append({'table': name, 'column': row[3], 'ref_table': row[2], 'ref_column': row[4]})
+        return tables, foreign_keys
+    
+    def _refresh_in_background(self):
+        """Reload the replica on a background thread if it is due, at most one reload at a time."""
+        if not self.refresh_interval or time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='local-engine-refresh', daemon=True).start()
+    
+    def _refresh(self):
+        """Reload the replica, keeping the current one if loading fails."""
+        try:
+            if self.seed_file is not None and os.path.getmtime(self.seed_file) == self._seed_mtime:
+                # Seed script unchanged; just restart the interval
+                self._loaded_at = time.monotonic()
+            else:
+                self.load()
+        except Exception as e:
+            self._loaded_at = time.monotonic()
+            with self._lock:
+                self._counts['refresh_errors'] += 1
+            print(f"⚠️  Local engine refresh failed: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+    
+    def can_serve(self, sql_query: str) -> bool:
+        """
+        Check whether every table the query reads is held by the replica.
+        
+        Results match Azure SQL's Python types: SUM, AVG and arithmetic over
+        money and decimal columns come back as Decimal (see execute()). One
+        difference remains: AVG over an integer column is fractional here,
+        while SQL Server truncates it to an integer.
+        """
+        if not self.ready:
+            return False
+        tables = referenced_tables(sql_query)
+        return bool(tables) and tables <= self._served
+    
+    def execute(
+        self,
+        sql_query: str,
+        max_rows: Optional[int] = 1000,
+        max_bytes: Optional[int] = 16 * 1024 * 1024,
+        chunk_size: int = 200
+    ) -> Dict[str, Any]:
+        """
+        Run a guarded T-SQL query against the replica.
+        
+        SQLite computes aggregates and arithmetic over money and decimal
+        columns as floats, or as integers for whole values; those values are
+        converted to the Decimal Azure SQL would return (money keeps four
+        decimal places). Expressions that
+        also involve a float or real column stay float, as in SQL Server.
+        
+        Returns:
+            Dictionary with 'columns', 'types', 'rows', 'row_count', 'truncated'
+            and 'bytes' (approximate result size)
+        
+        Raises:
+            LocalQueryError: If the query cannot be translated or fails in SQLite
+        """
+        self._refresh_in_background()
+        try:
+            if not self.ready:
+                raise LocalQueryError("The local replica is not loaded")
+            translated = translate_tsql(sql_query, self._text_columns)
+            with self._lock:
+                cursor = self._conn.execute(translated)
+                stream = RowStream(cursor, max_rows=max_rows, max_bytes=max_bytes, chunk_size=chunk_size)
+                # Bounded by the row/byte ceiling; the cursor must not outlive the lock
+                rows = list(stream)
+                cursor.close()
+                self._counts['served'] += 1
+        except (LocalQueryError, sqlite3.Error) as e:
+            with self._lock:
+                self._counts['fallbacks'] += 1
+            raise LocalQueryError(str(e))
+        
+        kinds = self._numeric_kinds(sql_query, len(stream.columns))
+        if any(kind in ('money', 'decimal') for kind in kinds):
+            rows = [tuple(_sql_server_number(value, kind) for value, kind in zip(row, kinds)) for row in rows]
+        
+        # SQLite cursors carry no column types; take them from the values
+        types = []
+        for index, column_type in enumerate(stream.types):
+            value = next((row[index] for row in rows if row[index] is not None), None)
+            types.append(type_name(type(value)) if value is not None else column_type)
+        
+        return {
+            'columns': stream.columns,
+            'types': types,
+            'rows': rows,
+            'row_count': stream.row_count,
+            'truncated': stream.truncated,
+            'bytes': stream.bytes_read
+        }
+    
+    def _numeric_kinds(self, sql_query: str, column_count: int) -> List[Optional[str]]:
+        """Numeric kind ('float', 'money', 'decimal' or None) of each result column, from the columns it reads."""
+        items = select_items(sql_query)
+        if len(items) != column_count:
+            # e.g. SELECT *, whose columns the declared-type converters already handle
+            return [None] * column_count
+        kinds = []
+        for item in items:
+            if item[0].upper in ('COUNT', 'COUNT_BIG'):
+                # Counts are integers whatever they count
+                kinds.append(None)
+                continue
+            # An alias names the result, it does not read a column
+            aliased = next((j for j, t in enumerate(item) if t.depth == item[0].depth and t.upper == 'AS'), len(item))
+            found = {
+                self._numeric_columns.get(t.text.strip('[]"').lower())
+                for t in item[:aliased] if t.kind in ('word', 'ident')
+            }
+            kinds.append(next((kind for kind in NUMERIC_PRECEDENCE if kind in found), None))
+        return kinds
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the replicated tables, replica age and served/fallback counts."""
+        with self._lock:
+            return {
+                'source': 'seed_file' if self.seed_file is not None else 'snapshot',
+                'tables': sorted(name for name in self.tables if name.lower() in self._served),
+                'age_seconds': (time.monotonic() - self._loaded_at) if self.ready else None,
+                'refresh_interval': self.refresh_interval,
+                **self._counts
+            }
+    
+    def close(self):
+        """Close the replica."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,373 @@
+"""
+In-process metrics for the query pipeline.
+Counters and histograms are kept per process and rendered in the Prometheus
+text exposition format for the /api/metrics endpoint.
+"""
+
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; covers cache hits (sub-millisecond) up to slow model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# (metric name, type, help text, [(labels, value), ...])
+Sample = Tuple[Dict[str, str], float]
+MetricFamily = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_family(name: str, kind: str, help_text: str, samples: Iterable[Tuple[str, Dict[str, str], float]]) -> str:
+    """Render one metric family; samples are (suffixed name, labels, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, **labels: str):
+        """Add to the count for the given label values."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels: str) -> float:
+        """Current count for the given label values."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+    
+    def render(self) -> str:
+        """Render the counter in the text format."""
+        with self._lock:
+            values = sorted(self._values.items())
+        return render_family(self.name, 'counter', self.help, (
+            (self.name, dict(zip(self.labelnames, key)), value) for key, value in values
+        ))
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, optionally split by labels."""
+    
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels: str):
+        """Record one observation for the given label values."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+    
+    def count(self, **labels: str) -> int:
+        """Number of observations for the given label values."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            return sum(counts[0]) if counts else 0
+    
+    def render(self) -> str:
+        """Render the buckets, sum and count in the text format."""
+        with self._lock:
+            values = sorted((key, (list(counts[0]), counts[1])) for key, counts in self._values.items())
+        samples = []
+        for key, (buckets, total) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), buckets):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return render_family(self.name, 'histogram', self.help, samples)
+
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them for scraping.
+    
+    Collectors are callables returning metric families computed at scrape
+    time, for numbers other components already track (cache and pool stats).
+    """
+    
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[MetricFamily]]] = []
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        metric = Counter(name, help_text, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+    
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        metric = Histogram(name, help_text, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+    
+    def add_collector(self, collector: Callable[[], List[MetricFamily]]):
+        """Register a callable returning (name, type, help, samples) families at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        
+        blocks = [metric.render() for metric in metrics]
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"⚠️  Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                blocks.append(render_family(name, kind, help_text, (
+                    (name, labels, value) for labels, value in samples
+                )))
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'sqlagent_stage_duration_seconds',
+    "Time spent in each pipeline stage",
+    ['stage']
+)
+STAGE_RUNS = REGISTRY.counter(
+    'sqlagent_stage_runs_total',
+    "Pipeline stage runs by outcome (success, error or cancelled)",
+    ['stage', 'outcome']
+)
+ROUTING_DECISIONS = REGISTRY.counter(
+    'sqlagent_routing_decisions_total',
+    "Routing decisions by router (local, llm or llm_error) and chosen agent",
+    ['router', 'agent']
+)
+RESULT_ROWS = REGISTRY.histogram(
+    'sqlagent_result_rows',
+    "Rows returned by executed queries",
+    ['engine'],
+    buckets=ROW_BUCKETS
+)
+RESULT_BYTES = REGISTRY.histogram(
+    'sqlagent_result_bytes',
+    "Approximate size of executed query results",
+    ['engine'],
+    buckets=BYTE_BUCKETS
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    'sqlagent_prompt_tokens_total',
+    "Prompt tokens sent to the model by call; kind 'cached' counts those served from the provider's prompt cache",
+    ['call', 'kind']
+)
+
+# Model calls whose prompt usage is recorded
+PROMPT_CALLS = ('route', 'sql_generation', 'summary', 'general')
+
+
+def _usage_field(usage: Any, name: str) -> Any:
+    """Read a usage field from an SDK object or a dictionary."""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+
+def record_prompt_usage(call: str, usage: Any) -> Optional[Dict[str, int]]:
+    """
+    Count the prompt tokens of a model call and how many hit the prompt cache.
+    
+    Accepts the OpenAI SDK's ``usage`` (prompt_tokens and
+    prompt_tokens_details.cached_tokens) or Agent Framework usage details
+    (input_token_count and cache_read_input_token_count).
+    
+    Args:
+        call: Call label value, one of PROMPT_CALLS
+        usage: Usage reported with the response (None records nothing)
+    
+    Returns:
+        Dictionary with 'prompt_tokens' and 'cached_tokens', or None without usage
+    """
+    prompt = _usage_field(usage, 'prompt_tokens')
+    if prompt is None:
+        prompt = _usage_field(usage, 'input_token_count')
+    if prompt is None:
+        return None
+    cached = _usage_field(_usage_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+    if cached is None:
+        cached = _usage_field(usage, 'cache_read_input_token_count')
+    counts = {'prompt_tokens': int(prompt), 'cached_tokens': int(cached or 0)}
+    PROMPT_TOKENS.inc(counts['prompt_tokens'], call=call, kind='prompt')
+    PROMPT_TOKENS.inc(counts['cached_tokens'], call=call, kind='cached')
+    return counts
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Prompt and cached token totals per model call, with the share served from the cache."""
+    stats = {}
+    for call in PROMPT_CALLS:
+        prompt = PROMPT_TOKENS.value(call=call, kind='prompt')
+        cached = PROMPT_TOKENS.value(call=call, kind='cached')
+        stats[call] = {
+            'prompt_tokens': int(prompt),
+            'cached_tokens': int(cached),
+            'cached_ratio': round(cached / prompt, 3) if prompt else 0.0
+        }
+    return stats
+
+
+def result_outcome(result: Any) -> str:
+    """Outcome of a stage returning a result dictionary with a 'success' key."""
+    return 'success' if result.get('success', True) else 'error'
+
+
+def event_outcome(event: Any) -> str:
+    """Outcome of a streamed (event, data) tuple: an 'error' event or an unsuccessful 'done'."""
+    name, data = event
+    if name == 'error' or (name == 'done' and not data.get('success', True)):
+        return 'error'
+    return 'success'
+
+
+def timed_stage(stage: str, outcome: Optional[Callable[[Any], str]] = None):
+    """
+    Decorator recording a function's latency and outcome under a pipeline stage.
+    
+    Works on plain functions, coroutines and async generators (timed until the
+    generator is exhausted or closed). Exceptions count as 'error' and
+    cancellations as 'cancelled'; otherwise the outcome is 'success', or what
+    outcome(result) returns. For async generators outcome is applied to each
+    yielded item, and the first one that is not 'success' is recorded.
+    
+    Args:
+        stage: Stage label value
+        outcome: Optional callable mapping the return value to an outcome label
+    """
+    def record(started: float, status: str):
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage=stage)
+        STAGE_RUNS.inc(stage=stage, outcome=status)
+    
+    def classify(result: Any) -> str:
+        return outcome(result) if outcome is not None else 'success'
+    
+    def decorate(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                status = 'success'
+                inner = func(*args, **kwargs)
+                try:
+                    async for item in inner:
+                        if status == 'success':
+                            status = classify(item)
+                        yield item
+                except (GeneratorExit, asyncio.CancelledError):
+                    if status == 'success':
+                        status = 'cancelled'
+                    raise
+                except Exception:
+                    status = 'error'
+                    raise
+                finally:
+                    # Run the wrapped generator's cleanup now rather than when it is collected
+                    try:
+                        await inner.aclose()
+                    finally:
+                        record(started, status)
+            return async_gen_wrapper
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except asyncio.CancelledError:
+                    record(started, 'cancelled')
+                    raise
+                except Exception:
+                    record(started, 'error')
+                    raise
+                record(started, classify(result))
+                return result
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                record(started, 'error')
+                raise
+            record(started, classify(result))
+            return result
+        return wrapper
+    
+    return decorate
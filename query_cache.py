@@ -0,0 +1,244 @@
+"""
+In-process caches for the SQL Agent.
+Lets repeated questions skip the SQL generation round trip to Azure OpenAI,
+and repeated SQL skip the round trip to the database.
+"""
+
+import hashlib
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a natural language question for use as a cache key.
+    Case, punctuation and repeated whitespace do not change the meaning of
+    the question, so "How many customers?" and "how many  customers" match.
+    """
+    text = question.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def schema_fingerprint(schema_info: str) -> str:
+    """Return a short, stable hash of the schema text."""
+    return hashlib.sha256(schema_info.encode("utf-8")).hexdigest()[:16]
+
+
+# String literals, bracketed/quoted identifiers, or runs of whitespace
+_SQL_TOKEN_RE = re.compile(r"(N?'(?:[^']|'')*'|\[[^\]]*\]|\"[^\"]*\")|(\s+)")
+
+# Table references following FROM / JOIN, optionally schema-qualified
+_TABLE_REF_RE = re.compile(
+    r"\b(?:FROM|JOIN)\s+((?:(?:\[[^\]]+\]|\w+)\.)*(?:\[[^\]]+\]|\w+))",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize SQL text for use as a cache key.
+    Collapses whitespace and drops trailing semicolons, leaving string
+    literals and quoted identifiers untouched.
+    """
+    def collapse(match):
+        return match.group(1) if match.group(1) else " "
+    
+    return _SQL_TOKEN_RE.sub(collapse, sql).strip().rstrip(";").strip()
+
+
+def referenced_tables(sql: str) -> Set[str]:
+    """Return the lower-cased, unqualified names of tables read by a query."""
+    tables = set()
+    for match in _TABLE_REF_RE.finditer(sql):
+        name = match.group(1)
+        last = re.findall(r"\[[^\]]+\]|\w+", name)[-1]
+        tables.add(last.strip("[]").lower())
+    return tables
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory footprint of a value in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class _CacheEntry:
+    """A cached value with its expiry time, approximate size and tags."""
+    
+    __slots__ = ('value', 'expires_at', 'size', 'tags')
+    
+    def __init__(self, value: Any, expires_at: Optional[float], size: int, tags: Set[str]):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with per-entry expiry.
+    
+    Entries older than their TTL are treated as misses and dropped. When the
+    cache holds more than ``max_entries`` entries, or more than ``max_bytes``
+    approximate bytes, the least recently used entries are evicted. Entries
+    can be tagged (e.g. with the tables a query reads) and invalidated by tag.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: Optional[float] = 3600.0,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of entries kept
+            ttl: Default seconds an entry stays valid (None keeps entries until evicted)
+            max_bytes: Memory budget in approximate bytes (None for no budget)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    def _remove(self, key: Hashable) -> Optional[_CacheEntry]:
+        """Remove an entry and its tag index. Caller must hold the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            for tag in entry.tags:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+        return entry
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            if entry.expires_at is not None and time.monotonic() >= entry.expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+    
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[str] = (),
+        ttl: Optional[float] = None,
+        size: Optional[int] = None
+    ):
+        """
+        Store a value, evicting the least recently used entries if needed.
+        
+        Args:
+            key: Cache key
+            value: Value to cache
+            tags: Labels the entry can later be invalidated by
+            ttl: Seconds this entry stays valid (defaults to the cache TTL)
+            size: Approximate size in bytes (estimated when a budget is set)
+        """
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        if size is None:
+            size = estimate_size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            # Never let one oversized entry flush the whole cache
+            return
+        
+        with self._lock:
+            self._remove(key)
+            entry = _CacheEntry(value, expires_at, size, set(tags))
+            self._entries[key] = entry
+            self._bytes += size
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def invalidate(self, key: Hashable):
+        """Remove a single entry."""
+        with self._lock:
+            if self._remove(key) is not None:
+                self.invalidations += 1
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """
+        Remove every entry carrying the given tag.
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+    
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
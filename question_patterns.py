@@ -0,0 +1,349 @@
+"""
+Pattern-compiled SQL for recurring question shapes.
+Questions such as "top 5 products by unit price" or "how many customers" are
+turned into T-SQL locally, against the loaded schema, without asking Azure
+OpenAI to write the query.
+"""
+
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from schema_index import SchemaIndex, singular, split_identifier
+
+
+NUMERIC_TYPES = {
+    'bigint', 'int', 'smallint', 'tinyint', 'bit',
+    'decimal', 'numeric', 'money', 'smallmoney', 'float', 'real'
+}
+
+_NUMBER_RE = re.compile(r'-?\d+(\.\d+)?')
+_CONJUNCTION_RE = re.compile(r'\b(and|or|but|where|order|sorted|by|than)\b', re.IGNORECASE)
+_COMPARISON_RE = re.compile(
+    r'^(not|over|under|above|below|greater|less|more|between|like|in)\b|[<>]|!=',
+    re.IGNORECASE
+)
+
+
+def quote_identifier(name: str) -> str:
+    """Bracket-quote a T-SQL identifier."""
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def quote_literal(value: str, column: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Turn a value taken from a question into a T-SQL literal.
+    Numbers compared with numeric columns stay bare; everything else becomes
+    an escaped N'...' string.
+    """
+    value = value.strip().strip('"\'')
+    if column is not None and column['type'].lower() in NUMERIC_TYPES and _NUMBER_RE.fullmatch(value):
+        return value
+    return "N'" + value.replace("'", "''") + "'"
+
+
+def label_column(schema_index: SchemaIndex, table_name: str) -> str:
+    """Pick the column that best names a row: a '...Name' column, else the primary key."""
+    columns = schema_index.tables[table_name]
+    for column in columns:
+        if column['name'].lower().endswith('name'):
+            return column['name']
+    for column in columns:
+        if column['primary_key'] == 'YES':
+            return column['name']
+    return columns[0]['name']
+
+
+def _build_top_n(groups: Dict[str, str], schema_index: SchemaIndex) -> Optional[str]:
+    """SELECT TOP n <label>, <column> FROM <table> ORDER BY <column>."""
+    table = schema_index.resolve_table(groups['table'])
+    column = schema_index.resolve_column(table, groups['column']) if table else None
+    if column is None:
+        return None
+    
+    direction = 'ASC' if groups['direction'].lower() in ('bottom', 'lowest') else 'DESC'
+    selected = [label_column(schema_index, table), column['name']]
+    if selected[0] == selected[1]:
+        selected.pop()
+    return (
+        f"SELECT TOP {int(groups['n'])} {', '.join(quote_identifier(c) for c in selected)}\n"
+        f"FROM {quote_identifier(table)}\n"
+        f"ORDER BY {quote_identifier(column['name'])} {direction}"
+    )
+
+
+def _build_count(groups: Dict[str, str], schema_index: SchemaIndex) -> Optional[str]:
+    """SELECT COUNT(*) FROM <table>."""
+    table = schema_index.resolve_table(groups['table'])
+    if table is None:
+        return None
+    # Name the count after the singular table name, e.g. CustomerCount
+    words = split_identifier(table)
+    alias = "".join(w.capitalize() for w in words[:-1] + [singular(words[-1])]) + "Count"
+    return f"SELECT COUNT(*) AS {quote_identifier(alias)}\nFROM {quote_identifier(table)}"
+
+
+def _build_where_equals(groups: Dict[str, str], schema_index: SchemaIndex) -> Optional[str]:
+    """SELECT * FROM <table> WHERE <column> = <value>."""
+    # Compound conditions ("... is London and country is UK") and comparisons
+    # ("... is over 20", "... is not London") need the LLM
+    value = groups['value'].strip()
+    if _CONJUNCTION_RE.search(value) or _COMPARISON_RE.search(value):
+        return None
+    table = schema_index.resolve_table(groups['table'])
+    column = schema_index.resolve_column(table, groups['column']) if table else None
+    if column is None:
+        return None
+    # A numeric column compared with anything but a number ("price is cheap")
+    if column['type'].lower() in NUMERIC_TYPES and not _NUMBER_RE.fullmatch(value.strip('"\'')):
+        return None
+    return (
+        f"SELECT *\nFROM {quote_identifier(table)}\n"
+        f"WHERE {quote_identifier(column['name'])} = {quote_literal(groups['value'], column)}"
+    )
+
+
+_LEAD = r"^(?:(?:show|list|give|get|find|display)(?: me)?\s+|what are\s+|which are\s+)?(?:all\s+)?(?:the\s+)?"
+_NAME = r"[a-z][\w ]*?"
+
+BUILTIN_PATTERNS = [
+    {
+        'name': 'top_n_by_column',
+        'description': 'the first N rows of a table ordered by a column',
+        'patterns': [
+            _LEAD + rf"(?P<direction>top|bottom)\s+(?P<n>\d{{1,4}})\s+(?P<table>{_NAME})\s+by\s+(?:highest\s+|lowest\s+)?(?P<column>{_NAME})$"
+        ],
+        'build': _build_top_n
+    },
+    {
+        'name': 'count_rows',
+        'description': 'the number of rows in a table',
+        'patterns': [
+            rf"^how many\s+(?P<table>{_NAME})(?:\s+(?:are there|do we have|exist|are in the database|in total))?$",
+            rf"^(?:what is\s+)?(?:the\s+)?(?:total\s+)?(?:number|count) of\s+(?P<table>{_NAME})$"
+        ],
+        'build': _build_count
+    },
+    {
+        'name': 'where_column_equals',
+        'description': 'the rows of a table whose column equals a value',
+        'patterns': [
+            _LEAD + rf"(?P<table>{_NAME})\s+(?:where|with|whose)\s+(?P<column>{_NAME})\s*(?:=|\bis equal to\b|\bequals\b|\bis\b)\s*(?P<value>.+)$"
+        ],
+        'build': _build_where_equals
+    },
+]
+
+
+class QuestionPattern:
+    """
+    A question shape and how to turn it into SQL.
+    
+    A pattern is one or more case-insensitive regular expressions with named
+    groups. The SQL comes either from a ``build(groups, schema_index)``
+    function or from a template whose placeholders are filled from the
+    groups: ``{table}`` and ``{column}`` are resolved against the schema and
+    bracket-quoted, ``{n}`` must be an integer, and any other group becomes
+    an escaped literal.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        patterns: Union[str, Iterable[str]],
+        sql: Optional[str] = None,
+        build: Optional[Callable[[Dict[str, str], SchemaIndex], Optional[str]]] = None,
+        description: Optional[str] = None
+    ):
+        """
+        Initialize the pattern.
+        
+        Args:
+            name: Unique pattern name, used in statistics and explanations
+            patterns: Regular expression(s) matched against the whole question
+            sql: SQL template with {placeholders} (used when build is not given)
+            build: Function returning SQL for the matched groups, or None to decline
+            description: What the generated query returns, for the explanation
+        
+        Raises:
+            ValueError: If neither sql nor build is given or a regex is invalid
+        """
+        if sql is None and build is None:
+            raise ValueError(f"Pattern '{name}' needs either sql or build")
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        try:
+            self.regexes = [re.compile(p, re.IGNORECASE) for p in patterns]
+        except re.error as e:
+            raise ValueError(f"Pattern '{name}' has an invalid regular expression: {e}")
+        self.name = name
+        self.sql = sql
+        self.build = build or self._build_from_template
+        self.description = description or name
+    
+    def _build_from_template(self, groups: Dict[str, str], schema_index: SchemaIndex) -> Optional[str]:
+        """Fill the SQL template, declining if an identifier does not resolve."""
+        values = {}
+        table = None
+        if groups.get('table') is not None:
+            table = schema_index.resolve_table(groups['table'])
+            if table is None:
+                return None
+            values['table'] = quote_identifier(table)
+        
+        column = None
+        if groups.get('column') is not None:
+            column = schema_index.resolve_column(table, groups['column']) if table else None
+            if column is None:
+                return None
+            values['column'] = quote_identifier(column['name'])
+        
+        for key, value in groups.items():
+            if key in values or value is None:
+                continue
+            if key == 'n':
+                if not value.isdigit():
+                    return None
+                values[key] = str(int(value))
+            else:
+                values[key] = quote_literal(value, column)
+        
+        try:
+            return self.sql.format(**values)
+        except (KeyError, IndexError):
+            return None
+    
+    def compile(self, question: str, schema_index: SchemaIndex) -> Optional[str]:
+        """Return SQL for the question, or None if this pattern does not apply."""
+        for regex in self.regexes:
+            match = regex.match(question)
+            if match:
+                sql = self.build(match.groupdict(), schema_index)
+                if sql:
+                    return sql
+        return None
+
+
+class PatternRegistry:
+    """
+    Ordered collection of question patterns with per-pattern hit statistics.
+    
+    Patterns are tried in order, operator-supplied patterns before the
+    built-in ones, and the first that produces SQL wins.
+    """
+    
+    def __init__(self, include_builtins: bool = True):
+        """
+        Initialize the registry.
+        
+        Args:
+            include_builtins: Register the built-in top-N, count and equality patterns
+        """
+        self._patterns: List[QuestionPattern] = []
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._fallbacks = 0
+        
+        if include_builtins:
+            for spec in BUILTIN_PATTERNS:
+                self._append(QuestionPattern(**spec))
+    
+    def _append(self, pattern: QuestionPattern, first: bool = False):
+        """Add a pattern, replacing any pattern with the same name."""
+        with self._lock:
+            self._patterns = [p for p in self._patterns if p.name != pattern.name]
+            if first:
+                self._patterns.insert(0, pattern)
+            else:
+                self._patterns.append(pattern)
+            self._hits.setdefault(pattern.name, 0)
+    
+    def register(self, pattern: QuestionPattern):
+        """Add a pattern ahead of the ones already registered."""
+        self._append(pattern, first=True)
+    
+    def add(self, name: str, patterns: Union[str, Iterable[str]], sql: str, description: Optional[str] = None):
+        """Register a template pattern; see QuestionPattern for the placeholders."""
+        self.register(QuestionPattern(name, patterns, sql=sql, description=description))
+    
+    def load_file(self, path: str) -> int:
+        """
+        Register patterns from a JSON file.
+        
+        The file holds a list of objects with 'name', 'pattern' (a regex or a
+        list of regexes), 'sql' and an optional 'description'.
+        
+        Returns:
+            Number of patterns registered
+        
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If the file or a pattern is invalid
+        """
+        with open(path, encoding='utf-8') as f:
+            specs = json.load(f)
+        if not isinstance(specs, list):
+            raise ValueError("Pattern file must contain a JSON list")
+        
+        # Register in reverse so the first pattern in the file is tried first
+        for spec in reversed(specs):
+            try:
+                self.add(spec['name'], spec['pattern'], spec['sql'], spec.get('description'))
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid pattern entry {spec!r}: {e}")
+        return len(specs)
+    
+    def compile(self, question: str, schema_index: SchemaIndex, record: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Turn a question into SQL with the first matching pattern.
+        
+        Args:
+            question: The user's question
+            schema_index: Index of the loaded database schema
+            record: Count the hit or fallback; pass False for work that may be
+                thrown away and call record() once it is used
+        
+        Returns:
+            Dictionary with 'pattern', 'sql' and 'explanation', or None when no
+            pattern applies and the LLM should write the query
+        """
+        text = question.strip().rstrip('?!. ')
+        with self._lock:
+            patterns = list(self._patterns)
+        
+        for pattern in patterns:
+            sql = pattern.compile(text, schema_index)
+            if sql:
+                if record:
+                    self.record(pattern.name)
+                return {
+                    'pattern': pattern.name,
+                    'sql': sql,
+                    'explanation': f"This query returns {pattern.description} "
+                                   f"(compiled from the '{pattern.name}' question pattern)"
+                }
+        
+        if record:
+            self.record(None)
+        return None
+    
+    def record(self, pattern_name: Optional[str]):
+        """Count a question compiled by the named pattern, or one left to the LLM (None)."""
+        with self._lock:
+            if pattern_name is None:
+                self._fallbacks += 1
+            else:
+                self._hits[pattern_name] = self._hits.get(pattern_name, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return per-pattern hit counts and how many questions fell back to the LLM."""
+        with self._lock:
+            compiled = sum(self._hits.values())
+            total = compiled + self._fallbacks
+            return {
+                'patterns': dict(self._hits),
+                'compiled': compiled,
+                'fallbacks': self._fallbacks,
+                'hit_rate': (compiled / total) if total else 0.0
+            }
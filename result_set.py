@@ -0,0 +1,169 @@
+"""
+Streaming result handling for the SQL Agent.
+Pulls rows from a cursor in chunks and stops at a row or byte ceiling, so a
+careless SELECT * never materializes a whole table in Python, and encodes
+results in a compact columnar wire format.
+"""
+
+import base64
+import datetime
+import decimal
+import sys
+import uuid
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# Wire type names for the Python types returned by the ODBC driver
+_TYPE_NAMES = [
+    (bool, 'bool'),
+    (int, 'int'),
+    (float, 'float'),
+    (decimal.Decimal, 'decimal'),
+    (datetime.datetime, 'datetime'),
+    (datetime.date, 'date'),
+    (datetime.time, 'time'),
+    ((bytes, bytearray, memoryview), 'binary'),
+    (uuid.UUID, 'uuid'),
+    (str, 'string'),
+]
+
+
+def type_name(type_code: Any) -> str:
+    """Map a cursor.description type code (a Python type) to a wire type name."""
+    if isinstance(type_code, type):
+        for py_type, name in _TYPE_NAMES:
+            if issubclass(type_code, py_type):
+                return name
+    return 'string'
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Convert a database value into a JSON-safe value.
+    Decimals are sent as strings so money columns keep their exact precision;
+    temporal values use ISO 8601 and binary values base64.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return str(value)
+
+
+def estimate_row_bytes(row: Sequence[Any]) -> int:
+    """Approximate the memory footprint of one result row in bytes."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class RowStream:
+    """
+    Iterator over the rows of an executed cursor.
+    
+    Rows are fetched with ``fetchmany`` in chunks of ``chunk_size`` and yielded
+    as plain tuples. Iteration stops once ``max_rows`` rows or ``max_bytes``
+    approximate bytes have been read; ``truncated`` then tells whether the
+    query had more rows than were returned.
+    """
+    
+    def __init__(
+        self,
+        cursor: Any,
+        max_rows: Optional[int] = 1000,
+        max_bytes: Optional[int] = 16 * 1024 * 1024,
+        chunk_size: int = 200
+    ):
+        """
+        Initialize the stream.
+        
+        Args:
+            cursor: DB-API cursor on which a query has been executed
+            max_rows: Maximum number of rows to return (None for no limit)
+            max_bytes: Maximum approximate bytes to return (None for no limit)
+            chunk_size: Number of rows requested per fetchmany call
+        """
+        self.cursor = cursor
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.columns: List[str] = [column[0] for column in cursor.description]
+        self.types: List[str] = [type_name(column[1]) for column in cursor.description]
+        self.row_count = 0
+        self.bytes_read = 0
+        self.truncated = False
+        self._done = False
+    
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        while not self._done:
+            size = self.chunk_size
+            if self.max_rows is not None:
+                # Ask for one row beyond the ceiling so truncation can be detected
+                size = max(1, min(size, self.max_rows - self.row_count + 1))
+            
+            chunk = self.cursor.fetchmany(size)
+            if not chunk:
+                self._done = True
+                return
+            
+            for row in chunk:
+                row = tuple(row)
+                row_bytes = estimate_row_bytes(row)
+                over_rows = self.max_rows is not None and self.row_count >= self.max_rows
+                over_bytes = (
+                    self.max_bytes is not None
+                    and self.row_count > 0
+                    and self.bytes_read + row_bytes > self.max_bytes
+                )
+                if over_rows or over_bytes:
+                    self.truncated = True
+                    self._done = True
+                    self._discard_remaining()
+                    return
+                
+                self.row_count += 1
+                self.bytes_read += row_bytes
+                yield row
+    
+    def _discard_remaining(self):
+        """Ask the server to stop sending the rest of the result set."""
+        try:
+            self.cursor.cancel()
+        except Exception:
+            pass
+
+
+def iter_dicts(
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    limit: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Lazily turn result rows into column-name dictionaries."""
+    if limit is not None:
+        rows = islice(rows, limit)
+    for row in rows:
+        yield dict(zip(columns, row))
+
+
+def to_columnar(
+    columns: Sequence[str],
+    types: Sequence[str],
+    rows: Iterable[Sequence[Any]]
+) -> Dict[str, Any]:
+    """
+    Encode a result set in the compact columnar wire format.
+    
+    Column names and types are sent once, followed by one JSON array per row,
+    instead of repeating every column name in every row.
+    
+    Returns:
+        Dictionary with 'columns', 'types' and 'rows'
+    """
+    return {
+        'columns': list(columns),
+        'types': list(types),
+        'rows': [[encode_value(value) for value in row] for row in rows]
+    }
@@ -0,0 +1,271 @@
+"""
+Schema index for question-relevant prompt pruning.
+Maps table names, column names and synonyms to tables, and follows foreign
+keys so only the tables a question needs (plus their join partners) are put
+into the SQL generation prompt.
+"""
+
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+# Business vocabulary that does not appear in table or column names.
+# Entries naming tables that do not exist in the schema are ignored.
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    'revenue': ['Order Details'],
+    'sales': ['Order Details', 'Orders'],
+    'sold': ['Order Details'],
+    'selling': ['Order Details'],
+    'quantity': ['Order Details'],
+    'discount': ['Order Details'],
+    'purchase': ['Orders'],
+    'client': ['Customers'],
+    'buyer': ['Customers'],
+    'company': ['Customers'],
+    'staff': ['Employees'],
+    'salesperson': ['Employees'],
+    'rep': ['Employees'],
+    'vendor': ['Suppliers'],
+    'carrier': ['Shippers'],
+    'shipping': ['Shippers', 'Orders'],
+    'freight': ['Orders'],
+    'item': ['Products'],
+    'stock': ['Products'],
+    'inventory': ['Products'],
+    'expensive': ['Products'],
+    'cheap': ['Products'],
+    'price': ['Products'],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English/SQL text (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def singular(word: str) -> str:
+    """Very small English singularizer, good enough for table names."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('sses', 'shes', 'ches', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def split_identifier(name: str) -> List[str]:
+    """Split 'UnitPrice', 'Order Details' or 'ship_city' into lower-case words."""
+    words = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name)
+    return [w.lower() for w in re.split(r'[\s_]+', words) if w]
+
+
+def question_terms(question: str) -> Set[str]:
+    """Lower-case words of a question plus their singular forms and joined bigrams."""
+    words = re.findall(r'[a-z0-9]+', question.lower())
+    terms = set(words) | {singular(w) for w in words}
+    for first, second in zip(words, words[1:]):
+        terms.add(first + second)
+        terms.add(singular(first + second))
+    return terms
+
+
+class SchemaIndex:
+    """
+    Index over the database schema used to pick the tables relevant to a question.
+    """
+    
+    def __init__(
+        self,
+        tables: Dict[str, List[Dict[str, Any]]],
+        foreign_keys: Iterable[Dict[str, str]],
+        synonyms: Optional[Dict[str, List[str]]] = None,
+        max_column_matches: int = 10
+    ):
+        """
+        Initialize the schema index.
+        
+        Args:
+            tables: Table name -> list of column dicts ('name', 'type', 'nullable', 'primary_key')
+            foreign_keys: Dicts with 'table', 'column', 'ref_table' and 'ref_column'
+            synonyms: Extra vocabulary mapping a word (or two-word phrase) to table
+                names, merged over DEFAULT_SYNONYMS
+            max_column_matches: Column-only matches spanning more tables than this are
+                too ambiguous to prune on (e.g. a question that only says "name")
+        """
+        self.tables = tables
+        self.foreign_keys = list(foreign_keys)
+        self.synonyms: Dict[str, List[str]] = {}
+        for word, table_names in {**DEFAULT_SYNONYMS, **(synonyms or {})}.items():
+            self.synonyms[re.sub(r'[^a-z0-9]', '', word.lower())] = list(table_names)
+        self.max_column_matches = max_column_matches
+        
+        # Undirected foreign key graph for finding join paths, plus the tables
+        # each table references (its lookup tables)
+        self.neighbors: Dict[str, Set[str]] = {name: set() for name in tables}
+        self.references: Dict[str, Set[str]] = {name: set() for name in tables}
+        self._column_refs: Dict[tuple, str] = {}
+        for fk in self.foreign_keys:
+            if fk['table'] in tables and fk['ref_table'] in tables:
+                self.references[fk['table']].add(fk['ref_table'])
+                self.neighbors[fk['table']].add(fk['ref_table'])
+                self.neighbors[fk['ref_table']].add(fk['table'])
+                self._column_refs[(fk['table'], fk['column'])] = f"{fk['ref_table']}.{fk['ref_column']}"
+        
+        # Terms that name a table directly, and terms naming one of its columns
+        self._table_terms: Dict[str, Set[str]] = {}
+        self._column_terms: Dict[str, Set[str]] = {}
+        for name, columns in tables.items():
+            words = split_identifier(name)
+            joined = "".join(words)
+            self._table_terms[name] = {joined, singular(joined), words[-1], singular(words[-1])} if words else set()
+            column_terms = set()
+            for column in columns:
+                column_words = split_identifier(column['name'])
+                column_terms.add("".join(column_words))
+            self._column_terms[name] = column_terms
+        
+        self._full_text = self.render()
+    
+    def resolve_table(self, phrase: str) -> Optional[str]:
+        """
+        Find the table a phrase like 'customers' or 'order details' names exactly.
+        
+        Returns:
+            Table name, or None when no table (or more than one) matches
+        """
+        key = singular("".join(re.findall(r'[a-z0-9]+', phrase.lower())))
+        found = [name for name in self.tables if key and singular("".join(split_identifier(name))) == key]
+        return found[0] if len(found) == 1 else None
+    
+    def resolve_column(self, table_name: str, phrase: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the column of a table that a phrase like 'unit price' names exactly.
+        
+        Returns:
+            Column dict ('name', 'type', ...), or None when nothing matches
+        """
+        key = singular("".join(re.findall(r'[a-z0-9]+', phrase.lower())))
+        for column in self.tables.get(table_name, ()):
+            if key and singular("".join(split_identifier(column['name']))) == key:
+                return column
+        return None
+    
+    def summary(self) -> str:
+        """One-line list of the tables, for prompts that only need to know what exists."""
+        return "Tables: " + ", ".join(self.tables) if self.tables else "No tables available"
+    
+    def render(self, table_names: Optional[Iterable[str]] = None) -> str:
+        """
+        Format the schema (or a subset of its tables) as prompt text.
+        
+        Args:
+            table_names: Tables to include, in schema order (all tables when None)
+        """
+        wanted = set(self.tables if table_names is None else table_names)
+        
+        schema_text = "Database Schema:\n\n"
+        for table_name, columns in self.tables.items():
+            if table_name not in wanted:
+                continue
+            schema_text += f"Table: {table_name}\n"
+            for col in columns:
+                pk_marker = " (PRIMARY KEY)" if col['primary_key'] == 'YES' else ""
+                ref = self._column_refs.get((table_name, col['name']))
+                fk_marker = f" (FOREIGN KEY -> {ref})" if ref else ""
+                schema_text += f"  - {col['name']}: {col['type']}{pk_marker}{fk_marker}\n"
+            schema_text += "\n"
+        return schema_text
+    
+    def _join_path(self, start: str, goal: str) -> List[str]:
+        """Shortest chain of tables connecting two tables through foreign keys."""
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            if table == goal:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path
+            for neighbor in self.neighbors.get(table, ()):
+                if neighbor not in previous:
+                    previous[neighbor] = table
+                    queue.append(neighbor)
+        return []
+    
+    def mentions(self, question: str) -> Dict[str, Set[str]]:
+        """
+        Find the schema objects a question refers to.
+        
+        Returns:
+            Dictionary with 'tables' (named directly), 'synonyms' (tables named
+            through a synonym) and 'columns' (tables owning a named column)
+        """
+        terms = question_terms(question)
+        synonym_tables = set()
+        for term in terms:
+            for table in self.synonyms.get(term, ()):
+                if table in self.tables:
+                    synonym_tables.add(table)
+        return {
+            'tables': {name for name, table_terms in self._table_terms.items() if table_terms & terms},
+            'synonyms': synonym_tables,
+            'columns': {name for name, column_terms in self._column_terms.items() if column_terms & terms}
+        }
+    
+    def relevant_tables(self, question: str) -> List[str]:
+        """
+        Pick the tables a question needs.
+        
+        Tables named directly (or through a synonym) are selected first and
+        extended with the tables joining them together; if none are named,
+        tables owning a column the question names are used instead. Either
+        way the tables they reference through foreign keys are added.
+        
+        Returns:
+            Table names in schema order, or an empty list when nothing matched
+        """
+        found = self.mentions(question)
+        
+        matched = found['tables'] | found['synonyms']
+        by_column = not matched
+        if by_column:
+            matched = found['columns']
+        if not matched or len(matched) > self.max_column_matches:
+            return []
+        
+        selected = set(matched)
+        if not by_column:
+            # Tables owning the same column name are alternatives, not join partners
+            ordered = sorted(matched)
+            for first, second in zip(ordered, ordered[1:]):
+                selected.update(self._join_path(first, second))
+        for table in matched:
+            selected.update(self.references.get(table, ()))
+        
+        return [name for name in self.tables if name in selected]
+    
+    def prune(self, question: str) -> Dict[str, Any]:
+        """
+        Build the schema text to put in the prompt for a question.
+        
+        Falls back to the full schema when no table matches the question.
+        
+        Returns:
+            Dictionary with 'schema' (prompt text), 'tables' (tables included,
+            None for the full schema) and 'tokens_saved' (estimated prompt tokens
+            saved compared with sending the full schema)
+        """
+        tables = self.relevant_tables(question)
+        if not tables or len(tables) == len(self.tables):
+            return {'schema': self._full_text, 'tables': None, 'tokens_saved': 0}
+        
+        schema = self.render(tables)
+        return {
+            'schema': schema,
+            'tables': tables,
+            'tokens_saved': estimate_tokens(self._full_text) - estimate_tokens(schema)
+        }
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for the SQL Agent and the multi-agent orchestrator
+Replays a fixed question corpus through MultiAgentOrchestrator.query and
+SQLAgent.query, timing routing, SQL generation, execution and summarization
+separately. By default it runs offline against the mock Azure OpenAI server
+and the local Northwind replica, so results are repeatable and can be diffed
+between versions.
+
+Usage:
+    python scripts/benchmark.py --iterations 5 --output before.json
+    python scripts/benchmark.py --iterations 5 --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_openai_server import DEFAULT_CORPUS, MockOpenAIServer
+
+# Stage timings compared by --compare
+COMPARED_PERCENTILES = ('p50', 'p95')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linearly interpolated percentile of the values (0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Count, mean and p50/p95/p99/max of latency samples in milliseconds."""
+    return {
+        'count': len(samples_ms),
+        'mean': round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        'p50': round(percentile(samples_ms, 50), 3),
+        'p95': round(percentile(samples_ms, 95), 3),
+        'p99': round(percentile(samples_ms, 99), 3),
+        'max': round(max(samples_ms), 3) if samples_ms else 0.0
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_revision() -> Optional[str]:
+    """Short commit hash of the working tree, if it is a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer:
+    """Collects wall-clock durations per pipeline stage by wrapping instance methods."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, started: float):
+        """Add the time elapsed since started to a stage."""
+        self.samples[stage].append((time.perf_counter() - started) * 1000)
+
+    def wrap(self, obj: Any, method_name: str, stage: str):
+        """Time every call of obj.method_name (sync or async) as the given stage."""
+        method = getattr(obj, method_name)
+
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.record(stage, started)
+        else:
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.record(stage, started)
+
+        setattr(obj, method_name, timed)
+
+    def reset(self):
+        """Drop all samples, e.g. after the warmup passes."""
+        self.samples.clear()
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the samples of every stage."""
+        return {stage: summarize(samples) for stage, samples in sorted(self.samples.items())}
+
+
+def configure_offline(server: MockOpenAIServer, keep_caches: bool):
+    """Point the agents at the mock server and the local Northwind replica."""
+    os.environ.update({
+        'SQL_OFFLINE': 'true',
+        'AZURE_OPENAI_ENDPOINT': server.url,
+        'AZURE_OPENAI_API_KEY': 'mock',
+        'AZURE_OPENAI_DEPLOYMENT': 'mock-gpt-4o'
+    })
+    if not keep_caches:
+        # Every iteration should exercise every stage
+        os.environ.update({'SQL_CACHE_SIZE': '0', 'SQL_RESULT_CACHE_MB': '0'})
+
+
+def build_system(timer: StageTimer):
+    """Create the SQL Agent and orchestrator with timing wrappers on each stage."""
+    from sql_agent import create_agent_from_env
+    from agents.sql_agent_wrapper import SQLAgentWrapper
+    from agents.orchestrator import create_orchestrator_from_env
+
+    sql_agent = create_agent_from_env()
+    orchestrator = create_orchestrator_from_env(SQLAgentWrapper(sql_agent))
+
+    timer.wrap(orchestrator, '_route_and_speculate', 'route')
+    for method_name, stage in [
+        ('_generate_sql_query', 'sql_generation'),
+        ('_agenerate_sql_query', 'sql_generation'),
+        ('_execute_query', 'sql_execution'),
+        ('_aexecute_query', 'sql_execution'),
+        ('_generate_natural_language_response', 'summary'),
+        ('_agenerate_natural_language_response', 'summary')
+    ]:
+        timer.wrap(sql_agent, method_name, stage)
+    timer.wrap(orchestrator.general_agent, 'process_query', 'general_agent')
+    return sql_agent, orchestrator
+
+
+async def run_target(
+    name: str,
+    ask,
+    questions: List[str],
+    iterations: int,
+    warmup: int,
+    timer: StageTimer
+) -> Dict[str, Any]:
+    """Run every question through one entry point and summarize the timings."""
+    for _ in range(warmup):
+        for question in questions:
+            await ask(question)
+    timer.reset()
+
+    totals = []
+    errors = 0
+    answer_sources = defaultdict(int)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for question in questions:
+            question_started = time.perf_counter()
+            result = await ask(question)
+            totals.append((time.perf_counter() - question_started) * 1000)
+            errors += 0 if result.get('success') else 1
+            answer_sources[result.get('answer_source') or result.get('agent_type') or 'unknown'] += 1
+    wall = time.perf_counter() - started
+
+    stages = timer.report()
+    stages['total'] = summarize(totals)
+    print(f"✅ {name}: {len(totals)} questions in {wall:.2f}s ({len(totals) / wall:.1f} q/s), {errors} error(s)")
+    return {
+        'questions': len(totals),
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'throughput_qps': round(len(totals) / wall, 3) if wall else 0.0,
+        'answer_sources': dict(answer_sources),
+        'stages': stages
+    }
+
+
+def print_report(results: Dict[str, Any]):
+    """Print per-stage percentiles for each target."""
+    for target, data in results['targets'].items():
+        print(f"\n📊 {target}")
+        print(f"   {'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, stats in data['stages'].items():
+            print(
+                f"   {stage:<16}{stats['count']:>7}{stats['p50']:>10.2f}"
+                f"{stats['p95']:>10.2f}{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+            )
+    print("\n🧠 Prompt tokens served from the provider's prompt cache (including warm-up)")
+    for call, stats in results['prompt_cache'].items():
+        if stats['prompt_tokens']:
+            print(f"   {call:<16}{stats['cached_tokens']:>9} / {stats['prompt_tokens']:<9} ({stats['cached_ratio']:.1%})")
+    memory = results['memory']
+    print(f"\n💾 Peak traced allocations: {memory['traced_peak_mb']} MB, peak RSS: {memory['peak_rss_mb']} MB")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """
+    Print stage latency changes against a baseline run.
+    Sub-millisecond stages are noisy, so a slowdown also has to exceed
+    min_delta_ms to count as a regression.
+
+    Returns:
+        Descriptions of the stages that got slower by more than the threshold
+    """
+    regressions = []
+    print(f"\n🔍 Compared with {baseline.get('revision') or 'baseline'} (threshold {threshold:.0%})")
+    for target, data in results['targets'].items():
+        old_stages = baseline.get('targets', {}).get(target, {}).get('stages', {})
+        for stage, stats in data['stages'].items():
+            old = old_stages.get(stage)
+            if not old:
+                continue
+            for key in COMPARED_PERCENTILES:
+                if not old[key]:
+                    continue
+                change = (stats[key] - old[key]) / old[key]
+                slower = change > threshold and stats[key] - old[key] > min_delta_ms
+                marker = "  ⚠️  slower" if slower else ""
+                print(f"   {target}/{stage} {key}: {old[key]:.2f} -> {stats[key]:.2f} ms ({change:+.1%}){marker}")
+                if slower:
+                    regressions.append(f"{target}/{stage} {key} {change:+.1%}")
+    return regressions
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    """Set up the system, run the selected targets and collect the results."""
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    server = None
+    if args.live:
+        from dotenv import load_dotenv
+        load_dotenv()
+    else:
+        server = MockOpenAIServer(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            token_ms=args.token_ms,
+            corpus=args.corpus,
+            seed=0,
+            cache_min_tokens=args.cache_min_tokens
+        ).start()
+        configure_offline(server, args.keep_caches)
+
+    tracemalloc.start()
+    timer = StageTimer()
+    sql_agent, orchestrator = build_system(timer)
+
+    async def ask_orchestrator(question):
+        return await orchestrator.query(question)
+
+    async def ask_sql_agent(question):
+        return sql_agent.query(question)
+
+    targets = {}
+    if args.target in ('both', 'orchestrator'):
+        questions = [entry['question'] for entry in corpus]
+        targets['orchestrator'] = await run_target(
+            'MultiAgentOrchestrator.query', ask_orchestrator, questions, args.iterations, args.warmup, timer
+        )
+    if args.target in ('both', 'sql'):
+        questions = [entry['question'] for entry in corpus if entry.get('agent') == 'sql']
+        targets['sql_agent'] = await run_target(
+            'SQLAgent.query', ask_sql_agent, questions, args.iterations, args.warmup, timer
+        )
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    from metrics import prompt_cache_stats
+    prompt_cache = prompt_cache_stats()
+    sql_agent.close()
+    mock_stats = server.stats() if server else None
+    if server:
+        server.stop()
+
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': {
+            'mode': 'live' if args.live else 'offline',
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'token_ms': args.token_ms,
+            'cache_min_tokens': args.cache_min_tokens,
+            'keep_caches': args.keep_caches,
+            'corpus': os.path.basename(args.corpus)
+        },
+        'targets': targets,
+        'memory': {
+            'traced_peak_mb': round(traced_peak / (1024 * 1024), 2),
+            'peak_rss_mb': peak_rss_mb()
+        },
+        'prompt_cache': prompt_cache,
+        'mock_llm_requests': mock_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark for the SQL Agent pipeline")
+    parser.add_argument('--iterations', type=int, default=3, help="timed passes over the corpus")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed passes before measuring")
+    parser.add_argument('--target', choices=['both', 'orchestrator', 'sql'], default='both')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSON list of {question, agent, sql}")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="mock LLM delay per request")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="mock LLM random extra delay")
+    parser.add_argument('--token-ms', type=float, default=5.0, help="mock LLM delay between streamed chunks")
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help="shortest prompt the mock LLM's prompt cache serves")
+    parser.add_argument('--keep-caches', action='store_true', help="leave the SQL and result caches on")
+    parser.add_argument('--live', action='store_true', help="use Azure OpenAI and Azure SQL from .env instead")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative slowdown reported as a regression")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="smallest absolute slowdown reported")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    print_report(results)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📝 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for the Flask API
+Simulated users replay the question corpus against /api/query, each with its
+own cookie (and therefore its own server-side session), ramping up to the
+target concurrency with a think time between questions. Reports throughput,
+latency percentiles per concurrency level, error rates and the server's RSS
+growth per session. By default the app runs offline in a separate process
+against the mock Azure OpenAI server and the local Northwind replica.
+
+Usage:
+    python scripts/load_test.py --concurrency 50 --ramp-up 30 --duration 60
+    python scripts/load_test.py --url http://localhost:5001 --concurrency 10
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import configure_offline, git_revision, summarize
+from mock_openai_server import DEFAULT_CORPUS, MockOpenAIServer
+
+
+def free_port() -> int:
+    """Ask the OS for an unused local port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(host: str, port: int):
+    """Run app.py on a threaded WSGI server (used for the --serve child process)."""
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server(host, port, app.app, threaded=True)
+    print(f"🚀 Serving app.py on http://{host}:{port}")
+    server.serve_forever()
+
+
+def start_server(port: int, log_path: Optional[str]) -> subprocess.Popen:
+    """Start the app in a child process with the current (offline) environment."""
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)],
+        stdout=log,
+        stderr=subprocess.STDOUT,
+        env=os.environ.copy()
+    )
+
+
+def wait_until_healthy(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    """Poll /api/health until the server answers."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become healthy within {timeout:.0f}s")
+
+
+def server_stats(url: str) -> Optional[Dict[str, Any]]:
+    """Fetch /api/stats without a cookie, so no session is created (None on failure)."""
+    try:
+        response = requests.get(f"{url}/api/stats", timeout=5)
+        return response.json() if response.ok else None
+    except (requests.RequestException, ValueError):
+        return None
+
+
+class LoadTest:
+    """
+    Drives simulated users against /api/query and records every request.
+
+    Users start evenly spread over the ramp-up period and keep asking until the
+    test duration is over. Each user holds a requests.Session, so its cookie
+    and server-side conversation persist across questions.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        questions: List[str],
+        concurrency: int,
+        duration: float,
+        ramp_up: float = 0.0,
+        think_time: float = 0.0,
+        session_requests: int = 0,
+        timeout: float = 60.0,
+        seed: int = 0
+    ):
+        """
+        Initialize the load test.
+
+        Args:
+            url: Base URL of the app
+            questions: Questions to replay; each user starts at a different offset
+            concurrency: Number of simulated users
+            duration: Seconds to run, including the ramp-up
+            ramp_up: Seconds over which users are started
+            think_time: Mean pause between a user's questions (exponentially distributed)
+            session_requests: Start a new session (drop the cookie) after this many
+                questions per user; 0 keeps one session per user
+            timeout: Per-request timeout in seconds
+            seed: Random seed for think times
+        """
+        self.url = url
+        self.questions = questions
+        self.concurrency = concurrency
+        self.duration = duration
+        self.ramp_up = ramp_up
+        self.think_time = think_time
+        self.session_requests = session_requests
+        self.timeout = timeout
+        self.seed = seed
+        self.samples: List[Dict[str, Any]] = []
+        self.active_users = 0
+        self.sessions_started = 0
+        self._lock = threading.Lock()
+        self._started = 0.0
+        self._deadline = 0.0
+
+    def _user(self, user_id: int):
+        """One simulated user: ask questions in turn until the deadline."""
+        delay = self.ramp_up * user_id / self.concurrency
+        time.sleep(delay)
+        rng = random.Random(self.seed + user_id)
+        http = requests.Session()
+        with self._lock:
+            self.active_users += 1
+            self.sessions_started += 1
+
+        asked = 0
+        while time.monotonic() < self._deadline:
+            if self.session_requests and asked and asked % self.session_requests == 0:
+                http.cookies.clear()
+                with self._lock:
+                    self.sessions_started += 1
+
+            question = self.questions[(user_id + asked) % len(self.questions)]
+            with self._lock:
+                active = self.active_users
+            sent = time.monotonic()
+            error = None
+            try:
+                response = http.post(f"{self.url}/api/query", json={'question': question}, timeout=self.timeout)
+                if response.status_code != 200:
+                    error = f"HTTP {response.status_code}"
+                elif not response.json().get('success'):
+                    error = 'query_failed'
+            except requests.Timeout:
+                error = 'timeout'
+            except (requests.RequestException, ValueError) as e:
+                error = type(e).__name__
+            finished = time.monotonic()
+
+            with self._lock:
+                self.samples.append({
+                    'at': round(sent - self._started, 3),
+                    'latency_ms': (finished - sent) * 1000,
+                    'active_users': active,
+                    'error': error
+                })
+            asked += 1
+
+            if self.think_time:
+                time.sleep(min(rng.expovariate(1 / self.think_time), max(self._deadline - time.monotonic(), 0)))
+
+        http.close()
+        with self._lock:
+            self.active_users -= 1
+
+    def run(self, stats_interval: float = 1.0) -> Dict[str, Any]:
+        """
+        Run the test, sampling the server's RSS and session count meanwhile.
+
+        Returns:
+            Dictionary with the request totals, latency summaries (overall and
+            per concurrency level), errors by kind and server memory figures
+        """
+        before = server_stats(self.url)
+        memory_samples = []
+        stop_sampling = threading.Event()
+
+        def sample_server():
+            while not stop_sampling.wait(stats_interval):
+                stats = server_stats(self.url)
+                if stats and stats.get('process'):
+                    memory_samples.append((stats['process'].get('rss_mb'), stats.get('sessions')))
+
+        self._started = time.monotonic()
+        self._deadline = self._started + self.duration
+        sampler = threading.Thread(target=sample_server, name='load-test-stats', daemon=True)
+        sampler.start()
+        users = [
+            threading.Thread(target=self._user, args=(i,), name=f'load-test-user-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        wall = time.monotonic() - self._started
+        stop_sampling.set()
+        sampler.join()
+        after = server_stats(self.url)
+
+        return {
+            **self._summarize(wall),
+            'server': self._memory_report(before, after, memory_samples)
+        }
+
+    def _summarize(self, wall: float) -> Dict[str, Any]:
+        """Totals, latency percentiles and errors of the recorded requests."""
+        latencies = [s['latency_ms'] for s in self.samples]
+        errors = Counter(s['error'] for s in self.samples if s['error'])
+        failed = sum(errors.values())
+
+        # Latency as users are added shows where it starts to collapse
+        step = max(1, self.concurrency // 5)
+        by_level = defaultdict(list)
+        for s in self.samples:
+            level = min(-(-s['active_users'] // step) * step, self.concurrency)
+            by_level[level].append(s['latency_ms'])
+
+        return {
+            'requests': len(self.samples),
+            'errors': failed,
+            'error_rate': round(failed / len(self.samples), 4) if self.samples else 0.0,
+            'errors_by_kind': dict(errors),
+            'wall_seconds': round(wall, 3),
+            'throughput_rps': round(len(self.samples) / wall, 3) if wall else 0.0,
+            'latency_ms': summarize(latencies),
+            'latency_by_concurrency': {
+                str(level): summarize(samples) for level, samples in sorted(by_level.items())
+            },
+            'sessions_started': self.sessions_started
+        }
+
+    @staticmethod
+    def _memory_report(
+        before: Optional[Dict[str, Any]],
+        after: Optional[Dict[str, Any]],
+        samples: List[Any]
+    ) -> Dict[str, Any]:
+        """Server RSS before, at peak and after the run, and growth per new session."""
+        rss_before = (before or {}).get('process', {}).get('rss_mb')
+        rss_after = (after or {}).get('process', {}).get('rss_mb')
+        sessions_before = (before or {}).get('sessions', 0)
+        sessions_after = (after or {}).get('sessions')
+        observed = [rss for rss, _ in samples if rss is not None] + ([rss_after] if rss_after is not None else [])
+        peak = max(observed) if observed else None
+
+        new_sessions = (sessions_after - sessions_before) if sessions_after is not None else None
+        per_session_kb = None
+        if rss_before is not None and rss_after is not None and new_sessions:
+            per_session_kb = round((rss_after - rss_before) * 1024 / new_sessions, 1)
+        return {
+            'rss_before_mb': rss_before,
+            'rss_peak_mb': peak,
+            'rss_after_mb': rss_after,
+            'rss_growth_mb': round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+            'sessions_before': sessions_before,
+            'sessions_after': sessions_after,
+            'rss_growth_per_session_kb': per_session_kb
+        }
+
+
+def print_report(results: Dict[str, Any]):
+    """Print throughput, latency per concurrency level, errors and memory."""
+    latency = results['latency_ms']
+    print(
+        f"\n📊 {results['requests']} requests in {results['wall_seconds']:.1f}s "
+        f"({results['throughput_rps']:.1f} req/s), error rate {results['error_rate']:.2%}"
+    )
+    print(f"   latency ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    print(f"\n   {'users':>7}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for level, stats in results['latency_by_concurrency'].items():
+        print(f"   {level:>7}{stats['count']:>10}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    if results['errors_by_kind']:
+        print(f"\n⚠️  Errors: {', '.join(f'{kind} x{count}' for kind, count in results['errors_by_kind'].items())}")
+
+    server = results['server']
+    if server['rss_before_mb'] is not None:
+        print(
+            f"\n💾 Server RSS {server['rss_before_mb']} -> {server['rss_after_mb']} MB "
+            f"(peak {server['rss_peak_mb']} MB) with {server['sessions_after']} session(s)"
+        )
+        if server['rss_growth_per_session_kb'] is not None:
+            print(f"   ~{server['rss_growth_per_session_kb']} KB per new session")
+
+
+def load_test(args) -> Dict[str, Any]:
+    """Start the mock LLM and the app unless --url is given, then run the test."""
+    with open(args.corpus, encoding='utf-8') as f:
+        questions = [entry['question'] for entry in json.load(f)]
+
+    mock = None
+    process = None
+    url = args.url.rstrip('/') if args.url else None
+    try:
+        if url is None:
+            mock = MockOpenAIServer(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.jitter_ms,
+                corpus=args.corpus,
+                seed=0
+            ).start()
+            configure_offline(mock, keep_caches=not args.no_caches)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = start_server(port, args.server_log)
+        wait_until_healthy(url, args.startup_timeout, process)
+
+        # Initialize the shared orchestrator so its startup cost is not counted per session
+        requests.post(f"{url}/api/query", json={'question': questions[0]}, timeout=args.timeout)
+
+        print(
+            f"🔥 {args.concurrency} user(s) against {url} for {args.duration:.0f}s "
+            f"(ramp-up {args.ramp_up:.0f}s, think time {args.think_time:.1f}s)"
+        )
+        test = LoadTest(
+            url,
+            questions,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            ramp_up=args.ramp_up,
+            think_time=args.think_time,
+            session_requests=args.session_requests,
+            timeout=args.timeout,
+            seed=args.seed
+        )
+        results = test.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if mock is not None:
+            mock.stop()
+
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'mode': 'external' if args.url else 'offline',
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'ramp_up': args.ramp_up,
+            'think_time': args.think_time,
+            'session_requests': args.session_requests,
+            'latency_ms': args.latency_ms,
+            'caches': not args.no_caches,
+            'corpus': os.path.basename(args.corpus)
+        },
+        **results,
+        'mock_llm_requests': mock.stats() if mock else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the Flask API")
+    parser.add_argument('--url', help="test a running app instead of starting one offline")
+    parser.add_argument('--concurrency', type=int, default=20, help="simulated users")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run, including ramp-up")
+    parser.add_argument('--ramp-up', type=float, default=10.0, help="seconds over which users start")
+    parser.add_argument('--think-time', type=float, default=1.0, help="mean pause between a user's questions")
+    parser.add_argument('--session-requests', type=int, default=0, help="new session after this many questions (0: never)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSON list of {question, agent, sql}")
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="mock LLM delay per request")
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help="mock LLM random extra delay")
+    parser.add_argument('--no-caches', action='store_true', help="turn the SQL and result caches off")
+    parser.add_argument('--startup-timeout', type=float, default=60.0, help="seconds to wait for the app")
+    parser.add_argument('--server-log', help="file for the offline app's output")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_test_results.json', help="where to write the JSON results")
+    parser.add_argument('--max-error-rate', type=float, help="fail if the error rate is higher (e.g. 0.01)")
+    parser.add_argument('--max-p95-ms', type=float, help="fail if the p95 latency is higher")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=5001, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve('127.0.0.1', args.port)
+        return
+
+    results = load_test(args)
+    print_report(results)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📝 Results written to {args.output}")
+
+    failures = []
+    if args.max_error_rate is not None and results['error_rate'] > args.max_error_rate:
+        failures.append(f"error rate {results['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    if args.max_p95_ms is not None and results['latency_ms']['p95'] > args.max_p95_ms:
+        failures.append(f"p95 {results['latency_ms']['p95']:.1f} ms > {args.max_p95_ms:.1f} ms")
+    if failures:
+        print(f"\n❌ {'; '.join(failures)}")
+        sys.exit(1)
+    if args.max_error_rate is not None or args.max_p95_ms is not None:
+        print("\n✅ Within limits")
+
+
+if __name__ == '__main__':
+    main()
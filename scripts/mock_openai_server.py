@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Mock Azure OpenAI server for offline benchmarks and load tests
+Answers chat completion requests (plain and streamed) with canned SQL,
+routing decisions and summaries after a configurable delay, so the whole
+pipeline can run without Azure OpenAI.
+
+Usage:
+    python scripts/mock_openai_server.py --port 8090 --latency-ms 200
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8090 AZURE_OPENAI_API_KEY=mock python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Prompt caching as providers do it: prompts of at least 1024 tokens (by
+# default), matched on their prefix in 128-token steps; 4 characters per token
+CHARS_PER_TOKEN = 4
+CACHE_STEP_CHARS = 128 * CHARS_PER_TOKEN
+CACHE_MAX_PREFIXES = 100000
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_questions.json')
+
+# Used for SQL questions the corpus does not know
+DEFAULT_SQL = "SELECT TOP 5 ProductName, UnitPrice FROM Products ORDER BY UnitPrice DESC"
+
+SQL_WORDS = re.compile(
+    r"\b(products?|orders?|customers?|categor(y|ies)|suppliers?|shippers?|employees?|"
+    r"sales|revenue|price|stock|inventory|freight)\b"
+)
+
+SUMMARY_TEXT = (
+    "Based on the query results, here is what the data shows. The rows returned answer "
+    "the question directly, and the figures above are taken from the Northwind database "
+    "as of the latest load. Let me know if you would like a breakdown by another column."
+)
+
+GENERAL_TEXT = (
+    "This is a mock answer from the offline stand-in for Azure OpenAI. It has roughly the "
+    "length of a typical general knowledge answer so that streaming and summarization "
+    "costs are representative when benchmarking the pipeline."
+)
+
+
+def normalize(question: str) -> str:
+    """Lower-case a question and drop punctuation, for corpus lookups."""
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Text of a chat message whose content is a string or a list of parts."""
+    content = message.get('content') or ""
+    if isinstance(content, list):
+        return "".join(part.get('text', "") for part in content if isinstance(part, dict))
+    return content
+
+
+def load_corpus(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Load the question corpus, keyed by normalized question."""
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {normalize(entry['question']): entry for entry in json.load(f)}
+
+
+class MockOpenAIServer:
+    """
+    Threaded HTTP server speaking enough of the Azure OpenAI chat completions API
+    for SQLAgent, the orchestrator's router and the General Agent.
+
+    Requests are told apart by their prompts: SQL generation gets the corpus SQL
+    for the question (or DEFAULT_SQL), routing gets the corpus agent (or a
+    keyword guess), result summaries and general questions get canned text.
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 0.0,
+        token_ms: float = 5.0,
+        corpus: Optional[str] = DEFAULT_CORPUS,
+        seed: Optional[int] = None,
+        cache_min_tokens: int = 1024
+    ):
+        """
+        Initialize the server (call start() to begin serving).
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free port)
+            latency_ms: Delay before every response (time to first token when streaming)
+            jitter_ms: Random extra delay of up to this many milliseconds
+            token_ms: Delay between streamed chunks
+            corpus: JSON question corpus with the SQL and agent per question
+            seed: Random seed for the jitter, for repeatable runs
+            cache_min_tokens: Shortest prompt the emulated prompt cache serves
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.corpus = load_corpus(corpus)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {'sql_generation': 0, 'routing': 0, 'summary': 0, 'general': 0, 'streamed': 0}
+        self.cache_min_chars = cache_min_tokens * CHARS_PER_TOKEN
+        self._prefixes = set()
+        self._cached_tokens = 0
+        self._prompt_tokens = 0
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle delay the body
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as AZURE_OPENAI_ENDPOINT."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockOpenAIServer':
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of requests answered per kind and the prompt tokens served from the cache."""
+        with self._lock:
+            return {
+                **self._counts,
+                'total': sum(v for k, v in self._counts.items() if k != 'streamed'),
+                'prompt_tokens': self._prompt_tokens,
+                'cached_tokens': self._cached_tokens
+            }
+
+    def _cached_prefix(self, prompt: str) -> int:
+        """
+        Characters of the prompt served from the emulated prompt cache.
+
+        The longest prefix seen before, at least cache_min_chars long and
+        extended in CACHE_STEP_CHARS steps, counts as cached; the prompt's own prefixes
+        are remembered for later requests. Caller must hold the lock.
+        """
+        if len(prompt) < self.cache_min_chars:
+            return 0
+        cached = 0
+        for end in range(self.cache_min_chars, len(prompt) + 1, CACHE_STEP_CHARS):
+            digest = hashlib.blake2b(prompt[:end].encode(), digest_size=16).digest()
+            if digest in self._prefixes:
+                cached = end
+            elif len(self._prefixes) < CACHE_MAX_PREFIXES:
+                self._prefixes.add(digest)
+        return cached
+
+    def _answer(self, messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """Pick the kind of request and the text to answer it with."""
+        system = next((message_text(m) for m in messages if m.get('role') == 'system'), "")
+        user = next((message_text(m) for m in reversed(messages) if m.get('role') == 'user'), "")
+
+        if 'SQL expert' in system:
+            entry = self.corpus.get(normalize(user), {})
+            return 'sql_generation', json.dumps({
+                'sql': entry.get('sql') or DEFAULT_SQL,
+                'explanation': "Mock query for benchmarking"
+            })
+
+        if 'query router' in system:
+            match = re.search(r"User question:\s*(.*?)\s*(?:\n|$)", user)
+            question = match.group(1) if match else user
+            entry = self.corpus.get(normalize(question))
+            agent = entry['agent'] if entry else ('sql' if SQL_WORDS.search(question.lower()) else 'general')
+            return 'routing', json.dumps({'agent': agent, 'confidence': 0.9, 'reasoning': "Mock routing decision"})
+
+        if 'database query results' in system:
+            return 'summary', SUMMARY_TEXT
+        return 'general', GENERAL_TEXT
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        """Answer one chat completion request."""
+        if not request.path.split('?')[0].endswith('/chat/completions'):
+            request.send_error(404)
+            return
+        length = int(request.headers.get('Content-Length') or 0)
+        body = json.loads(request.rfile.read(length) or b'{}')
+        kind, content = self._answer(body.get('messages', []))
+        stream = bool(body.get('stream'))
+
+        prompt = "".join(f"{m.get('role')}\n{message_text(m)}\n" for m in body.get('messages', []))
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+
+        with self._lock:
+            self._counts[kind] += 1
+            self._counts['streamed'] += int(stream)
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            cached_tokens = self._cached_prefix(prompt) // CHARS_PER_TOKEN
+            self._prompt_tokens += prompt_tokens
+            self._cached_tokens += cached_tokens
+        time.sleep(delay / 1000)
+
+        completion = {
+            'id': f"chatcmpl-mock-{time.monotonic_ns()}",
+            'created': int(time.time()),
+            'model': body.get('model') or 'mock'
+        }
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': prompt_tokens + len(content) // 4,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        }
+
+        if not stream:
+            payload = json.dumps({
+                **completion,
+                'object': 'chat.completion',
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            }).encode()
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/json')
+            request.send_header('Content-Length', str(len(payload)))
+            request.end_headers()
+            request.wfile.write(payload)
+            return
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+        request.close_connection = True
+        pieces = re.findall(r"\S+\s*", content)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            chunk = {
+                **completion,
+                'object': 'chat.completion.chunk',
+                'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': piece}, 'finish_reason': None}]
+            }
+            request.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            request.wfile.flush()
+        final = {
+            **completion,
+            'object': 'chat.completion.chunk',
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+        }
+        request.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+        if (body.get('stream_options') or {}).get('include_usage'):
+            usage_chunk = {**completion, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage}
+            request.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+        request.wfile.write(b"data: [DONE]\n\n")
+        request.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI server for offline runs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="delay before each response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random extra delay")
+    parser.add_argument('--token-ms', type=float, default=5.0, help="delay between streamed chunks")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="question corpus with SQL per question")
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help="shortest prompt the emulated prompt cache serves")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_ms=args.token_ms,
+        corpus=args.corpus,
+        cache_min_tokens=args.cache_min_tokens
+    )
+    print(f"🧪 Mock Azure OpenAI listening on {server.url} (latency {args.latency_ms:.0f} ms)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+In-memory Redis stand-in for offline multi-worker runs
+Speaks enough of the Redis protocol (RESP2) for the session store: strings
+with expiry, lists and MULTI/EXEC transactions with WATCH. Lets several app
+workers share session state without installing Redis.
+
+Usage:
+    python scripts/mock_redis_server.py --port 6390
+    SESSION_STORE_URL=redis://127.0.0.1:6390/0 FLASK_SECRET_KEY=dev gunicorn -w 4 app:app
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CommandError(Exception):
+    """A command the stand-in rejects, sent back as a RESP error."""
+
+
+# Reply of an EXEC aborted because a watched key changed
+NULL_ARRAY = object()
+
+# Commands that modify their key arguments (all of them for DEL)
+WRITE_COMMANDS = {'SET', 'DEL', 'EXPIRE', 'RPUSH', 'LTRIM'}
+
+
+def encode(value: Any) -> bytes:
+    """Encode a reply; str is a bulk string, except for 'OK' and 'QUEUED' status replies."""
+    if isinstance(value, CommandError):
+        return f"-ERR {value}\r\n".encode()
+    if value is NULL_ARRAY:
+        return b"*-1\r\n"
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return f":{int(value)}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if value in ('OK', 'QUEUED', 'PONG'):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode(item) for item in value)
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+def list_slice(items: List[bytes], start: int, stop: int) -> Tuple[int, int]:
+    """Python slice bounds for Redis's inclusive, possibly negative, start and stop."""
+    length = len(items)
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop = length + stop
+    stop = min(stop, length - 1) + 1
+    if stop <= start:
+        return 0, 0
+    return start, stop
+
+
+class MockRedisServer:
+    """
+    Threaded TCP server holding keys in memory.
+
+    Every command runs under one lock, so commands and transactions are
+    atomic as in Redis. Databases selected with SELECT are kept apart. Each
+    key has a version bumped on every write, so EXEC can tell whether a
+    WATCHed key changed.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, password: Optional[str] = None):
+        """
+        Initialize the server (call start() to begin serving).
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free port)
+            password: Password clients must send with AUTH (None accepts everyone)
+        """
+        self.password = password
+        # db -> key -> [value, expires_at or None]
+        self._data: Dict[int, Dict[bytes, List[Any]]] = {}
+        self._versions: Dict[Tuple[int, bytes], int] = {}
+        self._lock = threading.Lock()
+        self._commands = 0
+        self._thread = None
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server._serve(self)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.tcp = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.tcp.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """URL to use as SESSION_STORE_URL."""
+        host, port = self.tcp.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> 'MockRedisServer':
+        """Serve connections on a background thread."""
+        self._thread = threading.Thread(target=self.tcp.serve_forever, name='mock-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of commands run and keys held."""
+        with self._lock:
+            return {'commands': self._commands, 'keys': sum(len(keys) for keys in self._data.values())}
+
+    def _read_command(self, reader) -> Optional[List[bytes]]:
+        line = reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, e.g. from telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(reader.readline()[1:])
+            args.append(reader.read(length + 2)[:-2])
+        return args
+
+    def _serve(self, handler: socketserver.StreamRequestHandler):
+        state = {'db': 0, 'authenticated': self.password is None, 'queue': None, 'watched': {}}
+        while True:
+            try:
+                args = self._read_command(handler.rfile)
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            try:
+                reply = self._dispatch(state, args)
+            except CommandError as e:
+                reply = e
+            handler.wfile.write(encode(reply))
+
+    def _dispatch(self, state: Dict[str, Any], args: List[bytes]) -> Any:
+        name = args[0].decode().upper()
+        if name == 'AUTH':
+            if args[-1].decode() != (self.password or ''):
+                raise CommandError("invalid password")
+            state['authenticated'] = True
+            return 'OK'
+        if not state['authenticated']:
+            raise CommandError("NOAUTH Authentication required")
+        if name == 'WATCH':
+            if state['queue'] is not None:
+                raise CommandError("WATCH inside MULTI is not allowed")
+            with self._lock:
+                for key in args[1:]:
+                    self._get(state['db'], key)
+                    state['watched'][(state['db'], key)] = self._versions.get((state['db'], key), 0)
+            return 'OK'
+        if name == 'UNWATCH':
+            state['watched'] = {}
+            return 'OK'
+        if name == 'MULTI':
+            state['queue'] = []
+            return 'OK'
+        if name == 'DISCARD':
+            state['queue'], state['watched'] = None, {}
+            return 'OK'
+        if name == 'EXEC':
+            queue, state['queue'] = state['queue'], None
+            watched, state['watched'] = state['watched'], {}
+            if queue is None:
+                raise CommandError("EXEC without MULTI")
+            with self._lock:
+                for db, key in watched:
+                    self._get(db, key)
+                if any(self._versions.get(key, 0) != version for key, version in watched.items()):
+                    return NULL_ARRAY
+                replies = []
+                for queued in queue:
+                    try:
+                        replies.append(self._run(state, queued))
+                    except CommandError as e:
+                        replies.append(e)
+                return replies
+        if state['queue'] is not None:
+            state['queue'].append(args)
+            return 'QUEUED'
+        with self._lock:
+            return self._run(state, args)
+
+    def _keys(self, db: int) -> Dict[bytes, List[Any]]:
+        return self._data.setdefault(db, {})
+
+    def _changed(self, db: int, key: bytes):
+        """Bump a key's version. Caller must hold the lock."""
+        self._versions[(db, key)] = self._versions.get((db, key), 0) + 1
+
+    def _get(self, db: int, key: bytes) -> Optional[List[Any]]:
+        """Entry for a key, dropping it if it has expired. Caller must hold the lock."""
+        entry = self._keys(db).get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._keys(db)[key]
+            self._changed(db, key)
+            return None
+        return entry
+
+    def _run(self, state: Dict[str, Any], args: List[bytes]) -> Any:
+        """Run one command. Caller must hold the lock."""
+        self._commands += 1
+        name, args = args[0].decode().upper(), args[1:]
+        db = state['db']
+        if name in WRITE_COMMANDS:
+            for key in (args if name == 'DEL' else args[:1]):
+                self._changed(db, key)
+        if name == 'PING':
+            return 'PONG'
+        if name == 'SELECT':
+            state['db'] = int(args[0])
+            return 'OK'
+        if name == 'GET':
+            entry = self._get(db, args[0])
+            if entry is not None and isinstance(entry[0], list):
+                raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            return entry[0] if entry else None
+        if name == 'SET':
+            expires_at = None
+            if len(args) >= 4 and args[2].upper() == b'EX':
+                expires_at = time.monotonic() + int(args[3])
+            self._keys(db)[args[0]] = [args[1], expires_at]
+            return 'OK'
+        if name == 'DEL':
+            return sum(1 for key in args if self._get(db, key) is not None and self._keys(db).pop(key))
+        if name == 'EXPIRE':
+            entry = self._get(db, args[0])
+            if entry is None:
+                return 0
+            entry[1] = time.monotonic() + int(args[1])
+            return 1
+        if name == 'DBSIZE':
+            return len(self._keys(db))
+        if name == 'FLUSHDB':
+            for key in self._keys(db):
+                self._changed(db, key)
+            self._keys(db).clear()
+            return 'OK'
+        if name in ('RPUSH', 'LRANGE', 'LTRIM', 'LLEN'):
+            entry = self._get(db, args[0])
+            if entry is not None and not isinstance(entry[0], list):
+                raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            items = entry[0] if entry else []
+            if name == 'RPUSH':
+                if entry is None:
+                    entry = self._keys(db)[args[0]] = [items, None]
+                items.extend(args[1:])
+                return len(items)
+            if name == 'LLEN':
+                return len(items)
+            start, stop = list_slice(items, int(args[1]), int(args[2]))
+            if name == 'LRANGE':
+                return items[start:stop]
+            items[:] = items[start:stop]
+            if not items and entry is not None:
+                del self._keys(db)[args[0]]
+            return 'OK'
+        raise CommandError(f"unknown command '{name}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in for offline runs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--password', default=None, help="require AUTH with this password")
+    args = parser.parse_args()
+
+    server = MockRedisServer(host=args.host, port=args.port, password=args.password)
+    print(f"🧪 Mock Redis listening on {server.url}")
+    try:
+        server.tcp.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.tcp.server_close()
+
+
+if __name__ == '__main__':
+    main()
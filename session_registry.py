@@ -0,0 +1,247 @@
+"""
+Registry of per-session objects for the web app.
+Sessions that stay idle past a TTL are dropped, and the least recently used
+sessions are evicted when a session-count or memory cap is exceeded. Evicted
+sessions are handed to a callback so their resources can be released.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class _Session:
+    """A registered session object with its last use time and measured size."""
+    
+    __slots__ = ('value', 'last_used', 'size')
+    
+    def __init__(self, value: Any, last_used: float, size: int):
+        self.value = value
+        self.last_used = last_used
+        self.size = size
+
+
+class SessionRegistry:
+    """
+    Thread-safe map of session id to session object with idle-TTL and LRU eviction.
+    
+    Sessions are kept in least-recently-used order. Every lookup first drops
+    sessions idle for longer than ``idle_ttl``. When more than
+    ``max_sessions`` sessions, or more than ``max_bytes`` measured bytes, are
+    held, the least recently used sessions are evicted. A session's size comes
+    from ``sizeof``; it is measured when the session is created and again
+    whenever it is touched, e.g. after a request changed it.
+    """
+    
+    def __init__(
+        self,
+        max_sessions: Optional[int] = 1000,
+        idle_ttl: Optional[float] = 1800.0,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any, str], None]] = None
+    ):
+        """
+        Initialize the registry.
+        
+        Args:
+            max_sessions: Maximum number of sessions kept (None for no limit)
+            idle_ttl: Seconds an unused session is kept (None keeps idle sessions)
+            max_bytes: Memory budget for all sessions in bytes (None for no budget)
+            sizeof: Callable returning a session's approximate size in bytes
+            on_evict: Called as on_evict(session_id, session, reason) after a
+                session is removed; reason is 'idle', 'count', 'memory' or
+                'removed', or 'duplicate' for a session created concurrently
+                with another for the same id and never registered
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[Hashable, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.created = 0
+        self.evictions = {'idle': 0, 'count': 0, 'memory': 0, 'removed': 0}
+    
+    def _measure(self, value: Any) -> int:
+        """Size of a session object, 0 if unmeasured or the measurement fails."""
+        if self.sizeof is None:
+            return 0
+        try:
+            return int(self.sizeof(value))
+        except Exception as e:
+            print(f"⚠️  Could not measure session size: {e}")
+            return 0
+    
+    def _pop(self, session_id: Hashable, reason: str, evicted: List[Tuple[Hashable, Any, str]]):
+        """Remove a session and queue it for the eviction callback. Caller must hold the lock."""
+        entry = self._sessions.pop(session_id)
+        self._bytes -= entry.size
+        self.evictions[reason] += 1
+        evicted.append((session_id, entry.value, reason))
+    
+    def _expire_idle(self, now: float, evicted: List[Tuple[Hashable, Any, str]]):
+        """Drop sessions idle past the TTL; they sit at the LRU end. Caller must hold the lock."""
+        if not self.idle_ttl:
+            return
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            self._pop(session_id, 'idle', evicted)
+    
+    def _enforce_limits(self, evicted: List[Tuple[Hashable, Any, str]], keep: Hashable):
+        """Evict LRU sessions beyond the count and memory caps, never `keep`. Caller must hold the lock."""
+        while self.max_sessions and len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._pop(oldest, 'count', evicted)
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._pop(oldest, 'memory', evicted)
+    
+    def _notify(self, evicted: List[Tuple[Hashable, Any, str]]):
+        """Run the eviction callback outside the lock."""
+        if self.on_evict is None:
+            return
+        for session_id, value, reason in evicted:
+            try:
+                self.on_evict(session_id, value, reason)
+            except Exception as e:
+                print(f"⚠️  Error closing evicted session: {e}")
+    
+    def get(self, session_id: Hashable) -> Optional[Any]:
+        """Return the session object and mark it as used, or None if there is none."""
+        return self.get_or_create(session_id, None)
+    
+    def get_or_create(self, session_id: Hashable, factory: Optional[Callable[[], Any]]) -> Optional[Any]:
+        """
+        Return the session object, creating it with factory() if it is missing.
+        
+        factory() runs without the lock, so a slow factory does not hold up
+        other sessions. If another thread registers the same session first,
+        its object is returned and the one built here is handed to on_evict
+        as a 'duplicate'.
+        
+        Args:
+            session_id: Session key (e.g. the id stored in the session cookie)
+            factory: Builds a new session object; None only looks the session up
+        
+        Returns:
+            The session object, or None if it is missing and no factory was given
+        """
+        evicted = []
+        try:
+            with self._lock:
+                now = time.monotonic()
+                self._expire_idle(now, evicted)
+                entry = self._sessions.get(session_id)
+                if entry is not None:
+                    entry.last_used = now
+                    self._sessions.move_to_end(session_id)
+                    return entry.value
+                if factory is None:
+                    return None
+            
+            value = factory()
+            size = self._measure(value)
+            
+            with self._lock:
+                now = time.monotonic()
+                entry = self._sessions.get(session_id)
+                if entry is not None:
+                    # Another request created the session meanwhile; keep theirs
+                    evicted.append((session_id, value, 'duplicate'))
+                    entry.last_used = now
+                    self._sessions.move_to_end(session_id)
+                    return entry.value
+                self._sessions[session_id] = _Session(value, now, size)
+                self._bytes += size
+                self.created += 1
+                self._enforce_limits(evicted, keep=session_id)
+                return value
+        finally:
+            self._notify(evicted)
+    
+    def touch(self, session_id: Hashable):
+        """Re-measure a session after it was used and evict others if a cap is now exceeded."""
+        evicted = []
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            size = self._measure(entry.value)
+            self._bytes += size - entry.size
+            entry.size = size
+            self._enforce_limits(evicted, keep=session_id)
+        self._notify(evicted)
+    
+    def remove(self, session_id: Hashable) -> bool:
+        """
+        Remove a session and pass it to the eviction callback.
+        
+        Returns:
+            True if the session was registered
+        """
+        evicted = []
+        with self._lock:
+            if session_id in self._sessions:
+                self._pop(session_id, 'removed', evicted)
+        self._notify(evicted)
+        return bool(evicted)
+    
+    def sweep(self) -> int:
+        """
+        Drop idle sessions without waiting for the next lookup.
+        
+        Returns:
+            Number of sessions dropped
+        """
+        evicted = []
+        with self._lock:
+            self._expire_idle(time.monotonic(), evicted)
+        self._notify(evicted)
+        return len(evicted)
+    
+    def values(self) -> List[Any]:
+        """Snapshot of the registered session objects."""
+        with self._lock:
+            return [entry.value for entry in self._sessions.values()]
+    
+    def clear(self):
+        """Remove every session, passing each to the eviction callback."""
+        evicted = []
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._pop(session_id, 'removed', evicted)
+        self._notify(evicted)
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __contains__(self, session_id: Hashable) -> bool:
+        return session_id in self._sessions
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the live session count, measured memory and eviction counts."""
+        with self._lock:
+            now = time.monotonic()
+            oldest_idle = now - next(iter(self._sessions.values())).last_used if self._sessions else 0.0
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'largest_session_bytes': max((entry.size for entry in self._sessions.values()), default=0),
+                'idle_ttl_seconds': self.idle_ttl,
+                'oldest_idle_seconds': oldest_idle,
+                'created': self.created,
+                'evictions': dict(self.evictions)
+            }
@@ -0,0 +1,654 @@
+"""
+Out-of-process session state for running several worker processes.
+Conversation turns and the compacted summary of each session are kept in a
+shared SQLite file or a Redis-protocol server, so any worker can serve any
+request of a session.
+"""
+
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from conversation_history import BoundedHistory, compact_summary, serialize_item
+
+
+class SessionStoreError(Exception):
+    """Raised when the session store cannot be reached or answers with an error."""
+
+
+class SessionStore(ABC):
+    """
+    Base class for session state backends.
+    
+    A backend keeps, per session id, an ordered list of JSON-serializable
+    turns bounded to the most recent ones, and a summary string. Sessions not
+    written for ``ttl`` seconds expire.
+    """
+    
+    name = 'base'
+    
+    @abstractmethod
+    def append(self, session_id: str, item: Any, max_items: int, summary_chars: int = 0) -> Tuple[int, List[Any]]:
+        """
+        Append a turn, dropping the oldest beyond max_items (0 keeps all).
+        
+        The dropped turns are folded into the session's summary of at most
+        summary_chars characters (0 leaves the summary alone) in the same
+        atomic step, so concurrent workers never lose each other's turns.
+        
+        Returns:
+            (number of turns now stored, turns dropped to make room)
+        """
+    
+    @abstractmethod
+    def items(self, session_id: str) -> List[Any]:
+        """Return the session's stored turns, oldest first."""
+    
+    @abstractmethod
+    def get_summary(self, session_id: str) -> str:
+        """Return the session's summary ("" if there is none)."""
+    
+    @abstractmethod
+    def set_summary(self, session_id: str, summary: str):
+        """Replace the session's summary."""
+    
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Remove everything stored for the session."""
+    
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return the backend name and its location."""
+    
+    def close(self):
+        """Release connections to the backend."""
+    
+    def history(self, session_id: str, max_items: int = 50, summary_chars: int = 2000) -> 'StoredHistory':
+        """Create a conversation history for the session backed by this store."""
+        return StoredHistory(self, session_id, max_items, summary_chars)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session state in a SQLite file shared by the workers on one host.
+    
+    The database runs in WAL mode so readers do not block the writer; each
+    process keeps one connection.
+    """
+    
+    name = 'sqlite'
+    
+    # Expired sessions are purged every this many writes
+    PURGE_EVERY = 200
+    
+    def __init__(self, path: str, ttl: Optional[float] = 86400.0):
+        """
+        Open (and create if needed) the session database.
+        
+        Args:
+            path: Database file
+            ttl: Seconds a session is kept after its last write (None keeps sessions)
+        """
+        self.path = path
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """This process's connection; a forked worker opens its own. Caller must hold the lock or be in __init__."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables(conn)
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+    
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS session_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                item TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS session_turns_session ON session_turns (session_id, id);
+            CREATE TABLE IF NOT EXISTS session_state (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL
+            );
+        """)
+    
+    def _write(self, statements):
+        """Run statements(cursor) in one immediate transaction and return its result."""
+        with self._lock:
+            try:
+                cursor = self._connection().cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    result = statements(cursor)
+                    cursor.execute("COMMIT")
+                except BaseException:
+                    cursor.execute("ROLLBACK")
+                    raise
+                self._writes += 1
+                if self.ttl and self._writes % self.PURGE_EVERY == 0:
+                    self._purge_expired()
+                return result
+            except sqlite3.Error as e:
+                raise SessionStoreError(f"Session store error: {e}")
+    
+    def _purge_expired(self):
+        """Delete sessions not written within the TTL. Caller must hold the lock."""
+        cutoff = time.time() - self.ttl
+        conn = self._connection()
+        conn.execute(
+            "DELETE FROM session_turns WHERE session_id IN "
+            "(SELECT session_id FROM session_state WHERE updated_at < ?)",
+            (cutoff,)
+        )
+        conn.execute("DELETE FROM session_state WHERE updated_at < ?", (cutoff,))
+    
+    def _touch(self, cursor, session_id: str):
+        cursor.execute(
+            "INSERT INTO session_state (session_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, time.time())
+        )
+    
+    def append(self, session_id: str, item: Any, max_items: int, summary_chars: int = 0) -> Tuple[int, List[Any]]:
+        def statements(cursor):
+            cursor.execute(
+                "INSERT INTO session_turns (session_id, item) VALUES (?, ?)",
+                (session_id, json.dumps(item, default=str))
+            )
+            self._touch(cursor, session_id)
+            count = cursor.execute(
+                "SELECT COUNT(*) FROM session_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            if not max_items or count <= max_items:
+                return count, []
+            evicted = cursor.execute(
+                "SELECT id, item FROM session_turns WHERE session_id = ? ORDER BY id LIMIT ?",
+                (session_id, count - max_items)
+            ).fetchall()
+            cursor.execute(
+                "DELETE FROM session_turns WHERE session_id = ? AND id <= ?", (session_id, evicted[-1][0])
+            )
+            evicted = [json.loads(row[1]) for row in evicted]
+            if summary_chars:
+                summary = cursor.execute(
+                    "SELECT summary FROM session_state WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                cursor.execute(
+                    "UPDATE session_state SET summary = ? WHERE session_id = ?",
+                    (compact_summary(summary, evicted, summary_chars), session_id)
+                )
+            return max_items, evicted
+        
+        return self._write(statements)
+    
+    def _read(self, sql: str, params: tuple) -> List[tuple]:
+        with self._lock:
+            try:
+                return self._connection().execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                raise SessionStoreError(f"Session store error: {e}")
+    
+    def items(self, session_id: str) -> List[Any]:
+        rows = self._read("SELECT item FROM session_turns WHERE session_id = ? ORDER BY id", (session_id,))
+        return [json.loads(row[0]) for row in rows]
+    
+    def get_summary(self, session_id: str) -> str:
+        rows = self._read("SELECT summary FROM session_state WHERE session_id = ?", (session_id,))
+        return rows[0][0] if rows else ""
+    
+    def set_summary(self, session_id: str, summary: str):
+        def statements(cursor):
+            self._touch(cursor, session_id)
+            cursor.execute("UPDATE session_state SET summary = ? WHERE session_id = ?", (summary, session_id))
+        
+        self._write(statements)
+    
+    def delete(self, session_id: str):
+        def statements(cursor):
+            cursor.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            cursor.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+        
+        self._write(statements)
+    
+    def stats(self) -> Dict[str, Any]:
+        sessions = self._read("SELECT COUNT(*) FROM session_state", ())[0][0]
+        return {'backend': self.name, 'path': self.path, 'sessions': sessions, 'ttl_seconds': self.ttl}
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class RESPClient:
+    """
+    Minimal client for the Redis serialization protocol (RESP2).
+    
+    Supports single commands, MULTI/EXEC transactions and optimistic WATCH
+    transactions over a small pool of sockets, which is all the session store
+    needs, without a Redis library.
+    """
+    
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 5.0,
+        max_idle: int = 8
+    ):
+        """
+        Initialize the client (connections are opened on first use).
+        
+        Args:
+            host: Server host
+            port: Server port
+            db: Database number selected on every new connection
+            password: Password sent with AUTH on every new connection
+            timeout: Socket connect and read timeout in seconds
+            max_idle: Idle connections kept for reuse
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: List[Tuple[socket.socket, Any]] = []
+        self._idle_pid = os.getpid()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+    
+    def _read_reply(self, reader) -> Any:
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the session store")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise SessionStoreError(f"Session store error: {payload.decode()}")
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(count)]
+        raise SessionStoreError(f"Unexpected reply from the session store: {line!r}")
+    
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = (sock, sock.makefile('rb'))
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            self._roundtrip(connection, setup)
+        return connection
+    
+    def _roundtrip(self, connection, commands) -> List[Any]:
+        sock, reader = connection
+        sock.sendall(b"".join(self._encode(command) for command in commands))
+        return [self._read_reply(reader) for _ in commands]
+    
+    def _checkout(self) -> Tuple[Tuple[socket.socket, Any], bool]:
+        with self._lock:
+            # Sockets inherited from the parent of a forked worker are not reused
+            if self._idle_pid != os.getpid():
+                self._idle = []
+                self._idle_pid = os.getpid()
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+    
+    def _checkin(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        self._close_connection(connection)
+    
+    @staticmethod
+    def _close_connection(connection):
+        sock, reader = connection
+        try:
+            reader.close()
+            sock.close()
+        except OSError:
+            pass
+    
+    def _run(self, work: Callable[[Tuple[socket.socket, Any]], Any]) -> Any:
+        """Call work(connection) on a pooled connection and return its result."""
+        for attempt in range(2):
+            try:
+                connection, reused = self._checkout()
+            except OSError as e:
+                raise SessionStoreError(f"Cannot reach the session store at {self.host}:{self.port}: {e}")
+            try:
+                result = work(connection)
+            except (OSError, ConnectionError) as e:
+                self._close_connection(connection)
+                # A pooled connection may have been closed by the server; retry once
+                if reused and attempt == 0:
+                    continue
+                raise SessionStoreError(f"Session store connection failed: {e}")
+            except BaseException:
+                # The connection may be left inside WATCH or MULTI
+                self._close_connection(connection)
+                raise
+            self._checkin(connection)
+            return result
+    
+    def pipeline(self, commands, transaction: bool = False) -> List[Any]:
+        """
+        Send several commands in one round trip.
+        
+        Args:
+            commands: Sequence of command tuples, e.g. [('GET', key), ('DEL', key)]
+            transaction: Wrap them in MULTI/EXEC so they apply atomically
+        
+        Returns:
+            One reply per command
+        """
+        commands = list(commands)
+        if transaction:
+            commands = [('MULTI',)] + commands + [('EXEC',)]
+        replies = self._run(lambda connection: self._roundtrip(connection, commands))
+        return replies[-1] if transaction else replies
+    
+    def transaction(self, keys, prepare: Callable[[Callable[..., Any]], Tuple[List[tuple], Any]], attempts: int = 20) -> Tuple[List[Any], Any]:
+        """
+        Run a read-modify-write transaction that retries when its keys change.
+        
+        The keys are WATCHed before prepare's first read. prepare(read) reads
+        the current values with read(*command) and returns (commands, result);
+        the commands are applied with MULTI/EXEC, which the server aborts if
+        another client wrote a watched key since, and prepare then runs again
+        after a short random backoff.
+        
+        Args:
+            keys: Keys the transaction depends on
+            prepare: Builds the commands from the current values
+            attempts: Tries before giving up under contention
+        
+        Returns:
+            (replies to the commands, result returned by prepare)
+        
+        Raises:
+            SessionStoreError: If the keys kept changing for every attempt
+        """
+        def work(connection):
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(random.uniform(0, min(0.001 * 2 ** attempt, 0.05)))
+                watching = []
+                
+                def read(*command):
+                    commands = [command] if watching else [('WATCH', *keys), command]
+                    watching.append(True)
+                    return self._roundtrip(connection, commands)[-1]
+                
+                commands, result = prepare(read)
+                replies = self._roundtrip(connection, [('MULTI',)] + list(commands) + [('EXEC',)])
+                if replies[-1] is not None:
+                    return replies[-1], result
+            raise SessionStoreError(f"Session store keys kept changing after {attempts} attempts")
+        
+        return self._run(work)
+    
+    def execute(self, *args) -> Any:
+        """Send one command and return its reply."""
+        return self.pipeline([args])[0]
+    
+    def close(self):
+        """Close the pooled connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close_connection(connection)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session state on a Redis-protocol server shared by workers on any host.
+    
+    Each session has a list of JSON turns and a summary string under
+    ``<prefix><session id>:turns`` and ``:summary``; both expire ``ttl``
+    seconds after the last write.
+    """
+    
+    name = 'redis'
+    
+    def __init__(self, url: str, ttl: Optional[float] = 86400.0, prefix: str = 'sqlagent:session:'):
+        """
+        Initialize the store.
+        
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            ttl: Seconds a session is kept after its last write (None keeps sessions)
+            prefix: Key prefix for every session key
+        """
+        parsed = urlparse(url)
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+        self.client = RESPClient(
+            host=parsed.hostname or '127.0.0.1',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=unquote(parsed.password) if parsed.password else None
+        )
+    
+    def _key(self, session_id: str, part: str) -> str:
+        return f"{self.prefix}{session_id}:{part}"
+    
+    def append(self, session_id: str, item: Any, max_items: int, summary_chars: int = 0) -> Tuple[int, List[Any]]:
+        key = self._key(session_id, 'turns')
+        summary_key = self._key(session_id, 'summary')
+        value = json.dumps(item, default=str)
+        
+        def prepare(read):
+            commands = [('RPUSH', key, value)]
+            evicted = []
+            if max_items:
+                # Once the new turn is pushed, everything but the newest max_items goes
+                evicted = [json.loads(turn) for turn in read('LRANGE', key, 0, -max_items)]
+                commands.append(('LTRIM', key, -max_items, -1))
+            if self.ttl:
+                commands.append(('EXPIRE', key, self.ttl))
+            if evicted and summary_chars:
+                summary = compact_summary(read('GET', summary_key) or "", evicted, summary_chars)
+                commands.append(('SET', summary_key, summary) + (('EX', self.ttl) if self.ttl else ()))
+            return commands, evicted
+        
+        replies, evicted = self.client.transaction([key, summary_key], prepare)
+        length = replies[0]
+        return (min(length, max_items) if max_items else length), evicted
+    
+    def items(self, session_id: str) -> List[Any]:
+        return [json.loads(value) for value in self.client.execute('LRANGE', self._key(session_id, 'turns'), 0, -1)]
+    
+    def get_summary(self, session_id: str) -> str:
+        return self.client.execute('GET', self._key(session_id, 'summary')) or ""
+    
+    def set_summary(self, session_id: str, summary: str):
+        key = self._key(session_id, 'summary')
+        if self.ttl:
+            self.client.execute('SET', key, summary, 'EX', self.ttl)
+        else:
+            self.client.execute('SET', key, summary)
+    
+    def delete(self, session_id: str):
+        self.client.execute('DEL', self._key(session_id, 'turns'), self._key(session_id, 'summary'))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'address': f"{self.client.host}:{self.client.port}/{self.client.db}",
+            'ttl_seconds': self.ttl
+        }
+    
+    def close(self):
+        self.client.close()
+
+
+class StoredHistory:
+    """
+    Conversation history of one session kept in a SessionStore.
+    
+    Offers the BoundedHistory interface the orchestrator uses. Turns beyond
+    ``max_items`` are folded into the stored summary; nothing is held in the
+    worker's memory, so another worker can continue the conversation. Store
+    failures are logged instead of failing the request: a turn that cannot be
+    recorded is dropped, a history that cannot be read is empty, and a history
+    that cannot be cleared is left as it was.
+    """
+    
+    def __init__(self, store: SessionStore, session_id: str, max_items: int = 50, summary_chars: int = 2000):
+        """
+        Initialize the history.
+        
+        Args:
+            store: Backend holding the turns
+            session_id: Session the turns belong to
+            max_items: Turns kept in the store (0 keeps everything)
+            summary_chars: Size of the summary of older turns (0 disables it)
+        """
+        self.store = store
+        self.session_id = session_id
+        self.max_items = max_items
+        self.summary_chars = summary_chars
+        self._length = 0
+        self._compacted = 0
+    
+    def new_empty(self) -> BoundedHistory:
+        """Create an empty in-process history with the same limits."""
+        return BoundedHistory(self.max_items, self.summary_chars)
+    
+    def append(self, item: Any):
+        """Record a turn, folding turns beyond the limit into the summary."""
+        try:
+            self._length, evicted = self.store.append(
+                self.session_id, serialize_item(item), self.max_items, self.summary_chars
+            )
+            self._compacted += len(evicted)
+        except SessionStoreError as e:
+            print(f"⚠️  Could not record conversation turn: {e}")
+    
+    def extend(self, items):
+        """Record several turns in order."""
+        for item in items:
+            self.append(item)
+    
+    @property
+    def summary(self) -> str:
+        """Compact text summary of turns no longer stored ("" if the store cannot be read)."""
+        try:
+            return self.store.get_summary(self.session_id)
+        except SessionStoreError as e:
+            print(f"⚠️  Could not read conversation summary: {e}")
+            return ""
+    
+    def all(self) -> List[Any]:
+        """Every stored turn, oldest first ([] if the store cannot be read)."""
+        try:
+            return self.store.items(self.session_id)
+        except SessionStoreError as e:
+            print(f"⚠️  Could not read conversation history: {e}")
+            return []
+    
+    def clear(self):
+        """Delete the session's turns and summary from the store."""
+        try:
+            self.store.delete(self.session_id)
+        except SessionStoreError as e:
+            print(f"⚠️  Could not clear conversation history: {e}")
+            return
+        self._length = 0
+        self._compacted = 0
+    
+    def close(self):
+        """Nothing to release: the turns outlive this worker's copy of the session."""
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the last known turn count; the turns take no worker memory."""
+        return {
+            'items': self._length,
+            'max_items': self.max_items,
+            'bytes': 0,
+            'compacted': self._compacted,
+            'spilled': 0,
+            'store': self.store.name
+        }
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    def __iter__(self):
+        return iter(self.all())
+    
+    def __getitem__(self, index):
+        return self.all()[index]
+
+
+def create_session_store(url: Optional[str], ttl: Optional[float] = 86400.0) -> Optional[SessionStore]:
+    """
+    Create the session store described by a URL.
+    
+    Args:
+        url: sqlite:///relative/path.db, sqlite:////absolute/path.db or
+            redis://[:password@]host[:port][/db]; None or "" keeps session
+            state in worker memory
+        ttl: Seconds a session is kept after its last write
+    
+    Returns:
+        SessionStore, or None for in-process state
+    
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):], ttl=ttl)
+    if url.startswith(('redis://', 'resp://')):
+        return RedisSessionStore(url, ttl=ttl)
+    raise ValueError(f"Unsupported session store URL: {url}")
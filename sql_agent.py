@@ -4,12 +4,87 @@ This agent can query Azure SQL Database using natural language.
 """
 
 import os
+import copy
+import asyncio
 import pyodbc
-from typing import List, Dict, Any, Optional
-from openai import AzureOpenAI
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Optional, Tuple
+from openai import AzureOpenAI, AsyncAzureOpenAI
 import json
-import struct
-from azure.identity import DefaultAzureCredential, AzureCliCredential
+from connection_pool import ConnectionPool
+from result_set import RowStream, iter_dicts
+from schema_index import SchemaIndex
+from answer_templates import template_answer
+from question_patterns import PatternRegistry, quote_identifier
+from local_engine import LocalEngine, LocalQueryError
+from metrics import RESULT_BYTES, RESULT_ROWS, record_prompt_usage, result_outcome, timed_stage
+from sql_guard import SQLGuardError, guard_sql
+from token_provider import TokenProvider, get_token_provider
+from conversation_history import BoundedHistory
+from query_cache import (
+    LRUCache,
+    normalize_question,
+    normalize_sql,
+    referenced_tables,
+    schema_fingerprint
+)
+
+
+# Schema and sample data used by the offline mode
+DEFAULT_SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'northwind.sql')
+
+RESPONSE_ERROR_PREFIX = "Error generating response:"
+
+
+class _SchemaSnapshot:
+    """The loaded schema: prompt text, index and the fingerprint cached SQL is keyed by."""
+    
+    __slots__ = ('info', 'index', 'fingerprint')
+    
+    def __init__(self, info: str, index: SchemaIndex):
+        self.info = info
+        self.index = index
+        self.fingerprint = schema_fingerprint(info)
+
+
+class _SharedSchema:
+    """Holder of the current schema snapshot, shared by an agent and all its sessions."""
+    
+    __slots__ = ('snapshot',)
+    
+    def __init__(self, snapshot: _SchemaSnapshot):
+        self.snapshot = snapshot
+
+# Static prompt prefixes, byte-identical across requests so provider-side
+# prompt caching applies; per-request text is appended after them
+SQL_GENERATION_PROMPT = """You are a SQL expert assistant. Your task is to convert natural language questions into SQL queries for a Microsoft SQL Server database.
+
+Guidelines:
+- Generate valid T-SQL queries for Microsoft SQL Server
+- Use proper table and column names from the schema below
+- Include appropriate JOINs when needed
+- Use TOP instead of LIMIT for row limiting
+- Format the query for readability
+- If the question is ambiguous, make reasonable assumptions
+- Only generate SELECT queries for safety (no INSERT, UPDATE, DELETE)
+- Return your response as JSON with two fields: "sql" (the query) and "explanation" (brief explanation of what the query does)
+
+Example response format:
+{
+    "sql": "SELECT * FROM Products WHERE UnitPrice > 20",
+    "explanation": "This query retrieves all products with a unit price greater than 20"
+}
+
+"""
+
+RESPONSE_PROMPT = """You are a helpful assistant that explains database query results in natural language.
+Given a user's question, the SQL query that was executed, and the results, provide a clear, concise answer in natural language.
+Focus on answering the user's original question directly."""
+
+
+def response_outcome(response: str) -> str:
+    """Metrics outcome of a natural language response, which reports errors in its text."""
+    return 'error' if response.startswith(RESPONSE_ERROR_PREFIX) else 'success'
 
 
 class SQLAgent:
@@ -25,7 +100,34 @@ class SQLAgent:
         azure_openai_api_key: str = None,
         azure_openai_deployment: str = None,
         azure_openai_api_version: str = "2024-08-01-preview",
-        use_azure_ad: bool = True
+        use_azure_ad: bool = True,
+        pool_size: int = 5,
+        pool_max_idle: float = 300.0,
+        pool_max_lifetime: float = 1800.0,
+        pool_timeout: float = 30.0,
+        sql_cache_size: int = 256,
+        sql_cache_ttl: float = 3600.0,
+        result_cache_bytes: int = 64 * 1024 * 1024,
+        result_cache_ttl: float = 300.0,
+        max_rows: int = 1000,
+        max_result_bytes: int = 16 * 1024 * 1024,
+        fetch_size: int = 200,
+        db_workers: int = None,
+        schema_pruning: bool = True,
+        schema_synonyms: Dict[str, List[str]] = None,
+        template_answers: bool = True,
+        sql_patterns: bool = True,
+        sql_patterns_file: str = None,
+        query_timeout: int = 30,
+        local_tables: List[str] = None,
+        local_seed_file: str = None,
+        local_refresh_interval: float = 300.0,
+        offline: bool = False,
+        history_limit: int = 50,
+        history_summary_chars: int = 2000,
+        token_provider: TokenProvider = None,
+        token_refresh_margin: float = 300.0,
+        stream_usage: bool = True
     ):
         """Initialize the SQL Agent with database and Azure OpenAI credentials."""
         self.sql_server = sql_server
@@ -34,14 +136,44 @@ class SQLAgent:
         self.sql_password = sql_password
         self.use_azure_ad = use_azure_ad or (sql_username is None and sql_password is None)
         
+        # Offline mode answers every query from the local replica and never
+        # connects to Azure SQL
+        self.offline = offline
+        
+        # Pooled connections, reused across schema fetches and queries
+        self._token_struct = None
+        self.token_provider = None
+        self.pool = ConnectionPool(
+            self._get_connection,
+            max_size=pool_size,
+            max_idle=pool_max_idle,
+            max_lifetime=pool_max_lifetime,
+            timeout=pool_timeout
+        )
+        
         # Initialize Azure OpenAI client
         self.client = AzureOpenAI(
             azure_endpoint=azure_openai_endpoint,
             api_key=azure_openai_api_key,
             api_version=azure_openai_api_version
         )
+        self.async_client = AsyncAzureOpenAI(
+            azure_endpoint=azure_openai_endpoint,
+            api_key=azure_openai_api_key,
+            api_version=azure_openai_api_version
+        )
         self.deployment = azure_openai_deployment
         
+        # Ask for token usage at the end of streamed responses (stream_options)
+        self.stream_usage = stream_usage
+        
+        # Dedicated threads for blocking ODBC calls from the async pipeline,
+        # sized to the pool so every worker can hold a connection
+        self.db_executor = ThreadPoolExecutor(
+            max_workers=db_workers or pool_size,
+            thread_name_prefix="sql-agent-db"
+        )
+        
         # Build connection string based on auth type
         if self.use_azure_ad:
             # Azure AD authentication
@@ -53,16 +185,16 @@ class SQLAgent:
                 f"TrustServerCertificate=no;"
                 f"Connection Timeout=30;"
             )
-            # Get Azure AD token
-            try:
-                credential = AzureCliCredential()
-                token = credential.get_token("https://database.windows.net/.default")
-                self.token_bytes = token.token.encode("utf-16-le")
-                self.token_struct = struct.pack(f'<I{len(self.token_bytes)}s', len(self.token_bytes), self.token_bytes)
-            except Exception as e:
-                print(f"Warning: Could not get Azure AD token: {e}")
-                print("Falling back to environment variables if available...")
-                self.token_struct = None
+            # Get Azure AD token (not needed offline). The provider is shared by
+            # the process and refreshes the token in the background before it
+            # expires; refreshed tokens are applied through the token_struct setter.
+            self.token_struct = None
+            if not offline:
+                self.token_provider = token_provider or get_token_provider(refresh_margin=token_refresh_margin)
+                self.token_struct = self.token_provider.get_token()
+                self.token_provider.subscribe(self._apply_token)
+                if self.token_struct is None:
+                    print("Falling back to environment variables if available...")
         else:
             # SQL authentication
             self.connection_string = (
@@ -77,14 +209,146 @@ class SQLAgent:
             )
             self.token_struct = None
         
-        # Get database schema on initialization
-        self.schema_info = self._get_database_schema()
+        # Ceilings for streamed query results
+        self.max_rows = max_rows
+        self.max_result_bytes = max_result_bytes
+        self.fetch_size = fetch_size
+        
+        # Seconds a query may run before the driver cancels it (0 for no limit)
+        self.query_timeout = query_timeout
+        
+        # Answer simple result shapes without a second LLM call
+        self.template_answers = template_answers
+        
+        # Compile recurring question shapes straight to SQL without the LLM
+        self.pattern_registry = PatternRegistry() if sql_patterns else None
+        if self.pattern_registry is not None and sql_patterns_file:
+            try:
+                count = self.pattern_registry.load_file(sql_patterns_file)
+                print(f"✅ Loaded {count} question pattern(s) from {sql_patterns_file}")
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Could not load question patterns from {sql_patterns_file}: {e}")
         
-        # Conversation history
-        self.conversation_history: List[Dict[str, str]] = []
+        # Cache of generated SQL keyed by normalized question and schema fingerprint
+        self.sql_cache = LRUCache(max_entries=sql_cache_size, ttl=sql_cache_ttl)
+        
+        # Cache of query results keyed by normalized SQL, bounded by approximate bytes
+        self.result_cache = LRUCache(
+            max_entries=10000 if result_cache_bytes > 0 else 0,
+            ttl=result_cache_ttl,
+            max_bytes=result_cache_bytes
+        )
+        
+        # Optional in-process replica of small, rarely changing tables; offline
+        # it holds the whole database, loaded from the seed script
+        self.local_engine = None
+        if offline or local_tables:
+            self.local_engine = LocalEngine(
+                tables=None if offline or '*' in local_tables else local_tables,
+                seed_file=local_seed_file or (DEFAULT_SEED_FILE if offline else None),
+                snapshot=self._snapshot_tables,
+                refresh_interval=local_refresh_interval
+            )
+        if offline:
+            self._load_local_engine()
+        
+        # Get database schema on initialization, indexed so SQL generation
+        # prompts only carry the tables a question needs
+        self.schema_pruning = schema_pruning
+        self.schema_synonyms = schema_synonyms
+        self._schema = _SharedSchema(self._get_database_schema())
+        
+        # Snapshots of live tables need the schema
+        if self.local_engine is not None and not offline:
+            self._load_local_engine()
+        
+        # Conversation history: recent turns, older ones compacted into a summary
+        self.conversation_history = BoundedHistory(history_limit, history_summary_chars)
+    
+    @property
+    def schema_info(self) -> str:
+        """Rendered schema used in SQL generation prompts."""
+        return self._schema.snapshot.info
+    
+    @property
+    def schema_index(self) -> SchemaIndex:
+        """Index of the loaded schema, used for pruning and question patterns."""
+        return self._schema.snapshot.index
+    
+    @property
+    def schema_fingerprint(self) -> str:
+        """Hash of the rendered schema that keys the SQL generation cache."""
+        return self._schema.snapshot.fingerprint
+    
+    @property
+    def token_struct(self) -> Optional[bytes]:
+        """Packed Azure AD access token used to open new connections."""
+        return self._token_struct
+    
+    @token_struct.setter
+    def token_struct(self, value: Optional[bytes]):
+        """Replace the access token and retire connections opened with the old one."""
+        replaced = self._token_struct is not None and value != self._token_struct
+        self._token_struct = value
+        if replaced:
+            self.pool.invalidate()
+    
+    def _apply_token(self, token_struct: bytes):
+        """Use a token refreshed by the token provider for new connections."""
+        self.token_struct = token_struct
+    
+    def get_token_stats(self) -> Optional[Dict[str, Any]]:
+        """Return Azure AD token refresh statistics, or None without a token provider."""
+        if self.token_provider is None:
+            return None
+        return self.token_provider.stats()
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Return connection pool statistics (size, waits, checkout latency)."""
+        return self.pool.stats()
+    
+    def get_sql_cache_stats(self) -> Dict[str, Any]:
+        """Return SQL generation cache statistics (size, hits, misses)."""
+        return self.sql_cache.stats()
+    
+    def invalidate_sql_cache(self):
+        """Drop all cached SQL generations, e.g. after the schema has changed."""
+        self.sql_cache.clear()
+    
+    def get_pattern_stats(self) -> Optional[Dict[str, Any]]:
+        """Return question pattern statistics (hits per pattern, LLM fallbacks)."""
+        return self.pattern_registry.stats() if self.pattern_registry else None
+    
+    def get_local_engine_stats(self) -> Optional[Dict[str, Any]]:
+        """Return local engine statistics (tables, replica age, served and fallback counts)."""
+        return self.local_engine.stats() if self.local_engine else None
+    
+    def get_result_cache_stats(self) -> Dict[str, Any]:
+        """Return result cache statistics (entries, bytes, hits, misses)."""
+        return self.result_cache.stats()
+    
+    def invalidate_table(self, table_name: str) -> int:
+        """
+        Drop cached results of every query that reads the given table.
+        Returns the number of cached results removed.
+        """
+        name = table_name.strip().strip('[]').split('.')[-1].strip('[]').lower()
+        return self.result_cache.invalidate_tag(name)
+    
+    def refresh_schema(self):
+        """
+        Reload the database schema and invalidate SQL generated for the old one.
+        The new schema replaces the old one in a single step, for this agent
+        and every session created from it.
+        """
+        self._schema.snapshot = self._get_database_schema()
+        self.invalidate_sql_cache()
     
     def _get_connection(self):
-        """Get a database connection with appropriate authentication."""
+        """Open a new database connection with appropriate authentication."""
+        if self.use_azure_ad and self.token_provider is not None and self.token_struct is None:
+            # The token could not be fetched at startup; the provider retries at most every retry_interval
+            self.token_struct = self.token_provider.get_token()
         if self.use_azure_ad and self.token_struct:
             # Connect with Azure AD token
             SQL_COPT_SS_ACCESS_TOKEN = 1256  # Connection option for access token
@@ -94,159 +358,426 @@ class SQLAgent:
             conn = pyodbc.connect(self.connection_string)
         return conn
     
-    def _get_database_schema(self) -> str:
+    def get_schema_summary(self) -> str:
+        """Return a compact list of the tables, for prompts that do not need columns."""
+        if not self.schema_index.tables:
+            return self.schema_info
+        return self.schema_index.summary()
+    
+    def _get_database_schema(self) -> _SchemaSnapshot:
         """Retrieve the database schema to help with query generation."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Get tables and columns
-            schema_query = """
-            SELECT 
-                t.TABLE_NAME,
-                c.COLUMN_NAME,
-                c.DATA_TYPE,
-                c.IS_NULLABLE,
-                CASE WHEN pk.COLUMN_NAME IS NOT NULL THEN 'YES' ELSE 'NO' END AS IS_PRIMARY_KEY
-            FROM INFORMATION_SCHEMA.TABLES t
-            LEFT JOIN INFORMATION_SCHEMA.COLUMNS c ON t.TABLE_NAME = c.TABLE_NAME
-            LEFT JOIN (
-                SELECT ku.TABLE_NAME, ku.COLUMN_NAME
-                FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
-                JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku
-                    ON tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
-                WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
-            ) pk ON c.TABLE_NAME = pk.TABLE_NAME AND c.COLUMN_NAME = pk.COLUMN_NAME
-            WHERE t.TABLE_TYPE = 'BASE TABLE'
-            ORDER BY t.TABLE_NAME, c.ORDINAL_POSITION
-            """
-            
-            cursor.execute(schema_query)
-            rows = cursor.fetchall()
-            
-            # Build schema description
-            schema_dict = {}
-            for row in rows:
-                table_name = row.TABLE_NAME
-                if table_name not in schema_dict:
-                    schema_dict[table_name] = []
-                
-                column_info = {
-                    'name': row.COLUMN_NAME,
-                    'type': row.DATA_TYPE,
-                    'nullable': row.IS_NULLABLE,
-                    'primary_key': row.IS_PRIMARY_KEY
-                }
-                schema_dict[table_name].append(column_info)
-            
-            # Format schema as text
-            schema_text = "Database Schema:\n\n"
-            for table_name, columns in schema_dict.items():
-                schema_text += f"Table: {table_name}\n"
-                for col in columns:
-                    pk_marker = " (PRIMARY KEY)" if col['primary_key'] == 'YES' else ""
-                    schema_text += f"  - {col['name']}: {col['type']}{pk_marker}\n"
-                schema_text += "\n"
-            
-            cursor.close()
-            conn.close()
-            
-            return schema_text
+            if self.offline:
+                if not self.local_engine.ready:
+                    raise LocalQueryError("The local replica is not loaded")
+                schema_index = SchemaIndex(
+                    self.local_engine.tables,
+                    self.local_engine.foreign_keys,
+                    synonyms=self.schema_synonyms
+                )
+            else:
+                with self.pool.connection() as conn:
+                    schema_index = self._load_schema(conn)
+            return _SchemaSnapshot(schema_index.render(), schema_index)
+        except Exception as e:
+            return _SchemaSnapshot(f"Error retrieving schema: {str(e)}", SchemaIndex({}, []))
+    
+    def _load_schema(self, conn) -> SchemaIndex:
+        """Query INFORMATION_SCHEMA on the given connection and index tables and foreign keys."""
+        cursor = conn.cursor()
+        
+        # Get tables and columns
+        schema_query = """
+        SELECT 
+            t.TABLE_NAME,
+            c.COLUMN_NAME,
+            c.DATA_TYPE,
+            c.IS_NULLABLE,
+            CASE WHEN pk.COLUMN_NAME IS NOT NULL THEN 'YES' ELSE 'NO' END AS IS_PRIMARY_KEY
+        FROM INFORMATION_SCHEMA.TABLES t
+        LEFT JOIN INFORMATION_SCHEMA.COLUMNS c ON t.TABLE_NAME = c.TABLE_NAME
+        LEFT JOIN (
+            SELECT ku.TABLE_NAME, ku.COLUMN_NAME
+            FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+            JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku
+                ON tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
+            WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+        ) pk ON c.TABLE_NAME = pk.TABLE_NAME AND c.COLUMN_NAME = pk.COLUMN_NAME
+        WHERE t.TABLE_TYPE = 'BASE TABLE'
+        ORDER BY t.TABLE_NAME, c.ORDINAL_POSITION
+        """
+        
+        cursor.execute(schema_query)
+        rows = cursor.fetchall()
+        
+        # Build schema description
+        schema_dict = {}
+        for row in rows:
+            table_name = row.TABLE_NAME
+            if table_name not in schema_dict:
+                schema_dict[table_name] = []
             
+            column_info = {
+                'name': row.COLUMN_NAME,
+                'type': row.DATA_TYPE,
+                'nullable': row.IS_NULLABLE,
+                'primary_key': row.IS_PRIMARY_KEY
+            }
+            schema_dict[table_name].append(column_info)
+        
+        # Get foreign keys, so pruned prompts keep the tables needed for joins
+        fk_query = """
+        SELECT 
+            fk.TABLE_NAME,
+            fk.COLUMN_NAME,
+            pk.TABLE_NAME AS REF_TABLE_NAME,
+            pk.COLUMN_NAME AS REF_COLUMN_NAME
+        FROM INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS rc
+        JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE fk
+            ON rc.CONSTRAINT_NAME = fk.CONSTRAINT_NAME
+        JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE pk
+            ON rc.UNIQUE_CONSTRAINT_NAME = pk.CONSTRAINT_NAME
+            AND fk.ORDINAL_POSITION = pk.ORDINAL_POSITION
+        """
+        
+        cursor.execute(fk_query)
+        foreign_keys = [
+            {
+                'table': row.TABLE_NAME,
+                'column': row.COLUMN_NAME,
+                'ref_table': row.REF_TABLE_NAME,
+                'ref_column': row.REF_COLUMN_NAME
+            }
+            for row in cursor.fetchall()
+        ]
+        
+        cursor.close()
+        
+        return SchemaIndex(schema_dict, foreign_keys, synonyms=self.schema_synonyms)
+    
+    def _load_local_engine(self):
+        """Build the local replica, leaving queries to Azure SQL if that fails."""
+        try:
+            self.local_engine.load()
+            tables = self.local_engine.stats()['tables']
+            print(f"✅ Local engine serving {len(tables)} table(s): {', '.join(tables)}")
         except Exception as e:
-            return f"Error retrieving schema: {str(e)}"
+            print(f"⚠️  Could not load the local engine: {e}")
+    
+    def _snapshot_tables(self, table_names: Optional[List[str]]) -> Dict[str, Tuple[List[Dict[str, Any]], List[Any]]]:
+        """Copy tables (all tables when None) from the live database for the local engine."""
+        by_name = {name.lower(): name for name in self.schema_index.tables}
+        snapshot = {}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            for requested in table_names or list(self.schema_index.tables):
+                name = by_name.get(requested.lower())
+                if name is None:
+                    continue
+                cursor.execute(f"SELECT * FROM {quote_identifier(name)}")
+                columns = {column['name']: column for column in self.schema_index.tables[name]}
+                snapshot[name] = (
+                    [columns.get(d[0], {'name': d[0], 'type': 'sql_variant'}) for d in cursor.description],
+                    cursor.fetchall()
+                )
+            cursor.close()
+        return snapshot
+    
+    def _schema_for_question(self, user_question: str) -> Dict[str, Any]:
+        """
+        Pick the schema text for a SQL generation prompt.
+        Returns the pruned schema with the tables it covers and the estimated
+        prompt tokens saved, or the full schema when pruning is off or unavailable.
+        """
+        if not self.schema_pruning or not self.schema_index.tables:
+            return {'schema': self.schema_info, 'tables': None, 'tokens_saved': 0}
+        return self.schema_index.prune(user_question)
+    
+    def _sql_generation_request(self, user_question: str, schema_text: str) -> Dict[str, Any]:
+        """Build the chat completion request that turns a question into SQL."""
+        # Static instructions first so the prompt prefix is identical across
+        # requests and the provider's prompt cache can serve it
+        system_message = SQL_GENERATION_PROMPT + schema_text
+        
+        return {
+            'model': self.deployment,
+            'messages': [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_question}
+            ],
+            'temperature': 0.1,
+            'max_tokens': 1000,
+            'response_format': {"type": "json_object"}
+        }
+    
+    def _parse_sql_generation(
+        self,
+        content: str,
+        cache_key: tuple,
+        schema: Dict[str, Any],
+        cache: bool = True
+    ) -> Dict[str, Any]:
+        """Parse the model's JSON answer and cache a successful generation."""
+        result = json.loads(content)
+        generation = {
+            'success': True,
+            'sql': result.get('sql', ''),
+            'explanation': result.get('explanation', ''),
+            'schema_tables': schema['tables'],
+            'prompt_tokens_saved': schema['tokens_saved'],
+            'pattern': None,
+            'error': None
+        }
+        if cache and generation['sql']:
+            self.sql_cache.put(cache_key, generation)
+        return {**generation, 'cached': False}
     
+    @staticmethod
+    def _sql_generation_error(error: Exception) -> Dict[str, Any]:
+        """Build the result for a failed SQL generation."""
+        return {
+            'success': False,
+            'sql': None,
+            'explanation': None,
+            'schema_tables': None,
+            'prompt_tokens_saved': 0,
+            'pattern': None,
+            'error': f"Error generating SQL: {str(error)}",
+            'cached': False
+        }
+    
+    def _compile_sql_pattern(self, user_question: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        """Build the SQL locally if the question matches a registered pattern."""
+        if self.pattern_registry is None or not self.schema_index.tables:
+            return None
+        compiled = self.pattern_registry.compile(user_question, self.schema_index, record=record)
+        if compiled is None:
+            return None
+        return {
+            'success': True,
+            'sql': compiled['sql'],
+            'explanation': compiled['explanation'],
+            'schema_tables': None,
+            'prompt_tokens_saved': 0,
+            'pattern': compiled['pattern'],
+            'error': None,
+            'cached': False
+        }
+    
+    @timed_stage('sql_generation', outcome=result_outcome)
     def _generate_sql_query(self, user_question: str) -> Dict[str, Any]:
         """Use Azure OpenAI to generate SQL query from natural language."""
         
-        system_message = f"""You are a SQL expert assistant. Your task is to convert natural language questions into SQL queries for a Microsoft SQL Server database.
-
-{self.schema_info}
-
-Guidelines:
-- Generate valid T-SQL queries for Microsoft SQL Server
-- Use proper table and column names from the schema above
-- Include appropriate JOINs when needed
-- Use TOP instead of LIMIT for row limiting
-- Format the query for readability
-- If the question is ambiguous, make reasonable assumptions
-- Only generate SELECT queries for safety (no INSERT, UPDATE, DELETE)
-- Return your response as JSON with two fields: "sql" (the query) and "explanation" (brief explanation of what the query does)
-
-Example response format:
-{{
-    "sql": "SELECT * FROM Products WHERE UnitPrice > 20",
-    "explanation": "This query retrieves all products with a unit price greater than 20"
-}}
-"""
+        # Recurring question shapes are compiled locally
+        compiled = self._compile_sql_pattern(user_question)
+        if compiled is not None:
+            return compiled
+        
+        # Repeated questions against the same schema reuse the earlier generation
+        cache_key = (normalize_question(user_question), self.schema_fingerprint)
+        cached = self.sql_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'cached': True}
         
         try:
+            schema = self._schema_for_question(user_question)
             response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_question}
-                ],
-                temperature=0.1,
-                max_tokens=1000,
-                response_format={"type": "json_object"}
+                **self._sql_generation_request(user_question, schema['schema'])
             )
+            record_prompt_usage('sql_generation', getattr(response, 'usage', None))
+            return self._parse_sql_generation(response.choices[0].message.content, cache_key, schema)
             
-            result = json.loads(response.choices[0].message.content)
-            return {
-                'success': True,
-                'sql': result.get('sql', ''),
-                'explanation': result.get('explanation', ''),
-                'error': None
-            }
+        except Exception as e:
+            return self._sql_generation_error(e)
+    
+    @timed_stage('sql_generation', outcome=result_outcome)
+    async def _agenerate_sql_query(self, user_question: str, speculative: bool = False) -> Dict[str, Any]:
+        """
+        Async variant of _generate_sql_query using the async OpenAI client.
+        A speculative generation may be thrown away, so it leaves the pattern
+        statistics and the SQL cache alone; record_sql_generation() applies
+        both once it is used.
+        """
+        compiled = self._compile_sql_pattern(user_question, record=not speculative)
+        if compiled is not None:
+            return compiled
+        
+        cache_key = (normalize_question(user_question), self.schema_fingerprint)
+        cached = self.sql_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'cached': True}
+        
+        try:
+            schema = self._schema_for_question(user_question)
+            response = await self.async_client.chat.completions.create(
+                **self._sql_generation_request(user_question, schema['schema'])
+            )
+            record_prompt_usage('sql_generation', getattr(response, 'usage', None))
+            return self._parse_sql_generation(
+                response.choices[0].message.content, cache_key, schema, cache=not speculative
+            )
             
         except Exception as e:
-            return {
-                'success': False,
-                'sql': None,
-                'explanation': None,
-                'error': f"Error generating SQL: {str(e)}"
-            }
+            return self._sql_generation_error(e)
+    
+    def record_sql_generation(self, user_question: str, generation: Dict[str, Any]):
+        """
+        Count and cache a speculative SQL generation that is being used.
+        
+        Args:
+            user_question: The question the SQL was generated for
+            generation: Result of _agenerate_sql_query(..., speculative=True)
+        """
+        if self.pattern_registry is not None and self.schema_index.tables:
+            self.pattern_registry.record(generation['pattern'])
+        if generation['success'] and generation['sql'] and generation['pattern'] is None and not generation['cached']:
+            cache_key = (normalize_question(user_question), self.schema_fingerprint)
+            self.sql_cache.put(cache_key, {k: v for k, v in generation.items() if k != 'cached'})
+    
+    def _guard_query(self, sql_query: str) -> Tuple[str, List[str]]:
+        """
+        Check a query before it runs and bound the rows it can return.
+        The query may return one row above max_rows so truncation can still be detected.
+        Raises SQLGuardError for anything but a single read-only SELECT.
+        """
+        return guard_sql(sql_query, self.max_rows or None, detect_truncation=True)
+    
+    @staticmethod
+    def _rejected_query(sql_query: str, error: SQLGuardError) -> Dict[str, Any]:
+        """Build the result for a query the guard refused to run."""
+        return {
+            'success': False,
+            'sql': sql_query,
+            'sql_rewrites': [],
+            'columns': None,
+            'types': None,
+            'rows': None,
+            'row_count': 0,
+            'truncated': False,
+            'error': f"Query rejected: {str(error)}",
+            'engine': None,
+            'cached': False
+        }
     
+    @timed_stage('sql_execution', outcome=result_outcome)
     def _execute_query(self, sql_query: str) -> Dict[str, Any]:
         """Execute the SQL query and return results."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Execute the query
-            cursor.execute(sql_query)
-            
-            # Get column names
-            columns = [column[0] for column in cursor.description]
-            
-            # Fetch results
-            rows = cursor.fetchall()
-            
-            # Convert to list of dictionaries
-            results = []
-            for row in rows:
-                results.append(dict(zip(columns, row)))
-            
-            cursor.close()
-            conn.close()
+            sql_query, rewrites = self._guard_query(sql_query)
+        except SQLGuardError as e:
+            return self._rejected_query(sql_query, e)
+        
+        # Identical SQL from repeat questions or other sessions is served from memory
+        cache_key = normalize_sql(sql_query)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            query_results = {**cached, 'cached': True}
+        else:
+            query_results = self._fetch_results(sql_query, cache_key)
+        return {**query_results, 'sql': sql_query, 'sql_rewrites': rewrites}
+    
+    @timed_stage('sql_execution', outcome=result_outcome)
+    async def _aexecute_query(self, sql_query: str) -> Dict[str, Any]:
+        """
+        Async variant of _execute_query.
+        Cache hits are answered on the event loop; database work runs on the
+        agent's dedicated DB executor so it never occupies the default pool.
+        """
+        try:
+            sql_query, rewrites = self._guard_query(sql_query)
+        except SQLGuardError as e:
+            return self._rejected_query(sql_query, e)
+        
+        cache_key = normalize_sql(sql_query)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            query_results = {**cached, 'cached': True}
+        else:
+            loop = asyncio.get_running_loop()
+            query_results = await loop.run_in_executor(
+                self.db_executor, self._fetch_results, sql_query, cache_key
+            )
+        return {**query_results, 'sql': sql_query, 'sql_rewrites': rewrites}
+    
+    @staticmethod
+    def _failed_results(error: str, engine: str) -> Dict[str, Any]:
+        """Build the result for a query that failed to run."""
+        return {
+            'success': False,
+            'columns': None,
+            'types': None,
+            'rows': None,
+            'row_count': 0,
+            'truncated': False,
+            'error': error,
+            'engine': engine,
+            'cached': False
+        }
+    
+    def _fetch_results(self, sql_query: str, cache_key: str) -> Dict[str, Any]:
+        """Run the query on a pooled connection and cache the results."""
+        # Queries reading only replicated tables run in-process; anything the
+        # local engine cannot translate falls through to Azure SQL
+        if self.local_engine is not None and (self.offline or self.local_engine.can_serve(sql_query)):
+            try:
+                local_results = self.local_engine.execute(
+                    sql_query,
+                    max_rows=self.max_rows,
+                    max_bytes=self.max_result_bytes,
+                    chunk_size=self.fetch_size
+                )
+                RESULT_ROWS.observe(local_results['row_count'], engine='local')
+                RESULT_BYTES.observe(local_results['bytes'], engine='local')
+                return {'success': True, **local_results, 'error': None, 'engine': 'local', 'cached': False}
+            except LocalQueryError as e:
+                if self.offline:
+                    return self._failed_results(f"Error executing query locally: {str(e)}", 'local')
+        
+        try:
+            with self.pool.connection() as conn:
+                # Applies to cursors created from here on; pooled connections
+                # may have been used with another timeout
+                conn.timeout = self.query_timeout
+                cursor = conn.cursor()
+                
+                # Execute the query
+                cursor.execute(sql_query)
+                
+                # Stream rows in chunks, stopping at the row/byte ceiling. The
+                # rows are kept as a list bounded by that ceiling: they are
+                # cached, read again for the LLM prompt and the response, and
+                # the connection goes back to the pool before the LLM call
+                stream = RowStream(
+                    cursor,
+                    max_rows=self.max_rows,
+                    max_bytes=self.max_result_bytes,
+                    chunk_size=self.fetch_size
+                )
+                rows = list(stream)
+                
+                cursor.close()
             
-            return {
+            query_results = {
                 'success': True,
-                'data': results,
-                'row_count': len(results),
-                'columns': columns,
-                'error': None
+                'columns': stream.columns,
+                'types': stream.types,
+                'rows': rows,
+                'row_count': stream.row_count,
+                'truncated': stream.truncated,
+                'bytes': stream.bytes_read,
+                'error': None,
+                'engine': 'azure_sql'
             }
+            RESULT_ROWS.observe(stream.row_count, engine='azure_sql')
+            RESULT_BYTES.observe(stream.bytes_read, engine='azure_sql')
+            self.result_cache.put(cache_key, query_results, tags=referenced_tables(sql_query))
+            return {**query_results, 'cached': False}
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'row_count': 0,
-                'columns': None,
-                'error': f"Error executing query: {str(e)}"
-            }
+            error = f"Error executing query: {str(e)}"
+            if 'HYT00' in str(e):
+                error = f"Query cancelled after exceeding the {self.query_timeout}s timeout"
+            return self._failed_results(error, 'azure_sql')
     
     def _format_results_for_llm(self, results: Dict[str, Any]) -> str:
         """Format query results for LLM to generate natural language response."""
@@ -257,32 +788,36 @@ Example response format:
             return "No results found."
         
         # Format as text
-        formatted = f"Found {results['row_count']} result(s):\n\n"
-        for i, row in enumerate(results['data'][:10], 1):  # Limit to first 10 rows
+        at_least = "at least " if results['truncated'] else ""
+        formatted = f"Found {at_least}{results['row_count']} result(s):\n\n"
+        rows = iter_dicts(results['columns'], results['rows'], limit=10)  # Limit to first 10 rows
+        for i, row in enumerate(rows, 1):
             formatted += f"Row {i}:\n"
             for key, value in row.items():
                 formatted += f"  {key}: {value}\n"
             formatted += "\n"
         
         if results['row_count'] > 10:
-            formatted += f"... and {results['row_count'] - 10} more rows\n"
+            formatted += f"... and {at_least}{results['row_count'] - 10} more rows\n"
         
         return formatted
     
-    def _generate_natural_language_response(
+    def _template_response(self, query_results: Dict[str, Any]) -> Optional[str]:
+        """Phrase a simple result (scalar, one row, no rows, short list) without the LLM."""
+        if not self.template_answers:
+            return None
+        return template_answer(query_results)
+    
+    def _response_request(
         self, 
         user_question: str, 
         sql_query: str, 
         query_results: Dict[str, Any]
-    ) -> str:
-        """Generate a natural language response based on query results."""
+    ) -> Dict[str, Any]:
+        """Build the chat completion request asking the LLM to explain query results."""
         
         results_text = self._format_results_for_llm(query_results)
         
-        system_message = """You are a helpful assistant that explains database query results in natural language.
-Given a user's question, the SQL query that was executed, and the results, provide a clear, concise answer in natural language.
-Focus on answering the user's original question directly."""
-        
         user_message = f"""User Question: {user_question}
 
 SQL Query Executed:
@@ -293,21 +828,137 @@ Query Results:
 
 Please provide a natural language answer to the user's question based on these results."""
         
+        return {
+            'model': self.deployment,
+            'messages': [
+                {"role": "system", "content": RESPONSE_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            'temperature': 0.7,
+            'max_tokens': 500
+        }
+    
+    @timed_stage('summary', outcome=response_outcome)
+    def _generate_natural_language_response(
+        self, 
+        user_question: str, 
+        sql_query: str, 
+        query_results: Dict[str, Any]
+    ) -> str:
+        """Generate a natural language response based on query results."""
         try:
             response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.7,
-                max_tokens=500
+                **self._response_request(user_question, sql_query, query_results)
             )
+            record_prompt_usage('summary', getattr(response, 'usage', None))
             
             return response.choices[0].message.content
             
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            return f"{RESPONSE_ERROR_PREFIX} {str(e)}"
+    
+    @timed_stage('summary', outcome=response_outcome)
+    async def _agenerate_natural_language_response(
+        self, 
+        user_question: str, 
+        sql_query: str, 
+        query_results: Dict[str, Any]
+    ) -> str:
+        """Async variant of _generate_natural_language_response."""
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._response_request(user_question, sql_query, query_results)
+            )
+            record_prompt_usage('summary', getattr(response, 'usage', None))
+            
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            return f"{RESPONSE_ERROR_PREFIX} {str(e)}"
+    
+    @timed_stage('summary', outcome=response_outcome)
+    async def _astream_natural_language_response(
+        self, 
+        user_question: str, 
+        sql_query: str, 
+        query_results: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        """Generate the natural language response, yielding text as tokens arrive."""
+        try:
+            stream = await self.async_client.chat.completions.create(
+                **self._response_request(user_question, sql_query, query_results),
+                stream=True,
+                # Passed through extra_body: the pinned SDK predates stream_options
+                extra_body={'stream_options': {'include_usage': True}} if self.stream_usage else None
+            )
+            
+            async for chunk in stream:
+                # Azure sends a leading chunk with content filter results and no choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # The last chunk carries the usage and no choices
+                if getattr(chunk, 'usage', None) is not None:
+                    record_prompt_usage('summary', chunk.usage)
+            
+        except Exception as e:
+            yield f"{RESPONSE_ERROR_PREFIX} {str(e)}"
+    
+    def _sql_generation_failed(self, user_question: str, sql_generation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the query() result for a question whose SQL could not be generated."""
+        return {
+            'success': False,
+            'question': user_question,
+            'sql': None,
+            'explanation': None,
+            'columns': None,
+            'types': None,
+            'rows': None,
+            'row_count': 0,
+            'truncated': False,
+            'response': sql_generation['error'],
+            'error': sql_generation['error']
+        }
+    
+    def _complete_query(
+        self,
+        user_question: str,
+        sql_generation: Dict[str, Any],
+        query_results: Dict[str, Any],
+        nl_response: str,
+        answer_source: str
+    ) -> Dict[str, Any]:
+        """Record the turn in the conversation history and build the query() result."""
+        # The guard may have rewritten the generated SQL before it ran
+        sql_query = query_results.get('sql') or sql_generation['sql']
+        
+        # Add to conversation history
+        self.conversation_history.append({
+            'question': user_question,
+            'sql': sql_query,
+            'response': nl_response
+        })
+        
+        return {
+            'success': query_results['success'],
+            'question': user_question,
+            'sql': sql_query,
+            'explanation': sql_generation['explanation'],
+            'columns': query_results['columns'],
+            'types': query_results['types'],
+            'rows': query_results['rows'],
+            'row_count': query_results['row_count'],
+            'truncated': query_results['truncated'],
+            'sql_cached': sql_generation['cached'],
+            'result_cached': query_results['cached'],
+            'engine': query_results.get('engine'),
+            'schema_tables': sql_generation['schema_tables'],
+            'sql_pattern': sql_generation['pattern'],
+            'sql_rewrites': query_results.get('sql_rewrites', []),
+            'prompt_tokens_saved': 0 if sql_generation['cached'] else sql_generation['prompt_tokens_saved'],
+            'response': nl_response,
+            'answer_source': answer_source,
+            'error': query_results.get('error')
+        }
     
     def query(self, user_question: str) -> Dict[str, Any]:
         """
@@ -318,57 +969,162 @@ Please provide a natural language answer to the user's question based on these r
         sql_generation = self._generate_sql_query(user_question)
         
         if not sql_generation['success']:
-            return {
-                'success': False,
-                'question': user_question,
-                'sql': None,
-                'explanation': None,
-                'results': None,
-                'response': sql_generation['error'],
-                'error': sql_generation['error']
-            }
+            return self._sql_generation_failed(user_question, sql_generation)
         
         sql_query = sql_generation['sql']
-        explanation = sql_generation['explanation']
         
         # Step 2: Execute query
         query_results = self._execute_query(sql_query)
         
-        # Step 3: Generate natural language response
-        if query_results['success']:
-            nl_response = self._generate_natural_language_response(
-                user_question, 
-                sql_query, 
-                query_results
-            )
+        # Step 3: Generate natural language response (simple results need no LLM)
+        answer_source = 'template'
+        if not query_results['success']:
+            nl_response = f"I encountered an error executing the query: {query_results['error']}"
+            answer_source = 'error'
         else:
+            nl_response = self._template_response(query_results)
+            if nl_response is None:
+                nl_response = self._generate_natural_language_response(
+                    user_question, 
+                    sql_query, 
+                    query_results
+                )
+                answer_source = 'llm'
+        
+        return self._complete_query(user_question, sql_generation, query_results, nl_response, answer_source)
+    
+    async def aquery(
+        self,
+        user_question: str,
+        sql_generation: Optional[Awaitable[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of query().
+        LLM calls use the async OpenAI client and database work runs on the
+        dedicated DB executor, so an in-flight question costs a coroutine
+        rather than a thread. A SQL generation started ahead of time (e.g.
+        speculatively, while routing) can be passed in as sql_generation.
+        """
+        # Step 1: Generate SQL query
+        sql_generation = await (sql_generation or self._agenerate_sql_query(user_question))
+        
+        if not sql_generation['success']:
+            return self._sql_generation_failed(user_question, sql_generation)
+        
+        sql_query = sql_generation['sql']
+        
+        # Step 2: Execute query
+        query_results = await self._aexecute_query(sql_query)
+        
+        # Step 3: Generate natural language response (simple results need no LLM)
+        answer_source = 'template'
+        if not query_results['success']:
             nl_response = f"I encountered an error executing the query: {query_results['error']}"
+            answer_source = 'error'
+        else:
+            nl_response = self._template_response(query_results)
+            if nl_response is None:
+                nl_response = await self._agenerate_natural_language_response(
+                    user_question, 
+                    sql_query, 
+                    query_results
+                )
+                answer_source = 'llm'
         
-        # Add to conversation history
-        self.conversation_history.append({
-            'question': user_question,
-            'sql': sql_query,
-            'response': nl_response
-        })
+        return self._complete_query(user_question, sql_generation, query_results, nl_response, answer_source)
+    
+    async def aquery_stream(
+        self,
+        user_question: str,
+        sql_generation: Optional[Awaitable[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Process a natural language question, yielding each stage as it completes.
         
-        return {
-            'success': query_results['success'],
-            'question': user_question,
+        Yields (event, data) tuples in order: 'sql' with the generated query and
+        explanation, 'rows' with the query results, 'token' for each piece of the
+        natural language answer, and finally 'done' with the same dictionary
+        query() returns. sql_generation is as for aquery().
+        """
+        # Step 1: Generate SQL query
+        sql_generation = await (sql_generation or self._agenerate_sql_query(user_question))
+        
+        if not sql_generation['success']:
+            yield 'done', self._sql_generation_failed(user_question, sql_generation)
+            return
+        
+        sql_query = sql_generation['sql']
+        yield 'sql', {
             'sql': sql_query,
-            'explanation': explanation,
-            'results': query_results['data'] if query_results['success'] else None,
-            'row_count': query_results['row_count'],
-            'response': nl_response,
-            'error': query_results.get('error')
+            'explanation': sql_generation['explanation'],
+            'sql_cached': sql_generation['cached']
         }
+        
+        # Step 2: Execute query
+        query_results = await self._aexecute_query(sql_query)
+        if query_results['success']:
+            yield 'rows', query_results
+        
+        # Step 3: Stream natural language response (simple results need no LLM)
+        answer_source = 'template'
+        if not query_results['success']:
+            nl_response = f"I encountered an error executing the query: {query_results['error']}"
+            answer_source = 'error'
+        else:
+            nl_response = self._template_response(query_results)
+            if nl_response is not None:
+                yield 'token', {'text': nl_response}
+            else:
+                parts = []
+                async for text in self._astream_natural_language_response(user_question, sql_query, query_results):
+                    parts.append(text)
+                    yield 'token', {'text': text}
+                nl_response = "".join(parts)
+                answer_source = 'llm'
+        
+        yield 'done', self._complete_query(user_question, sql_generation, query_results, nl_response, answer_source)
     
     def get_conversation_history(self) -> List[Dict[str, str]]:
         """Return the conversation history."""
-        return self.conversation_history
+        return list(self.conversation_history)
+    
+    def get_history_stats(self) -> Dict[str, Any]:
+        """Return the size and compaction counts of the conversation history."""
+        return self.conversation_history.stats()
+    
+    def new_session(self) -> 'SQLAgent':
+        """
+        Create a lightweight agent for a new conversation.
+        The returned agent shares this agent's OpenAI client, connection pool
+        and schema (including later refreshes), and only owns its own
+        conversation history.
+        """
+        session = copy.copy(self)
+        session.conversation_history = self.conversation_history.new_empty()
+        return session
     
     def clear_history(self):
         """Clear the conversation history."""
-        self.conversation_history = []
+        self.conversation_history.clear()
+    
+    def close(self):
+        """Shut down the DB executor and close pooled connections and the local replica."""
+        self.db_executor.shutdown(wait=False)
+        self.pool.close()
+        if self.local_engine is not None:
+            self.local_engine.close()
+
+
+def _load_schema_synonyms(path: Optional[str]) -> Optional[Dict[str, List[str]]]:
+    """Load extra schema synonyms ({"word": ["Table", ...]}) from a JSON file."""
+    if not path:
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not load schema synonyms from {path}: {e}")
+        return None
 
 
 def create_agent_from_env() -> SQLAgent:
@@ -381,5 +1137,31 @@ def create_agent_from_env() -> SQLAgent:
         azure_openai_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT'),
         azure_openai_api_key=os.getenv('AZURE_OPENAI_API_KEY'),
         azure_openai_deployment=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
-        azure_openai_api_version=os.getenv('AZURE_OPENAI_API_VERSION', '2024-08-01-preview')
+        azure_openai_api_version=os.getenv('AZURE_OPENAI_API_VERSION', '2024-08-01-preview'),
+        pool_size=int(os.getenv('SQL_POOL_SIZE', '5')),
+        pool_max_idle=float(os.getenv('SQL_POOL_MAX_IDLE', '300')),
+        pool_max_lifetime=float(os.getenv('SQL_POOL_MAX_LIFETIME', '1800')),
+        pool_timeout=float(os.getenv('SQL_POOL_TIMEOUT', '30')),
+        sql_cache_size=int(os.getenv('SQL_CACHE_SIZE', '256')),
+        sql_cache_ttl=float(os.getenv('SQL_CACHE_TTL', '3600')),
+        result_cache_bytes=int(float(os.getenv('SQL_RESULT_CACHE_MB', '64')) * 1024 * 1024),
+        result_cache_ttl=float(os.getenv('SQL_RESULT_CACHE_TTL', '300')),
+        max_rows=int(os.getenv('SQL_MAX_ROWS', '1000')),
+        max_result_bytes=int(float(os.getenv('SQL_MAX_RESULT_MB', '16')) * 1024 * 1024),
+        fetch_size=int(os.getenv('SQL_FETCH_SIZE', '200')),
+        db_workers=int(os.getenv('SQL_DB_WORKERS', '0')) or None,
+        schema_pruning=os.getenv('SQL_SCHEMA_PRUNING', 'true').lower() == 'true',
+        schema_synonyms=_load_schema_synonyms(os.getenv('SQL_SCHEMA_SYNONYMS_FILE')),
+        template_answers=os.getenv('SQL_TEMPLATE_ANSWERS', 'true').lower() == 'true',
+        sql_patterns=os.getenv('SQL_PATTERNS', 'true').lower() == 'true',
+        sql_patterns_file=os.getenv('SQL_PATTERNS_FILE'),
+        query_timeout=int(os.getenv('SQL_QUERY_TIMEOUT', '30')),
+        local_tables=[t.strip() for t in os.getenv('SQL_LOCAL_TABLES', '').split(',') if t.strip()] or None,
+        local_seed_file=os.getenv('SQL_LOCAL_SEED_FILE'),
+        local_refresh_interval=float(os.getenv('SQL_LOCAL_REFRESH', '300')),
+        offline=os.getenv('SQL_OFFLINE', 'false').lower() == 'true',
+        history_limit=int(os.getenv('HISTORY_MAX_TURNS', '50')),
+        history_summary_chars=int(os.getenv('HISTORY_SUMMARY_CHARS', '2000')),
+        token_refresh_margin=float(os.getenv('SQL_TOKEN_REFRESH_MARGIN', '300')),
+        stream_usage=os.getenv('AZURE_OPENAI_STREAM_USAGE', 'true').lower() == 'true'
     )
@@ -0,0 +1,260 @@
+"""
+Pre-execution guard for generated SQL.
+Rejects anything that is not a single read-only SELECT and injects or tightens
+row limits (TOP / OFFSET FETCH), recording every change so it can be audited.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+
+class SQLGuardError(Exception):
+    """Raised when a query is not allowed to run."""
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<string>N?'(?:[^']|'')*')
+  | (?P<ident>\[(?:[^\]]|\]\])*\]|"(?:[^"]|"")*")
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<word>[A-Za-z_@#][\w@#$]*)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.S | re.X)
+
+# Keywords that write data, change schema or settings, or reach outside the database
+FORBIDDEN_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'TRUNCATE', 'DROP', 'ALTER', 'CREATE',
+    'GRANT', 'REVOKE', 'DENY', 'EXEC', 'EXECUTE', 'INTO', 'DECLARE', 'SET', 'USE',
+    'BACKUP', 'RESTORE', 'DBCC', 'SHUTDOWN', 'KILL', 'WAITFOR', 'BULK', 'RECONFIGURE',
+    'OPENROWSET', 'OPENQUERY', 'OPENDATASOURCE', 'BEGIN', 'COMMIT', 'ROLLBACK'
+}
+
+AGGREGATE_FUNCTIONS = {
+    'COUNT', 'COUNT_BIG', 'SUM', 'AVG', 'MIN', 'MAX', 'STDEV', 'STDEVP', 'VAR', 'VARP'
+}
+
+SET_OPERATORS = {'UNION', 'EXCEPT', 'INTERSECT'}
+
+
+class Token:
+    """A significant SQL token with its position and parenthesis depth."""
+    
+    __slots__ = ('kind', 'text', 'upper', 'start', 'end', 'depth')
+    
+    def __init__(self, kind: str, text: str, start: int, end: int, depth: int):
+        self.kind = kind
+        self.text = text
+        self.upper = text.upper() if kind == 'word' else text
+        self.start = start
+        self.end = end
+        self.depth = depth
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into significant tokens (no whitespace or comments)."""
+    tokens = []
+    depth = 0
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('space', 'comment'):
+            continue
+        text = match.group()
+        if text == ')':
+            depth = max(depth - 1, 0)
+        tokens.append(Token(kind, text, match.start(), match.end(), depth))
+        if text == '(':
+            depth += 1
+    return tokens
+
+
+def _strip_comments(sql: str) -> Tuple[str, bool]:
+    """Replace comments with a space. Returns the new text and whether anything was removed."""
+    removed = False
+    
+    def replace(match):
+        nonlocal removed
+        if match.lastgroup == 'comment':
+            removed = True
+            return " "
+        return match.group()
+    
+    return _TOKEN_RE.sub(replace, sql), removed
+
+
+def limit_value(tokens: List[Token], i: int) -> Tuple[int, int, int]:
+    """
+    Read a row count written as ``5`` or ``(5)`` starting at tokens[i].
+    
+    Returns:
+        (value, start offset, end offset), or (-1, -1, -1) if it is not a literal
+    """
+    if i < len(tokens) and tokens[i].kind == 'number' and tokens[i].text.isdigit():
+        return int(tokens[i].text), tokens[i].start, tokens[i].end
+    if (
+        i + 2 < len(tokens)
+        and tokens[i].text == '('
+        and tokens[i + 1].kind == 'number' and tokens[i + 1].text.isdigit()
+        and tokens[i + 2].text == ')'
+    ):
+        return int(tokens[i + 1].text), tokens[i].start, tokens[i + 2].end
+    return -1, -1, -1
+
+
+def _closing_paren(tokens: List[Token], i: int) -> int:
+    """Index of the ')' matching the '(' at tokens[i], or -1 if it is unbalanced."""
+    for j in range(i + 1, len(tokens)):
+        if tokens[j].text == ')' and tokens[j].depth == tokens[i].depth:
+            return j
+    return -1
+
+
+def _is_scalar_aggregate(select_items: List[Token], has_group_by: bool) -> bool:
+    """Check whether a select list only holds aggregates, so the query returns one row."""
+    if has_group_by or not select_items:
+        return False
+    if any(t.upper == 'OVER' for t in select_items):
+        # Window aggregates such as COUNT(*) OVER () return one value per row
+        return False
+    item_starts = [0] + [i + 1 for i, t in enumerate(select_items) if t.text == ',' and t.depth == 0]
+    for start in item_starts:
+        if start + 1 >= len(select_items):
+            return False
+        head, paren = select_items[start], select_items[start + 1]
+        if head.upper not in AGGREGATE_FUNCTIONS or paren.text != '(':
+            return False
+    return True
+
+
+def guard_sql(sql: str, max_rows: Optional[int], detect_truncation: bool = False) -> Tuple[str, List[str]]:
+    """
+    Check a generated query and bound the rows it can return.
+    
+    Only a single SELECT (optionally with CTEs) is accepted. Missing row limits
+    are injected as ``TOP (max_rows)`` (or ``OFFSET 0 ROWS FETCH NEXT`` for
+    UNION / EXCEPT / INTERSECT), and larger literal limits are tightened.
+    Queries that can only return one row (plain aggregates) are left alone, as
+    is ``TOP n PERCENT``, which the fetch ceiling still bounds.
+    
+    Args:
+        sql: Query text produced by the model or a pattern
+        max_rows: Largest row count the query may return (None only validates)
+        detect_truncation: Let the query return one row more than max_rows, so
+            the caller can tell the result was cut off; the rewrites still
+            report max_rows
+    
+    Returns:
+        (query to execute, list of human-readable rewrites applied)
+    
+    Raises:
+        SQLGuardError: If the query is empty, has several statements or is not read-only
+    """
+    rewrites = []
+    sql, had_comments = _strip_comments(sql)
+    if had_comments:
+        rewrites.append("Removed comments")
+    
+    tokens = tokenize(sql)
+    
+    # Exactly one statement; a trailing semicolon is dropped
+    statements = [[]]
+    for token in tokens:
+        if token.text == ';':
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    statements = [s for s in statements if s]
+    if not statements:
+        raise SQLGuardError("The query is empty")
+    if len(statements) > 1:
+        raise SQLGuardError("Only a single SQL statement is allowed")
+    tokens = statements[0]
+    
+    # (SELECT ...) is the SELECT itself
+    while tokens[0].text == '(' and _closing_paren(tokens, 0) == len(tokens) - 1:
+        tokens = tokens[1:-1]
+        if not tokens:
+            raise SQLGuardError("The query is empty")
+        for token in tokens:
+            token.depth -= 1
+    sql = sql[tokens[0].start:tokens[-1].end]
+    offset = tokens[0].start
+    for token in tokens:
+        token.start -= offset
+        token.end -= offset
+    
+    # Read-only SELECT only
+    # A set operation may start with a parenthesized SELECT
+    first = next((t for t in tokens if t.text != '('), tokens[0])
+    if first.upper not in ('SELECT', 'WITH'):
+        raise SQLGuardError(f"Only SELECT queries are allowed, not {first.text.upper()}")
+    for token in tokens:
+        if token.kind != 'word':
+            continue
+        if token.upper in FORBIDDEN_KEYWORDS:
+            raise SQLGuardError(f"The keyword {token.upper} is not allowed in a read-only query")
+        if token.upper.startswith(('XP_', 'SP_')):
+            raise SQLGuardError(f"Calling {token.text} is not allowed")
+    
+    if max_rows is None:
+        return sql, rewrites
+    limit = max_rows + 1 if detect_truncation else max_rows
+    
+    top_level = [t for t in tokens if t.depth == 0]
+    words = [t.upper for t in top_level]
+    has_group_by = any(
+        words[i] == 'GROUP' and words[i + 1] == 'BY' for i in range(len(words) - 1)
+    )
+    has_order_by = any(
+        words[i] == 'ORDER' and words[i + 1] == 'BY' for i in range(len(words) - 1)
+    )
+    selects = [i for i, t in enumerate(top_level) if t.upper == 'SELECT']
+    
+    edits = []
+    if 'FETCH' in words:
+        # OFFSET ... FETCH NEXT n ROWS ONLY: tighten n
+        fetch = tokens.index(top_level[words.index('FETCH')])
+        value, start, end = limit_value(tokens, fetch + 2)
+        if value > limit:
+            edits.append((start, end, str(limit)))
+            rewrites.append(f"Reduced FETCH NEXT {value} ROWS to the {max_rows}-row limit")
+    elif 'OFFSET' in words:
+        edits.append((len(sql), len(sql), f" FETCH NEXT {limit} ROWS ONLY"))
+        rewrites.append(f"Added FETCH NEXT to limit the result to {max_rows} rows")
+    elif SET_OPERATORS & set(words):
+        order = "" if has_order_by else " ORDER BY 1"
+        edits.append((len(sql), len(sql), f"{order} OFFSET 0 ROWS FETCH NEXT {limit} ROWS ONLY"))
+        rewrites.append(f"Added OFFSET/FETCH to limit the result to {max_rows} rows")
+    elif not selects:
+        raise SQLGuardError("Could not find the SELECT to limit")
+    else:
+        # Single SELECT: the last top-level SELECT follows any CTE definitions
+        i = selects[-1] + 1
+        if i < len(top_level) and top_level[i].upper in ('ALL', 'DISTINCT'):
+            i += 1
+        insert_at = top_level[i - 1].end
+        
+        if i < len(top_level) and top_level[i].upper == 'TOP':
+            value, start, end = limit_value(tokens, tokens.index(top_level[i]) + 1)
+            following = next((t for t in tokens if t.start >= end), None)
+            is_percent = following is not None and following.upper == 'PERCENT'
+            if value > limit and not is_percent:
+                edits.append((start, end, f"({limit})"))
+                rewrites.append(f"Reduced TOP ({value}) to the {max_rows}-row limit")
+        else:
+            from_index = next(
+                (j for j in range(i, len(top_level)) if top_level[j].upper == 'FROM'),
+                len(top_level)
+            )
+            select_items = [t for t in tokens if top_level[i - 1].end <= t.start and (
+                from_index == len(top_level) or t.start < top_level[from_index].start
+            )]
+            one_row = from_index == len(top_level) or _is_scalar_aggregate(select_items, has_group_by)
+            if not one_row:
+                edits.append((insert_at, insert_at, f" TOP ({limit})"))
+                rewrites.append(f"Added TOP to limit the result to {max_rows} rows")
+    
+    for start, end, replacement in sorted(edits, reverse=True):
+        sql = sql[:start] + replacement + sql[end:]
+    
+    return sql, rewrites
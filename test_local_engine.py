@@ -0,0 +1,64 @@
+"""
+Test script for the local read replica
+Checks that money and decimal results come back as the Decimal values Azure
+SQL returns. Loads database/northwind.sql; needs no database or Azure OpenAI
+settings.
+"""
+
+import decimal
+import os
+
+from local_engine import LocalEngine
+
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'northwind.sql')
+
+# (query, expected first row, expected column types)
+NUMERIC_CASES = [
+    # Whole money values are stored as integers by SQLite
+    ("SELECT SUM(UnitPrice) AS Total FROM Products WHERE ProductID IN (1, 2)",
+     (decimal.Decimal('37.0000'),), ['decimal']),
+    ("SELECT MAX(UnitPrice) FROM Products",
+     (decimal.Decimal('97.0000'),), ['decimal']),
+    ("SELECT UnitPrice * 2 AS Twice FROM Products WHERE ProductID = 1",
+     (decimal.Decimal('36.0000'),), ['decimal']),
+    
+    # Fractional results
+    ("SELECT AVG(UnitPrice) FROM Products WHERE ProductID IN (1, 2)",
+     (decimal.Decimal('18.5000'),), ['decimal']),
+    ("SELECT OrderID, SUM(UnitPrice * Quantity) AS Revenue FROM [Order Details] "
+     "WHERE OrderID = 10250 GROUP BY OrderID",
+     (10250, decimal.Decimal('967.2500')), ['int', 'decimal']),
+    
+    # Counts stay integers; a real column makes the result float, as in SQL Server
+    ("SELECT COUNT(UnitPrice) AS Priced FROM Products WHERE ProductID IN (1, 2)",
+     (2,), ['int']),
+    ("SELECT SUM(Discount) AS Discounts FROM [Order Details] WHERE OrderID = 10248",
+     (0.0,), ['float']),
+]
+
+
+def test_numeric_types():
+    """SUM, MAX, AVG and arithmetic over money columns return Decimal, whole or not."""
+    engine = LocalEngine(seed_file=SEED_FILE, refresh_interval=0)
+    engine.load()
+    try:
+        for query, expected_row, expected_types in NUMERIC_CASES:
+            result = engine.execute(query)
+            row = result['rows'][0]
+            ok = row == expected_row and result['types'] == expected_types
+            ok = ok and all(type(value) is type(expected) for value, expected in zip(row, expected_row))
+            print(f"{'✅' if ok else '❌'} {query}\n   -> {row} {result['types']}")
+            assert row == expected_row, f"expected {expected_row}"
+            assert result['types'] == expected_types, f"expected {expected_types}"
+            for value, expected in zip(row, expected_row):
+                assert type(value) is type(expected), f"{value!r} should be {type(expected).__name__}"
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing the local read replica")
+    print("=" * 60)
+    test_numeric_types()
+    print("\n✅ All local engine checks passed")
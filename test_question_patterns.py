@@ -0,0 +1,113 @@
+"""
+Test script for the question patterns
+Checks the SQL compiled for recurring question shapes, and that questions
+the patterns cannot express fall through to the LLM. Needs no database or
+Azure OpenAI settings.
+"""
+
+from question_patterns import PatternRegistry
+from schema_index import SchemaIndex
+
+
+def _column(name, type_, primary_key='NO'):
+    return {'name': name, 'type': type_, 'nullable': 'YES', 'primary_key': primary_key}
+
+
+SCHEMA = SchemaIndex(
+    {
+        'Customers': [
+            _column('CustomerID', 'nchar', 'YES'),
+            _column('CompanyName', 'nvarchar'),
+            _column('City', 'nvarchar'),
+            _column('Country', 'nvarchar'),
+        ],
+        'Products': [
+            _column('ProductID', 'int', 'YES'),
+            _column('ProductName', 'nvarchar'),
+            _column('UnitPrice', 'money'),
+            _column('UnitsInStock', 'smallint'),
+        ],
+    },
+    []
+)
+
+# (question, expected pattern, expected SQL)
+COMPILED_CASES = [
+    ("Top 5 products by unit price",
+     'top_n_by_column',
+     "SELECT TOP 5 [ProductName], [UnitPrice]\nFROM [Products]\nORDER BY [UnitPrice] DESC"),
+    ("How many customers are there?",
+     'count_rows',
+     "SELECT COUNT(*) AS [CustomerCount]\nFROM [Customers]"),
+    ("Show customers where city is London",
+     'where_column_equals',
+     "SELECT *\nFROM [Customers]\nWHERE [City] = N'London'"),
+    ("List products where unit price = 18",
+     'where_column_equals',
+     "SELECT *\nFROM [Products]\nWHERE [UnitPrice] = 18"),
+]
+
+# Questions that must be left to the LLM
+FALLBACK_QUESTIONS = [
+    # Compound conditions
+    "Show customers where city is London and country is UK",
+    # Comparisons phrased in words
+    "Show customers where city is not London",
+    "List products where unit price is over 20",
+    "List products where unit price is under 10",
+    "List products where unit price is above 50",
+    "List products where unit price is below 5",
+    "List products where unit price is greater than 20",
+    "List products where units in stock is less than 10",
+    "List products where units in stock is more than 100",
+    "List products where unit price is between 10 and 20",
+    "Show customers where company name is like 'A%'",
+    "Show customers where country is in ('UK', 'USA')",
+    # Comparison operators
+    "List products where unit price is > 20",
+    "List products where unit price = <5",
+    "List products where unit price is >= 20",
+    "Show customers where country is != UK",
+    "Show customers where country is <> UK",
+    # Numeric columns compared with words
+    "List products where unit price is cheap",
+    "List products where units in stock is zero",
+]
+
+
+def test_compiled_questions():
+    """Recurring question shapes compile to the expected SQL."""
+    registry = PatternRegistry()
+    for question, pattern, expected in COMPILED_CASES:
+        result = registry.compile(question, SCHEMA)
+        sql = result['sql'] if result else None
+        status = "✅" if result and result['pattern'] == pattern and sql == expected else "❌"
+        print(f"{status} {question}\n   -> {sql!r}")
+        assert result is not None, f"{question!r} should compile"
+        assert result['pattern'] == pattern
+        assert sql == expected, f"expected {expected!r}"
+
+
+def test_fallback_questions():
+    """Compound conditions, comparisons and non-numeric values for numeric columns fall through."""
+    registry = PatternRegistry()
+    for question in FALLBACK_QUESTIONS:
+        result = registry.compile(question, SCHEMA)
+        if result is None:
+            print(f"✅ Fell through: {question}")
+        else:
+            print(f"❌ Compiled {question!r}: {result['sql']!r}")
+            raise AssertionError(f"{question!r} should fall through to the LLM")
+    
+    stats = registry.stats()
+    assert stats['compiled'] == 0
+    assert stats['fallbacks'] == len(FALLBACK_QUESTIONS)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing the question patterns")
+    print("=" * 60)
+    test_compiled_questions()
+    test_fallback_questions()
+    print("\n✅ All question pattern checks passed")
@@ -0,0 +1,122 @@
+"""
+Test script for the SQL guard
+Checks row-limit injection and tightening and the rejection of anything but
+a single read-only SELECT. Needs no database or Azure OpenAI settings.
+"""
+
+from sql_guard import SQLGuardError, guard_sql
+
+MAX_ROWS = 1000
+
+# (query, expected query after the guard)
+LIMIT_CASES = [
+    # TOP injected after SELECT / DISTINCT, tightened, or kept when small enough
+    ("SELECT * FROM Products",
+     "SELECT TOP (1000) * FROM Products"),
+    ("SELECT DISTINCT Country FROM Customers",
+     "SELECT DISTINCT TOP (1000) Country FROM Customers"),
+    ("SELECT TOP 5000 * FROM Products",
+     "SELECT TOP (1000) * FROM Products"),
+    ("SELECT TOP (10) * FROM Products",
+     "SELECT TOP (10) * FROM Products"),
+    ("SELECT TOP 50 PERCENT * FROM Products",
+     "SELECT TOP 50 PERCENT * FROM Products"),
+    ("WITH c AS (SELECT * FROM Products) SELECT * FROM c",
+     "WITH c AS (SELECT * FROM Products) SELECT TOP (1000) * FROM c"),
+    
+    # OFFSET / FETCH completed or tightened; set operations get OFFSET / FETCH
+    ("SELECT * FROM Products ORDER BY ProductID OFFSET 10 ROWS",
+     "SELECT * FROM Products ORDER BY ProductID OFFSET 10 ROWS FETCH NEXT 1000 ROWS ONLY"),
+    ("SELECT * FROM Products ORDER BY ProductID OFFSET 0 ROWS FETCH NEXT 5000 ROWS ONLY",
+     "SELECT * FROM Products ORDER BY ProductID OFFSET 0 ROWS FETCH NEXT 1000 ROWS ONLY"),
+    ("SELECT City FROM Customers UNION SELECT City FROM Suppliers",
+     "SELECT City FROM Customers UNION SELECT City FROM Suppliers ORDER BY 1 OFFSET 0 ROWS FETCH NEXT 1000 ROWS ONLY"),
+    
+    # Plain aggregates return one row; window aggregates return one per row
+    ("SELECT COUNT(*) FROM Orders",
+     "SELECT COUNT(*) FROM Orders"),
+    ("SELECT MIN(UnitPrice), MAX(UnitPrice) FROM Products",
+     "SELECT MIN(UnitPrice), MAX(UnitPrice) FROM Products"),
+    ("SELECT CategoryID, COUNT(*) FROM Products GROUP BY CategoryID",
+     "SELECT TOP (1000) CategoryID, COUNT(*) FROM Products GROUP BY CategoryID"),
+    ("SELECT COUNT(*) OVER () FROM Orders",
+     "SELECT TOP (1000) COUNT(*) OVER () FROM Orders"),
+    ("SELECT SUM(Freight) OVER (PARTITION BY CustomerID) AS Total FROM Orders",
+     "SELECT TOP (1000) SUM(Freight) OVER (PARTITION BY CustomerID) AS Total FROM Orders"),
+    
+    # Parenthesized selects and subqueries
+    ("(SELECT * FROM Products)",
+     "SELECT TOP (1000) * FROM Products"),
+    ("(SELECT City FROM Customers) UNION (SELECT City FROM Suppliers)",
+     "(SELECT City FROM Customers) UNION (SELECT City FROM Suppliers) ORDER BY 1 OFFSET 0 ROWS FETCH NEXT 1000 ROWS ONLY"),
+    ("SELECT * FROM (SELECT TOP 5 * FROM Products) p",
+     "SELECT TOP (1000) * FROM (SELECT TOP 5 * FROM Products) p"),
+    ("SELECT (SELECT COUNT(*) FROM Orders) AS OrderCount",
+     "SELECT (SELECT COUNT(*) FROM Orders) AS OrderCount"),
+    
+    # Comments and a trailing semicolon are dropped
+    ("SELECT * FROM Products; -- all of them",
+     "SELECT TOP (1000) * FROM Products"),
+]
+
+REJECTED_QUERIES = [
+    "",
+    "SELECT * FROM Products; DROP TABLE Products",
+    "SELECT 1; SELECT 2",
+    "DELETE FROM Products",
+    "UPDATE Products SET UnitPrice = 0",
+    "(DELETE FROM Products)",
+    "WITH c AS (SELECT * FROM Products) DELETE FROM c",
+    "SELECT * INTO ProductsCopy FROM Products",
+    "SELECT * FROM OPENROWSET('SQLNCLI', 'server', 'SELECT 1')",
+    "EXEC xp_cmdshell 'dir'",
+    "SELECT * FROM Products WHERE 1 = 1; WAITFOR DELAY '00:00:10'",
+]
+
+
+def test_row_limits():
+    """Row limits are injected or tightened, and nothing else changes."""
+    for query, expected in LIMIT_CASES:
+        guarded, rewrites = guard_sql(query, MAX_ROWS)
+        status = "✅" if guarded == expected else "❌"
+        print(f"{status} {query}\n   -> {guarded}")
+        assert guarded == expected, f"expected {expected}"
+        assert bool(rewrites) == (guarded != query), rewrites
+
+
+def test_rejected_queries():
+    """Anything but a single read-only SELECT is refused."""
+    for query in REJECTED_QUERIES:
+        try:
+            guard_sql(query, MAX_ROWS)
+        except SQLGuardError as e:
+            print(f"✅ Rejected {query!r}: {e}")
+        else:
+            print(f"❌ Accepted {query!r}")
+            raise AssertionError(f"{query!r} should be rejected")
+
+
+def test_truncation_detection():
+    """With detect_truncation the query gets one extra row, but the notes give the configured limit."""
+    guarded, rewrites = guard_sql("SELECT * FROM Products", MAX_ROWS, detect_truncation=True)
+    print(f"🧪 {guarded} {rewrites}")
+    assert guarded == "SELECT TOP (1001) * FROM Products"
+    assert rewrites == ["Added TOP to limit the result to 1000 rows"]
+    
+    guarded, rewrites = guard_sql("SELECT TOP 5000 * FROM Products", MAX_ROWS, detect_truncation=True)
+    print(f"🧪 {guarded} {rewrites}")
+    assert guarded == "SELECT TOP (1001) * FROM Products"
+    assert rewrites == ["Reduced TOP (5000) to the 1000-row limit"]
+    
+    # Without a limit the query is only validated
+    assert guard_sql("SELECT * FROM Products", None) == ("SELECT * FROM Products", [])
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing the SQL guard")
+    print("=" * 60)
+    test_row_limits()
+    test_rejected_queries()
+    test_truncation_detection()
+    print("\n✅ All SQL guard checks passed")
@@ -0,0 +1,220 @@
+"""
+Shared Azure AD access tokens for database connections.
+The token is fetched once per process, cached, and refreshed on a background
+thread ahead of its expiry, so long-running workers keep connecting and
+queries never wait for the Azure CLI.
+"""
+
+import os
+import struct
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+from azure.identity import AzureCliCredential
+
+SQL_SCOPE = "https://database.windows.net/.default"
+
+
+def pack_token(token: str) -> bytes:
+    """Pack an access token the way the ODBC driver expects it (SQL_COPT_SS_ACCESS_TOKEN)."""
+    token_bytes = token.encode("utf-16-le")
+    return struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
+
+
+class TokenProvider:
+    """
+    Caches an access token and refreshes it before it expires.
+    
+    One refresh runs at a time: callers that find no usable token wait for the
+    fetch already in flight instead of starting their own. While the cached
+    token is still valid, get_token() returns it immediately and a background
+    thread refreshes it ``refresh_margin`` seconds before ``expires_on``.
+    Subscribers are called with each new packed token.
+    """
+    
+    def __init__(
+        self,
+        scope: str = SQL_SCOPE,
+        credential: Any = None,
+        refresh_margin: float = 300.0,
+        retry_interval: float = 30.0
+    ):
+        """
+        Initialize the provider (no token is fetched until it is needed).
+        
+        Args:
+            scope: Scope the token is requested for
+            credential: azure.identity credential (defaults to AzureCliCredential)
+            refresh_margin: Seconds before expiry the token is refreshed
+            retry_interval: Seconds between attempts after a failed refresh
+        """
+        self.scope = scope
+        self.credential = credential if credential is not None else AzureCliCredential()
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._packed = None
+        self._expires_on = 0.0
+        self._retry_at = 0.0
+        self._refreshing = False
+        self._stopped = False
+        self._subscribers: List[weakref.WeakMethod] = []
+        self._cond = threading.Condition()
+        self._thread = None
+        
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_refresh_ms = 0.0
+    
+    def _valid(self, now: float) -> bool:
+        return self._packed is not None and now < self._expires_on
+    
+    def get_token(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Return the packed token, fetching it only if there is no valid one.
+        
+        After a failed fetch, callers get None until ``retry_interval`` has
+        passed instead of starting another fetch.
+        
+        Args:
+            timeout: Seconds to wait for a fetch started by another caller
+        
+        Returns:
+            Packed token for the ODBC driver, or None if it could not be obtained
+        """
+        with self._cond:
+            if self._valid(time.time()):
+                return self._packed
+            if self._refreshing:
+                self._cond.wait_for(lambda: not self._refreshing, timeout)
+                return self._packed if self._valid(time.time()) else None
+            if time.time() < self._retry_at:
+                # A fetch just failed; the background thread retries it
+                return None
+            self._refreshing = True
+        self._refresh()
+        with self._cond:
+            return self._packed if self._valid(time.time()) else None
+    
+    def _refresh(self):
+        """Fetch a new token and hand it to the subscribers. Caller must have set _refreshing."""
+        started = time.perf_counter()
+        packed = None
+        try:
+            token = self.credential.get_token(self.scope)
+            packed = pack_token(token.token)
+        except Exception as e:
+            print(f"⚠️  Could not get Azure AD token: {e}")
+            with self._cond:
+                self.failures += 1
+                self.last_error = str(e)
+                self._retry_at = time.time() + self.retry_interval
+        else:
+            with self._cond:
+                self._packed = packed
+                self._expires_on = float(token.expires_on)
+                # Space refreshes out even if the token lives shorter than the margin
+                self._retry_at = time.time() + self.retry_interval
+                self.refreshes += 1
+                self.last_error = None
+                self.last_refresh_ms = (time.perf_counter() - started) * 1000
+        finally:
+            with self._cond:
+                self._refreshing = False
+                self._start_thread()
+                self._cond.notify_all()
+        if packed is not None:
+            self._notify(packed)
+    
+    def _notify(self, packed: bytes):
+        with self._cond:
+            callbacks = [ref() for ref in self._subscribers]
+            self._subscribers = [ref for ref, callback in zip(self._subscribers, callbacks) if callback is not None]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(packed)
+            except Exception as e:
+                print(f"⚠️  Error applying refreshed Azure AD token: {e}")
+    
+    def subscribe(self, callback: Callable[[bytes], None]):
+        """
+        Call a bound method with every refreshed token.
+        
+        Only a weak reference is kept, so subscribing does not keep the
+        method's object alive.
+        """
+        with self._cond:
+            self._subscribers.append(weakref.WeakMethod(callback))
+    
+    def _next_refresh(self) -> float:
+        """Time of the next background refresh. Caller must hold the lock."""
+        if self._valid(time.time()):
+            return max(self._expires_on - self.refresh_margin, self._retry_at)
+        return self._retry_at
+    
+    def _start_thread(self):
+        """Start the background refresher once. Caller must hold the lock."""
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='aad-token-refresh', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Background loop refreshing the token ahead of its expiry."""
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    delay = self._next_refresh() - time.time()
+                    if delay <= 0 and not self._refreshing:
+                        break
+                    self._cond.wait(timeout=delay if delay > 0 else None)
+                if self._stopped:
+                    return
+                self._refreshing = True
+            self._refresh()
+    
+    def stop(self):
+        """Stop the background refresher."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the token's remaining lifetime and refresh counts."""
+        with self._cond:
+            now = time.time()
+            return {
+                'valid': self._valid(now),
+                'expires_in_seconds': max(self._expires_on - now, 0.0) if self._packed else None,
+                'refresh_in_seconds': max(self._next_refresh() - now, 0.0) if self._thread else None,
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'last_refresh_ms': self.last_refresh_ms,
+                'last_error': self.last_error
+            }
+
+
+_providers: Dict[str, TokenProvider] = {}
+_providers_pid = None
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(scope: str = SQL_SCOPE, refresh_margin: float = 300.0) -> TokenProvider:
+    """
+    Get the process-wide provider for a scope, so every agent shares one token.
+    
+    A forked worker gets its own provider, since the parent's refresh thread
+    does not survive the fork.
+    """
+    global _providers_pid
+    with _providers_lock:
+        if _providers_pid != os.getpid():
+            _providers.clear()
+            _providers_pid = os.getpid()
+        provider = _providers.get(scope)
+        if provider is None:
+            provider = _providers[scope] = TokenProvider(scope, refresh_margin=refresh_margin)
+        return provider